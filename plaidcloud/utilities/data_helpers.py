@@ -9,10 +9,14 @@ import math
 import platform
 import locale
 import functools
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
-from pandas.api.types import is_numeric_dtype
+from pandas.api.types import (
+    is_bool_dtype, is_complex_dtype, is_float_dtype, is_integer_dtype, is_numeric_dtype, is_signed_integer_dtype,
+    is_string_dtype, is_unsigned_integer_dtype,
+)
 import texttable
 
 # Note: one function imports from IPython
@@ -79,27 +83,129 @@ def suppress_non_unicode(dirty_string):
     return '' .join([i if ord(i) < 128 else ' ' for i in dirty_string])
 
 
-def clean_frame(df):
+def clean_frame(df, max_workers=None):
+    """Cleans every text (object) column of `df` in place, for frames about to be written out as plain text
+
+    Non-ASCII characters are dropped and a newline just before a double quote is removed.  Bytes are read as
+    ASCII, anything else that is not text is written as its `str`, and nulls become ' '.
+
+    Each column is cleaned as a whole, and a column of repeated labels only cleans each distinct label once.
+
+    Args:
+        df (pandas.DataFrame): The frame to clean
+        max_workers (int, optional): If greater than 1, clean up to this many columns at once
+
+    Returns:
+        pandas.DataFrame: `df`
+
+    Examples:
+        >>> df = pd.DataFrame({'NAME': ['café', 'a\\n"b"', None], 'AMOUNT': [1, 2, 3]})
+        >>> clean_frame(df)['NAME'].tolist()
+        ['caf', 'a"b"', ' ']
     """
-    for each column in the frame with dtype==object,
-    return the list of decoded cell in the Series instead
-    This presumes any type of object is intended to be a string.  Be careful.
-    This feels inefficient as hell, but it freaking works.
+    columns = [col for col in df if str(df[col].dtype) == 'object']
+    if max_workers and max_workers > 1 and len(columns) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            cleaned = list(executor.map(_clean_text_column, [df[col] for col in columns]))
+    else:
+        cleaned = [_clean_text_column(df[col]) for col in columns]
+
+    for col, values in zip(columns, cleaned):
+        df[col] = values
+
+    return df
+
+
+def _clean_text_column(column):
+    """Cleans one object column for `clean_frame`"""
+    inferred = pd.api.types.infer_dtype(column, skipna=True)
+    if inferred in ('string', 'bytes'):
+        # Text columns are mostly repeated labels, so only their distinct values are cleaned
+        codes, values = pd.factorize(column)
+    else:
+        values = column.to_numpy(dtype=object)
+        codes = np.arange(len(values))
+        codes[pd.isna(values)] = -1
+
+    if inferred != 'string':
+        values = [
+            value.decode('ascii', 'ignore') if isinstance(value, bytes) else str(value)
+            for value in values
+        ]
+    values = np.array(values, dtype=object)
+
+    dirty = ~np.fromiter(map(str.isascii, values), dtype=bool, count=len(values))
+    values[dirty] = [value.encode('ascii', 'ignore').decode('ascii') for value in values[dirty]]
+    quoted = np.fromiter(('\n"' in value for value in values), dtype=bool, count=len(values))
+    values[quoted] = [value.replace('\n"', '"') for value in values[quoted]]
+
+    # Nulls (code -1) pick the blank appended at the end
+    return pd.Series(np.append(values, ' ').astype(object)[codes], index=column.index)
+
+
+def categorize(df, columns=None, max_unique_ratio=0.5):
+    """Converts the low-cardinality text columns of `df` to pandas categoricals, in place
+
+    Master data keys such as entity, account, currency or period repeat a handful of values over many rows, and
+    as categoricals they are stored as small integer codes, which also makes grouping and joining on them cheaper.
+    Columns that cannot be sorted or hashed are left alone.
+
+    Args:
+        df (pandas.DataFrame): The frame to convert
+        columns (list, optional): The columns to convert, whatever their cardinality. Defaults to every object
+            column with at most `max_unique_ratio` distinct values per row
+        max_unique_ratio (float, optional): The most distinct values per row for a column to be converted
+
+    Returns:
+        pandas.DataFrame: `df`
+
+    Examples:
+        >>> df = pd.DataFrame({'ENTITY': ['E2', 'E1', 'E2', None], 'MEMO': ['a', 'b', 'c', 'd'], 'AMOUNT': [1, 2, 3, 4]})
+        >>> categorize(df).dtypes
+        ENTITY    category
+        MEMO        object
+        AMOUNT       int64
+        dtype: object
+        >>> list(df['ENTITY'].cat.categories)
+        ['E1', 'E2']
     """
+    if columns is None:
+        columns = [col for col in df.columns if df[col].dtype == np.dtype('object')]
+        limit = max_unique_ratio * len(df)
+    else:
+        limit = None
 
-    def clean_ascii(cell):
+    for col in columns:
         try:
-            return ''.join([c.decode('unicode_escape').encode('ascii', 'ignore') for c in cell]).replace('\n"', '"')
-        except Exception:
-            return ' '
-
-    for col in df:
-        if str(df[col].dtype) == 'object':
-            df[col] = list(map(clean_ascii, df[col]))
+            codes, uniques = pd.factorize(df[col], sort=True)
+        except TypeError:
+            continue
+        if limit is None or len(uniques) <= limit:
+            df[col] = pd.Categorical.from_codes(codes, categories=uniques)
 
     return df
 
 
+def storage_dtype(dtype):
+    """The dtype of the values of a column, which for a categorical is the dtype of its categories
+
+    Args:
+        dtype (numpy.dtype or pandas.api.extensions.ExtensionDtype): A column dtype
+
+    Returns:
+        numpy.dtype or pandas.api.extensions.ExtensionDtype: The dtype its values are stored as elsewhere
+
+    Examples:
+        >>> storage_dtype(pd.CategoricalDtype(['E1', 'E2']))
+        dtype('O')
+        >>> storage_dtype(np.dtype('int64'))
+        dtype('int64')
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        return dtype.categories.dtype
+    return dtype
+
+
 def jupyter_table(input):
     """
     Produce a pretty text table that will show up as such in Jupyter.
@@ -296,6 +402,177 @@ def cast_as_float(input_val):
             return 0.0
 
 
+def _cast_series(values, cast, fast_cast):
+    """Casts a whole column with `fast_cast`, falling back to `list(map(cast, ...))` where it gives up
+
+    Args:
+        values (pandas.Series, numpy.ndarray or list): The values to cast
+        cast (function): The scalar cast, e.g. `cast_as_float`
+        fast_cast (function): Takes a Series and returns the cast Series, or None to use `cast` on every value
+
+    Returns:
+        pandas.Series or numpy.ndarray: A Series, keeping the index and name, if `values` is one, else an array
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Cast each category once, nulls (code -1) picking the cast of a null appended at the end
+        categories = _cast_series(np.asarray(series.cat.categories, dtype=object), cast, fast_cast)
+        result = pd.Series(np.append(categories, cast(None))[series.cat.codes.to_numpy()], index=series.index)
+    else:
+        result = fast_cast(series)
+    if result is None:
+        result = pd.Series(list(map(cast, series)), index=series.index)
+    result.name = series.name
+
+    if isinstance(values, pd.Series):
+        return result
+    return result.to_numpy()
+
+
+def _is_plain_numeric(dtype):
+    """Whether a column of `dtype` holds only real numbers, bools or nulls"""
+    return is_numeric_dtype(dtype) and not is_complex_dtype(dtype)
+
+
+def cast_as_str_series(values):
+    """Column-at-a-time `cast_as_str`
+
+    Nulls become ' ' and everything else its `str`, exactly as `list(map(cast_as_str, values))` would, but text,
+    number and categorical columns are cast without calling back into Python for each value.
+
+    Args:
+        values (pandas.Series, numpy.ndarray or list): The values to cast
+
+    Returns:
+        pandas.Series or numpy.ndarray: Strings, as a Series if `values` is one
+
+    Examples:
+        >>> cast_as_str_series(pd.Series(['a', None, 3.5, np.nan], dtype=object)).tolist()
+        ['a', ' ', '3.5', ' ']
+        >>> cast_as_str_series(pd.Series([1.0, np.nan, 2.5])).tolist()
+        ['1.0', ' ', '2.5']
+        >>> cast_as_str_series(pd.Series(['E1', None, 'E1'], dtype='category')).tolist()
+        ['E1', ' ', 'E1']
+    """
+    def fast_cast(series):
+        if _is_plain_numeric(series.dtype):
+            if is_float_dtype(series.dtype):
+                # Iterating smaller floats yields Python floats, so they print at double precision
+                series = series.astype(np.float64)
+            text = series.astype(str)
+        elif series.dtype == np.dtype(object) or is_string_dtype(series.dtype):
+            inferred = pd.api.types.infer_dtype(series, skipna=True)
+            if inferred in ('string', 'empty'):
+                text = series.astype(object)
+            elif inferred in ('integer', 'floating', 'mixed-integer-float', 'boolean', 'decimal'):
+                text = series.astype(str)
+            else:
+                return None
+        else:
+            return None
+        return text.astype(object).where(series.notna(), ' ')
+
+    return _cast_series(values, cast_as_str, fast_cast)
+
+
+def cast_as_int_series(values):
+    """Column-at-a-time `cast_as_int`
+
+    Nulls and text that is not a whole number become 0, and numbers are truncated, exactly as
+    `list(map(cast_as_int, values))` would.
+
+    Args:
+        values (pandas.Series, numpy.ndarray or list): The values to cast
+
+    Returns:
+        pandas.Series or numpy.ndarray: int64 values, as a Series if `values` is one
+
+    Examples:
+        >>> cast_as_int_series(pd.Series(['3', ' 4 ', '3.5', 'Three', None])).tolist()
+        [3, 4, 0, 0, 0]
+        >>> cast_as_int_series(np.array([3.55, np.nan, -2.5]))
+        array([ 3,  0, -2])
+    """
+    def fast_cast(series):
+        if is_bool_dtype(series.dtype):
+            return series.fillna(False).astype(np.int64)
+        if is_integer_dtype(series.dtype):
+            if is_unsigned_integer_dtype(series.dtype) and len(series) and series.max() >= 2 ** 63:
+                return None
+            return series.fillna(0).astype(np.int64)
+        if is_float_dtype(series.dtype):
+            numbers = series.fillna(0.0).to_numpy(dtype=np.float64)
+            # Infinities and anything past int64 go through `int`, to fail or give a Python int as before
+            if not (np.abs(numbers) < 2.0 ** 63).all():
+                return None
+            return pd.Series(np.trunc(numbers).astype(np.int64), index=series.index)
+        if series.dtype == np.dtype(object) or is_string_dtype(series.dtype):
+            inferred = pd.api.types.infer_dtype(series, skipna=True)
+            if inferred == 'empty':
+                return pd.Series(0, index=series.index, dtype=np.int64)
+            if inferred == 'string':
+                text = series.astype(object)
+                whole = text.str.fullmatch(r'\s*[+-]?\d+\s*', na=False).to_numpy(dtype=bool)
+                # `int` also reads digits grouped with underscores
+                if text[~whole].str.contains('_', regex=False, na=False).any():
+                    return None
+                numbers = pd.to_numeric(text[whole], errors='coerce')
+                if not is_signed_integer_dtype(numbers.dtype):
+                    return None
+                result = np.zeros(len(series), dtype=np.int64)
+                result[whole] = numbers.to_numpy()
+                return pd.Series(result, index=series.index)
+            if inferred in ('integer', 'floating', 'mixed-integer-float', 'boolean', 'decimal'):
+                numbers = pd.to_numeric(series, errors='coerce')
+                if _is_plain_numeric(numbers.dtype):
+                    return fast_cast(numbers)
+        return None
+
+    return _cast_series(values, cast_as_int, fast_cast)
+
+
+def cast_as_float_series(values):
+    """Column-at-a-time `cast_as_float`
+
+    Nulls and values that are not numbers become 0.0, exactly as `list(map(cast_as_float, values))` would. Text is
+    parsed with `pandas.to_numeric`, and only the values it cannot read are handed to `cast_as_float`.
+
+    Args:
+        values (pandas.Series, numpy.ndarray or list): The values to cast
+
+    Returns:
+        pandas.Series or numpy.ndarray: float64 values, as a Series if `values` is one
+
+    Examples:
+        >>> cast_as_float_series(pd.Series(['3', 3.55, 'Three', None])).tolist()
+        [3.0, 3.55, 0.0, 0.0]
+        >>> cast_as_float_series(np.array([1, 2]))
+        array([1., 2.])
+    """
+    def fast_cast(series):
+        if _is_plain_numeric(series.dtype):
+            return series.astype(np.float64).fillna(0.0)
+        if series.dtype == np.dtype(object) or is_string_dtype(series.dtype):
+            result = pd.to_numeric(series, errors='coerce')
+            if not _is_plain_numeric(result.dtype):
+                return None
+            result = result.astype(np.float64)
+            result[series.isna().to_numpy()] = 0.0
+            # Whatever `pandas.to_numeric` could not read goes through `cast_as_float`, once per distinct value
+            unread = result.isna().to_numpy()
+            if unread.any():
+                try:
+                    codes, uniques = pd.factorize(series[unread])
+                except TypeError:
+                    result[unread] = list(map(cast_as_float, series[unread]))
+                else:
+                    result[unread] = np.array(list(map(cast_as_float, uniques)), dtype=np.float64)[codes]
+            return result
+        return None
+
+    return _cast_series(values, cast_as_float, fast_cast)
+
+
 def num(num):
     """Make numbers pretty with comma separators."""
     if math.isnan(num):
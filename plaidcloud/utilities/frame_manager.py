@@ -2,13 +2,19 @@
 # coding=utf-8
 # vim: set filetype=python:
 
+import ast
+import io
+import operator
 import os
 import posixpath
 import sys
 import math
+import tempfile
 import datetime
 import csv
-from functools import wraps
+import tokenize
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, wraps
 from io import StringIO, BytesIO
 import traceback
 
@@ -32,6 +38,7 @@ __license__ = 'Apache 2.0'
 
 
 CSV_TYPE_DELIMITER = '::'
+TYPED_FEATHER_METADATA = b'plaidcloud.types'
 
 
 class ContainerLogger(object):
@@ -128,7 +135,7 @@ def sql_from_dtype(dtype):
         'macaddr': 'text',
     }
 
-    dtype = str(dtype).lower()
+    dtype = str(dh.storage_dtype(dtype)).lower()
     if dtype.startswith('num'):
         dtype = 'numeric'
     elif 'char' in dtype:
@@ -168,6 +175,43 @@ def save_typed_psv(df, outfile, sep='|', **kwargs):
     df.to_csv(outfile, header=header, index=False, sep=sep)
 
 
+def save_typed_feather(df, outfile, compression='uncompressed'):
+    """Saves a dataframe as a Feather file, with the analyze compatible sql
+    type of each column in the schema metadata, as in a typed psv header.
+
+    Unlike a typed psv, every dtype (including categoricals) comes back as it
+    was saved, and the file does not need to be parsed to be read.
+
+    Args:
+        df (`pandas.DataFrame`): The dataframe to save
+        outfile (str): The path to save the output file to
+        compression (str, optional): Feather compression. Left uncompressed by
+            default, so `load_typed_feather` can memory-map the file
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError as exc:
+        raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Object columns mixing text with other values are saved as text, as they would be in a typed psv
+        df = df.copy(deep=False)
+        for col in df.columns[df.dtypes == np.dtype(object)]:
+            if pd.api.types.infer_dtype(df[col], skipna=True) in ('mixed', 'mixed-integer'):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        TYPED_FEATHER_METADATA: json.dumps({
+            str(name): sql_from_dtype(dtype) for name, dtype in df.dtypes.items()
+        }),
+    })
+    feather.write_feather(table, outfile, compression=compression)
+
+
 def list_of_dicts_to_typed_psv(lod, outfile, types, fieldnames=None, sep='|'):
     """ Saves a list of dicts as a typed psv. Needs a dict of sql types. If
     provided, fieldnames will specify the column order.
@@ -232,7 +276,7 @@ def get_project_variables(token, uri, project_id):
     return {pv['id']: pv['value'] for pv in project_vars}
 
 
-def download(tables, configuration=None, retries=5, conn=None, clean=False, **kwargs):
+def download(tables, configuration=None, retries=5, conn=None, clean=False, max_workers=None, **kwargs):
     """This replaces the old get_tables() that was client-specific.
     It opens a connection to Analyze and then
     accepts a set of tables and saves them off to a local location.
@@ -245,6 +289,8 @@ def download(tables, configuration=None, retries=5, conn=None, clean=False, **kw
         or local dev machine equiv.  Would typically originate from a local config.
         local_storage_path (str): local path where files should be saved.  Would typically originate
         from a local config.
+        max_workers (int, optional): If greater than 1, download up to this many tables at once
+        on a thread pool. Each table still gets its own retries, and results keep the order of `tables`.
         **kwargs:
             config (dict) contains a dict of config settings
             token (str) simpleRFC authorization token
@@ -275,94 +321,109 @@ def download(tables, configuration=None, retries=5, conn=None, clean=False, **kw
     except:
         project_id = conn.project_id
 
-    dfs = []
+    def fetch(table):
+        return _download_table(table, conn, project_id, retries, clean)
 
-    for table in tables:
-        table_path = table.get('table_name')
-        query = table.get('query')
-        table_obj = table.get('table_object')
+    if max_workers and max_workers > 1 and len(tables) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(fetch, tables))
 
-        df = None  # Initial value
-        # wipe this out each time through
-        clean_df = pd.DataFrame()
+    return [fetch(table) for table in tables]
 
-        logger.debug("Attempting to download {0}...".format(table_path))
 
-        tries = 1
-        if table_obj is not None:
-            # RPC table object exists; proceed to use it to fetch data
-            while tries <= retries:
-                if query is None:
-                    # no query passed. fetch whole table
-                    df = conn.get_dataframe(table_obj, clean=clean)
-                    if isinstance(df, pd.DataFrame):
-                        logger.debug("Downloaded {0}...".format(table_path))
-                        break
-                elif isinstance(query, str):
-                    # query object passed in.  execute it
-                    try:
-                        df = conn.get_dataframe_by_querystring(query)
-                    except Exception as e:
-                        logger.exception("Attempt {0}: Failed to download {1}: {2}".format(tries, table_path, e))
-                    else:
-                        if isinstance(df, pd.DataFrame):
-                            logger.debug("Downloaded {0}...".format(table_path))
-                            break
-                else:
-                    # query object passed in.  execute it
-                    try:
-                        df = conn.get_dataframe_by_query(query)
-                    except Exception as e:
-                        logger.exception("Attempt {0}: Failed to download {1}: {2}".format(tries, table_path, e))
-                    else:
-                        if isinstance(df, pd.DataFrame):
-                            logger.debug("Downloaded {0}...".format(table_path))
-                            break
-                tries += 1
+def _download_table(table, conn, project_id, retries=5, clean=False):
+    """Downloads a single table for `download`, retrying up to `retries` times.
 
-            columns = table_obj.cols()
-            if columns:
+    Returns:
+        dict: {'df': the downloaded frame, 'name': the table path}
+    """
+    table_path = table.get('table_name')
+    query = table.get('query')
+    table_obj = table.get('table_object')
+
+    df = None  # Initial value
+    clean_df = pd.DataFrame()
+
+    logger.debug("Attempting to download {0}...".format(table_path))
+
+    tries = 1
+    if table_obj is not None:
+        # RPC table object exists; proceed to use it to fetch data
+        while tries <= retries:
+            if query is None:
+                # no query passed. fetch whole table
+                df = conn.get_dataframe(table_obj, clean=clean)
                 if isinstance(df, pd.DataFrame):
-                    cols = [c['id'] for c in columns if c['id'] in df.columns.tolist()]
-                    df = df[cols]  # this ensures that the column order is as expected
-                else:
-                    cols = [c['id'] for c in columns]
-                    df = pd.DataFrame(columns=cols)  # create empty dataframe with expected metadata/shape
-        else:
-            if not table_path.startswith('/'):
-                table_path = '/{}'.format(table_path)
-            table_result = None
-            while not table_result and tries <= retries:
-                tries += 1
-                try:
-                    table_result = conn.analyze.table.table(project_id=project_id, table_path=table_path)
                     logger.debug("Downloaded {0}...".format(table_path))
                     break
+            elif isinstance(query, str):
+                # query object passed in.  execute it
+                try:
+                    df = conn.get_dataframe_by_querystring(query)
                 except Exception as e:
                     logger.exception("Attempt {0}: Failed to download {1}: {2}".format(tries, table_path, e))
+                else:
+                    if isinstance(df, pd.DataFrame):
+                        logger.debug("Downloaded {0}...".format(table_path))
+                        break
+            else:
+                # query object passed in.  execute it
+                try:
+                    df = conn.get_dataframe_by_query(query)
+                except Exception as e:
+                    logger.exception("Attempt {0}: Failed to download {1}: {2}".format(tries, table_path, e))
+                else:
+                    if isinstance(df, pd.DataFrame):
+                        logger.debug("Downloaded {0}...".format(table_path))
+                        break
+            tries += 1
 
-            df = table_result_to_df(table_result or pd.DataFrame())
-
-        if not isinstance(df, pd.DataFrame):
-            logger.exception('Table {0} failed to download!'.format(table_path))
-        elif len(df.columns) == 0:
-            logger.exception('Table {0} downloaded 0 records!'.format(table_path))
-        else:
-            if clean and query:
-                # Use the old cleaning process for things other than the full query.
-                clean_df = dh.clean_frame(df)
+        columns = table_obj.cols()
+        if columns:
+            if isinstance(df, pd.DataFrame):
+                cols = [c['id'] for c in columns if c['id'] in df.columns.tolist()]
+                df = df[cols]  # this ensures that the column order is as expected
             else:
-                clean_df = df
+                cols = [c['id'] for c in columns]
+                df = pd.DataFrame(columns=cols)  # create empty dataframe with expected metadata/shape
+    else:
+        if not table_path.startswith('/'):
+            table_path = '/{}'.format(table_path)
+        table_result = None
+        while not table_result and tries <= retries:
+            tries += 1
+            try:
+                table_result = conn.analyze.table.table(project_id=project_id, table_path=table_path)
+                logger.debug("Downloaded {0}...".format(table_path))
+                break
+            except Exception as e:
+                logger.exception("Attempt {0}: Failed to download {1}: {2}".format(tries, table_path, e))
 
-        dfs.append({'df': clean_df, 'name': table_path})
+        df = table_result_to_df(table_result or pd.DataFrame())
 
-    return dfs
+    if not isinstance(df, pd.DataFrame):
+        logger.exception('Table {0} failed to download!'.format(table_path))
+    elif len(df.columns) == 0:
+        logger.exception('Table {0} downloaded 0 records!'.format(table_path))
+    else:
+        if clean and query:
+            # Use the old cleaning process for things other than the full query.
+            clean_df = dh.clean_frame(df)
+        else:
+            clean_df = df
 
+    return {'df': clean_df, 'name': table_path}
 
-def load(source_tables, fetch=True, cache_locally=False, configuration=None, conn=None, clean=False):
+
+def load(source_tables, fetch=True, cache_locally=False, configuration=None, conn=None, clean=False, max_workers=None,
+         categorical=False, cache_format='psv'):
     """Load frame(s) from requested source, returning a list of dicts
 
     If local, will load from the typed_psv.  If Analyze, then will load the analyze table.
+    `max_workers` is passed to `download` to fetch several tables at once.
+    With `categorical`, low-cardinality text columns are loaded as pandas categoricals (see `dh.categorize`).
+    With `cache_format='feather'`, local copies are saved and loaded with `save_typed_feather` and
+    `load_typed_feather` instead of as typed psvs, keeping their dtypes and memory-mapping them when read.
     """
     return_type = None
     if type(source_tables) == list:
@@ -406,22 +467,30 @@ def load(source_tables, fetch=True, cache_locally=False, configuration=None, con
             if s.get('table_object') == None:
                 s['table_object'] = Table(conn, s.get('table_name'))
 
-        downloads = download(source_tables, configuration=configuration, conn=conn, clean=clean)
+        downloads = download(source_tables, configuration=configuration, conn=conn, clean=clean, max_workers=max_workers)
 
         for d in downloads:
             df = d.get('df')
-            name_of_df = '{0}.psv'.format(d.get('name'))
+            if categorical and isinstance(df, pd.DataFrame):
+                dh.categorize(df)
+            name_of_df = '{0}.{1}'.format(d.get('name'), cache_format)
             if name_of_df.startswith('/'):
                 name_of_df = name_of_df[1:]
             if cache_locally is True:
-                with open(os.path.join(configuration['LOCAL_STORAGE'], name_of_df), 'w') as f:
-                    save_typed_psv(df, f)
+                if cache_format == 'feather':
+                    save_typed_feather(df, os.path.join(configuration['LOCAL_STORAGE'], name_of_df))
+                else:
+                    with open(os.path.join(configuration['LOCAL_STORAGE'], name_of_df), 'w') as f:
+                        save_typed_psv(df, f)
             dfs.append(df)
     else:
         for s in source_tables:
-            source_table = '{0}.psv'.format(s.get('table_name'))
+            source_table = '{0}.{1}'.format(s.get('table_name'), cache_format)
             source_path = os.path.join(configuration['LOCAL_STORAGE'], source_table)
-            df = load_typed_psv(source_path)
+            if cache_format == 'feather':
+                df = load_typed_feather(source_path, categorical=categorical)
+            else:
+                df = load_typed_psv(source_path, categorical=categorical)
             dfs.append(df)
 
     if return_type == 'dataframe':
@@ -549,22 +618,23 @@ def converter_from_sql(sql):
         #'numeric': dh.cast_as_float,
         'numeric': sturdy_cast_as_float,
         'currency': sturdy_cast_as_float,
-        'timestamp': pd.datetime,
-        'interval': pd.datetime,
-        'date': pd.datetime,
-        'time': pd.datetime,
+        'timestamp': datetime.datetime,
+        'interval': datetime.datetime,
+        'date': datetime.datetime,
+        'time': datetime.datetime,
     }
 
     return mapping.get(str(sql).lower(), str(sql).lower())
 
 
-def load_typed_psv(infile, sep='|', **kwargs):
+def load_typed_psv(infile, sep='|', categorical=False, **kwargs):
     """ Loads a typed psv into a pandas dataframe. If the psv isn't typed,
     loads it anyway.
 
     Args:
         infile (str): The path to the input file
         sep (str, optional): The separator used in the input file
+        categorical (bool, optional): Load low-cardinality text columns as pandas categoricals
     """
 
     #TODO: for now we just ignore extra kwargs - we accept them to make it a
@@ -673,6 +743,8 @@ def load_typed_psv(infile, sep='|', **kwargs):
             #    Mercy.  This has been a pain.
             #    I guess if it was easy, Pandas wouldn't support the ability to send in your own converters.
             pass
+        if categorical:
+            dh.categorize(df)
         return df
 
 
@@ -682,11 +754,57 @@ def load_typed_psv(infile, sep='|', **kwargs):
             #Otherwise leave it open, since this function didn't open it.
 
 
-def table_result_to_df(result):
+def load_typed_feather(infile, categorical=False):
+    """Loads a Feather file saved by `save_typed_feather` into a pandas dataframe.
+    The file is memory-mapped rather than read into memory first.
+
+    Args:
+        infile (str): The path to the input file
+        categorical (bool, optional): Also load low-cardinality text columns as pandas categoricals
+
+    Returns:
+        `pandas.DataFrame`: The saved dataframe
+    """
+    try:
+        import pyarrow.feather as feather
+    except ImportError as exc:
+        raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+    if not os.path.exists(infile):
+        logger.exception('File does not exist: {0}'.format(infile))
+        return False
+
+    df = feather.read_table(infile, memory_map=True).to_pandas()
+    if categorical:
+        dh.categorize(df)
+    return df
+
+
+def typed_feather_types(infile):
+    """Gets the analyze sql type of each column of a file saved by `save_typed_feather`
+
+    Args:
+        infile (str): The path to the input file
+
+    Returns:
+        dict: The sql type of each column, by column name
+    """
+    try:
+        import pyarrow as pa
+    except ImportError as exc:
+        raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+    with pa.memory_map(infile) as source:
+        schema = pa.ipc.open_file(source).schema
+    return json.loads(schema.metadata[TYPED_FEATHER_METADATA])
+
+
+def table_result_to_df(result, categorical=False):
     """Converts a SQL result to a pandas dataframe
 
     Args:
         result (dict): The result of a database query
+        categorical (bool, optional): Return low-cardinality text columns as pandas categoricals
 
     Returns:
         `pandas.DataFrame`: A  dataframe representation of `result`
@@ -715,18 +833,21 @@ def table_result_to_df(result):
         typed_df = df
         for col in typed_df.columns:
             if dtypes[col] == 'object':
-                typed_df[col] = list(map(dh.cast_as_str, typed_df[col]))
+                typed_df[col] = dh.cast_as_str_series(typed_df[col])
             elif dtypes[col].startswith('float'):
-                typed_df[col] = list(map(dh.cast_as_float, typed_df[col]))
+                typed_df[col] = dh.cast_as_float_series(typed_df[col])
             elif dtypes[col].startswith('int'): #detect any flavor of int and cast it as int.
-                typed_df[col] = list(map(dh.cast_as_int, typed_df[col]))
+                typed_df[col] = dh.cast_as_int_series(typed_df[col])
 
+    if categorical:
+        dh.categorize(typed_df)
     return typed_df
 
 
 def dwim_save(df, name, localdir='/tmp', lvl='model', extension='txt', sep='|', **kwargs):
     """If we're on an app server, saves a dataframe as an analyze table.
-    Otherwise saves it as a typed psv in localdir.
+    Otherwise saves it as a typed psv in localdir, or as a typed feather file
+    (see `save_typed_feather`) if `extension` is 'feather'.
 
     Args:
         df (`pandas.DataFrame`): The dataframe to save
@@ -767,12 +888,16 @@ def dwim_save(df, name, localdir='/tmp', lvl='model', extension='txt', sep='|',
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
-        save_typed_psv(df, path, sep)
+        if extension == 'feather':
+            save_typed_feather(df, path)
+        else:
+            save_typed_psv(df, path, sep)
 
 
 def dwim_load(name, localdir='/tmp', lvl='model', extension='txt', sep='|', **kwargs):
     """If we're on an app server, loads an analyze table.
-    Otherwise loads a typed psv from localdir.
+    Otherwise loads a typed psv from localdir, or a typed feather file
+    (see `load_typed_feather`) if `extension` is 'feather'.
 
     Args:
         name (str): The name of the table or file to load
@@ -807,6 +932,8 @@ def dwim_load(name, localdir='/tmp', lvl='model', extension='txt', sep='|', **kw
         else:
             path = os.path.join(localdir, lvl, fname)
 
+        if extension == 'feather':
+            return load_typed_feather(path)
         return load_typed_psv(path, sep)
 
 
@@ -910,26 +1037,26 @@ def count_unique(group_by, count_column, df):
     Returns:
         int: The count of unique items in the specified column after grouping
     """
-    return df.groupby(group_by)[count_column].apply(lambda x: len(x.unique()))
+    return df.groupby(group_by, observed=True)[count_column].apply(lambda x: len(x.unique()))
 
 
 def sum(group_by, df):
-    return df.groupby(group_by).sum()
+    return df.groupby(group_by, observed=True).sum()
 
 
 def std(group_by, df):
-    return df.groupby(group_by).std()
+    return df.groupby(group_by, observed=True).std()
 
 
 def mean(group_by, df):
-    return df.groupby(group_by).mean()
+    return df.groupby(group_by, observed=True).mean()
 
 
 def count(group_by, df):
-    return df.groupby(group_by).count()
+    return df.groupby(group_by, observed=True).count()
 
 
-def inner_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None):
+def inner_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None, validate=None):
     """Keeps only matches
 
     Args:
@@ -938,39 +1065,16 @@ def inner_join(left_frame, right_frame, left_on, right_on=None, keep_columns=Non
         left_on (str): Which column in the left frame to join on
         right_on (str, optional): Which column to join on in the right frame, if different from `left_on`
         keep_columns (:type:`list` of :type:`str`, optional): A list of columns to keep in the result
+        validate (str, optional): Raise `pandas.errors.MergeError` unless the join is of this kind, as in
+            `pandas.merge`: `'one_to_one'`, `'one_to_many'`, `'many_to_one'` or `'many_to_many'`
 
     Returns:
        `pandas.DataFrame`: A frame containing the results of the join
     """
-
-    if right_on is None:
-        right_on = left_on
-
-    if type(left_on) == str:
-        left_on = [left_on]
-
-    if type(right_on) == str:
-        right_on = [right_on]
-
-    right_cols = right_frame.columns
-
-    # optional arg to specify which columns in right table to keep
-    if keep_columns is not None:
-        drop_columns = set()
-        for col in right_cols:
-            if (col in keep_columns) or (col in right_on):
-                pass
-            else:
-                # column not being kept
-                drop_columns.add(col)
-
-        # exclude columns from right table
-        right_cols = right_cols.difference(drop_columns)
-
-    return pd.merge(left_frame, right_frame[right_cols], left_on=left_on, right_on=right_on, how='inner')
+    return _join(left_frame, right_frame, left_on, right_on, keep_columns, 'inner', validate)
 
 
-def outer_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None):
+def outer_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None, validate=None):
     """Keeps data from both frames and matches up using the on_columns
 
     Args:
@@ -979,39 +1083,16 @@ def outer_join(left_frame, right_frame, left_on, right_on=None, keep_columns=Non
         left_on (str): Which column in the left frame to join on
         right_on (str, optional): Which column to join on in the right frame, if different from `left_on`
         keep_columns (:type:`list` of :type:`str`, optional): A list of columns to keep in the result
+        validate (str, optional): Raise `pandas.errors.MergeError` unless the join is of this kind, as in
+            `pandas.merge`: `'one_to_one'`, `'one_to_many'`, `'many_to_one'` or `'many_to_many'`
 
     Returns:
        `pandas.DataFrame`: A frame containing the results of the join
     """
+    return _join(left_frame, right_frame, left_on, right_on, keep_columns, 'outer', validate)
 
-    if right_on is None:
-        right_on = left_on
-
-    if type(left_on) == str:
-        left_on = [left_on]
-
-    if type(right_on) == str:
-        right_on = [right_on]
-
-    right_cols = right_frame.columns
-
-    # optional arg to specify which columns in right table to keep
-    if keep_columns is not None:
-        drop_columns = set()
-        for col in right_cols:
-            if (col in keep_columns) or (col in right_on):
-                pass
-            else:
-                # column not being kept
-                drop_columns.add(col)
-
-        # exclude columns from right table
-        right_cols = right_cols.difference(drop_columns)
-
-    return pd.merge(left_frame, right_frame[right_cols], left_on=left_on, right_on=right_on, how='outer')
 
-
-def left_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None):
+def left_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None, validate=None):
     """Keeps all data from left frame and any matches in right using the on_columns
 
     Args:
@@ -1020,39 +1101,16 @@ def left_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None
         left_on (str): Which column in the left frame to join on
         right_on (str, optional): Which column to join on in the right frame, if different from `left_on`
         keep_columns (:type:`list` of :type:`str`, optional): A list of columns to keep in the result
+        validate (str, optional): Raise `pandas.errors.MergeError` unless the join is of this kind, as in
+            `pandas.merge`: `'one_to_one'`, `'one_to_many'`, `'many_to_one'` or `'many_to_many'`
 
     Returns:
        `pandas.DataFrame`: A frame containing the results of the join
     """
-
-    if right_on is None:
-        right_on = left_on
-
-    if type(left_on) == str:
-        left_on = [left_on]
-
-    if type(right_on) == str:
-        right_on = [right_on]
-
-    right_cols = right_frame.columns
-
-    # optional arg to specify which columns in right table to keep
-    if keep_columns is not None:
-        drop_columns = set()
-        for col in right_cols:
-            if (col in keep_columns) or (col in right_on):
-                pass
-            else:
-                # column not being kept
-                drop_columns.add(col)
-
-        # exclude columns from right table
-        right_cols = right_cols.difference(drop_columns)
-
-    return pd.merge(left_frame, right_frame[right_cols], left_on=left_on, right_on=right_on, how='left')
+    return _join(left_frame, right_frame, left_on, right_on, keep_columns, 'left', validate)
 
 
-def right_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None):
+def right_join(left_frame, right_frame, left_on, right_on=None, keep_columns=None, validate=None):
     """Keeps all data from right frame and any matches in left using the on_columns
 
     Args:
@@ -1061,11 +1119,32 @@ def right_join(left_frame, right_frame, left_on, right_on=None, keep_columns=Non
         left_on (str): Which column in the left frame to join on
         right_on (str, optional): Which column to join on in the right frame, if different from `left_on`
         keep_columns (:type:`list` of :type:`str`, optional): A list of columns to keep in the result
+        validate (str, optional): Raise `pandas.errors.MergeError` unless the join is of this kind, as in
+            `pandas.merge`: `'one_to_one'`, `'one_to_many'`, `'many_to_one'` or `'many_to_many'`
 
     Returns:
        `pandas.DataFrame`: A frame containing the results of the join
     """
+    return _join(left_frame, right_frame, left_on, right_on, keep_columns, 'right', validate)
+
+
+# The `validate` values of `pandas.merge`, and whether each needs unique left keys
+_LEFT_UNIQUE = {
+    None: False,
+    'one_to_one': True, '1:1': True,
+    'one_to_many': True, '1:m': True,
+    'many_to_one': False, 'm:1': False,
+    'many_to_many': False, 'm:m': False,
+}
 
+
+def _join(left_frame, right_frame, left_on, right_on, keep_columns, how, validate=None):
+    """Joins two frames as `pandas.merge` does, projecting the right frame to the kept columns first
+
+    Left and inner joins on same-named keys whose right side is unique take a hash join fast path: the keys
+    are factorized into one int64 code per row and the right frame is only gathered by position, never merged
+    or copied whole. Everything else goes to `pandas.merge`.
+    """
     if right_on is None:
         right_on = left_on
 
@@ -1090,7 +1169,85 @@ def right_join(left_frame, right_frame, left_on, right_on=None, keep_columns=Non
         # exclude columns from right table
         right_cols = right_cols.difference(drop_columns)
 
-    return pd.merge(left_frame, right_frame[right_cols], left_on=left_on, right_on=right_on, how='right')
+    if how in ('left', 'inner') and validate in _LEFT_UNIQUE and _same_keys(left_frame, right_frame, left_on, right_on):
+        left_codes, right_codes = _join_codes(left_frame, right_frame, left_on, right_on)
+        right_index = pd.Index(right_codes)
+        # A join that fails validation goes on to pandas.merge to raise
+        if right_index.is_unique and not (_LEFT_UNIQUE[validate] and not pd.Index(left_codes).is_unique):
+            indexer = right_index.get_indexer(left_codes)
+            left = left_frame
+            if how == 'inner':
+                matched = indexer >= 0
+                left = left_frame.take(np.flatnonzero(matched))
+                indexer = indexer[matched]
+            return _gather(left, right_frame, indexer, [col for col in right_cols if col not in right_on])
+
+    if keep_columns is not None:
+        right_frame = right_frame[right_cols]
+    return pd.merge(left_frame, right_frame, left_on=left_on, right_on=right_on, how=how, validate=validate)
+
+
+def _share_categories(left_frame, right_frame, left_on, right_on):
+    """Gives categorical keys on both sides the same categories, in place, so they join as categoricals
+
+    Keys whose categories differ would otherwise be joined, and concatenated with their unmatched rows, as objects.
+    """
+    for left_col, right_col in zip(left_on, right_on):
+        left_dtype, right_dtype = left_frame[left_col].dtype, right_frame[right_col].dtype
+        if isinstance(left_dtype, pd.CategoricalDtype) and isinstance(right_dtype, pd.CategoricalDtype) \
+                and left_dtype != right_dtype:
+            categories = left_dtype.categories.append(right_dtype.categories).unique()
+            left_frame[left_col] = left_frame[left_col].cat.set_categories(categories)
+            right_frame[right_col] = right_frame[right_col].cat.set_categories(categories)
+
+
+def _same_keys(left_frame, right_frame, left_on, right_on):
+    """Whether the keys have the same names and dtypes on both sides, so one key column comes out of the join"""
+    return left_on == right_on and all(
+        left_frame[left_col].dtype == right_frame[right_col].dtype for left_col, right_col in zip(left_on, right_on)
+    )
+
+
+def _join_codes(left_frame, right_frame, left_on, right_on):
+    """Factorizes the join keys of both frames into one int64 code per row, equal codes being equal keys
+
+    The codes run from 0 to the number of distinct keys. Nulls are a key like any other, as they are to `pandas.merge`.
+
+    Returns:
+        tuple: The codes of the left frame and the codes of the right frame, as numpy arrays
+    """
+    codes = np.zeros(len(left_frame) + len(right_frame), dtype=np.int64)
+    size = 1
+    for left_col, right_col in zip(left_on, right_on):
+        key_codes, uniques = pd.factorize(
+            pd.concat([left_frame[left_col], right_frame[right_col]], ignore_index=True), use_na_sentinel=False
+        )
+        count = max(len(uniques), 1)
+        if size * count >= 2 ** 63:
+            # Renumber the keys so far before the combined code overflows
+            codes, uniques = pd.factorize(codes)
+            size = max(len(uniques), 1)
+        codes = codes * count + key_codes
+        size *= count
+    if len(left_on) > 1:
+        codes, _ = pd.factorize(codes)
+    return codes[:len(left_frame)], codes[len(left_frame):]
+
+
+def _gather(left_frame, right_frame, indexer, value_columns):
+    """`left_frame` with the `value_columns` of the `right_frame` rows at `indexer` appended, null where it is -1
+
+    Columns on both sides get the same suffixes as `pandas.merge` gives them.
+    """
+    overlap = [col for col in value_columns if col in left_frame.columns]
+
+    left = left_frame.reset_index(drop=True)
+    if overlap:
+        left = left.rename(columns={col: col + '_x' for col in overlap})
+    right = pd.DataFrame({
+        col + '_y' if col in overlap else col: _take(right_frame[col], indexer) for col in value_columns
+    }, index=left.index)
+    return pd.concat([left, right], axis=1)
 
 
 def anti_join(left_frame, right_frame, left_on, right_on=None):
@@ -1115,6 +1272,15 @@ def anti_join(left_frame, right_frame, left_on, right_on=None):
     if type(right_on) == str:
         right_on = [right_on]
 
+    if _same_keys(left_frame, right_frame, left_on, right_on):
+        left_codes, right_codes = _join_codes(left_frame, right_frame, left_on, right_on)
+        matches = np.bincount(right_codes, minlength=len(left_frame) + len(right_frame))[left_codes]
+        unmatched = np.flatnonzero(matches == 0)
+        df = left_frame.take(unmatched)
+        # Numbered by row of the left join the unmatched records would have come out of
+        df.index = pd.Index((np.cumsum(np.maximum(matches, 1)) - 1)[unmatched])
+        return df
+
     indicator_status = False
     indicator_name = '_merge'
 
@@ -1134,17 +1300,14 @@ def anti_join(left_frame, right_frame, left_on, right_on=None):
     return df
 
 
-def compare(left_frame, right_frame, left_on, right_on=None):
+def compare(left_frame, right_frame, left_on, right_on=None, validate=None):
     """Keeps all data from right frame and any matches in left using the on_columns"""
 
     #20180420 PBB Is "compare" a good name for this, it's basically a right-join in SQL terms?
     #20180420 MWR It's quite old legacy.  Not sure this one has ever been used for anything.  Perhaps
     #             we can just do away with it.
 
-    if right_on is None:
-        right_on = left_on
-
-    return pd.merge(left_frame, right_frame, left_on=left_on, right_on=right_on, how='outer')
+    return _join(left_frame, right_frame, left_on, right_on, None, 'outer', validate)
 
 
 def apply_rule(df, rules, target_columns=None, include_once=True, show_rules=False):
@@ -1187,6 +1350,7 @@ def apply_rule(df, rules, target_columns=None, include_once=True, show_rules=Fal
         return False if match is True else include
 
     rule_num = 0
+    masks = {}
 
     for rule in rules:
         rule_num = rule_num + 1
@@ -1195,7 +1359,8 @@ def apply_rule(df, rules, target_columns=None, include_once=True, show_rules=Fal
         # Find subset based on condition
         if rule_condition is not None and rule_condition != '' and str(rule_condition) != 'nan':
             try:
-                df_subset = df[df['include'] == True].query(rule_condition, engine='python')
+                df_subset = df[df['include'] == True]
+                df_subset = df_subset[_subset_mask(df, df_subset, rule_condition, masks, engine='python')]
                 print('subset length: {}'.format(len(df[df['include'] == True])))
                 if show_rules:
                     df_subset['rule_number'] = str(rule_num)
@@ -1252,7 +1417,7 @@ def apply_rule(df, rules, target_columns=None, include_once=True, show_rules=Fal
 
 def apply_rules(df, df_rules, target_columns=None, include_once=True, show_rules=False,
                 verbose=True, unmatched_rule='UNMATCHED', condition_column='condition', iteration_column='iteration',
-                rule_id_column=None, logger=logger, raise_exceptions=False):
+                rule_id_column=None, logger=logger, raise_exceptions=False, vectorized=False):
     """
     If include_once is True, then condition n+1 only applied to records left after condition n.
     Adding target column(s), plural, because we'd want to only run this operation once, even
@@ -1273,6 +1438,10 @@ def apply_rules(df, df_rules, target_columns=None, include_once=True, show_rules
         rule_id_column (str, optional): Column name containing the rule id, just set to index if not provided
         logger (object, optional): Logger to record any output
         raise_exceptions (bool, optional): Whether to raise exceptions. Defaults to `False` (backwards compatible)
+        vectorized (bool, optional): Evaluate each iteration's conditions as boolean masks over the whole frame
+            and resolve first-match-wins in one pass instead of querying the shrinking subset rule by rule.
+            Only used when `include_once` is True, and requires row-wise conditions (no aggregates such as
+            `col > col.mean()`) and a unique index on `df`. Defaults to `False`
 
     Returns:
         list of pandas.DataFrame: The results of applying rules to the input `df`
@@ -1300,6 +1469,13 @@ def apply_rules(df, df_rules, target_columns=None, include_once=True, show_rules
     iterations.sort()
     for iteration in iterations:
         df['include'] = True
+        if vectorized is True and include_once is True:
+            row_num = _apply_rules_vectorized(
+                df, df_rules[df_rules[iteration_column] == iteration], iteration, summary, row_num, target_columns,
+                show_rules, verbose, unmatched_rule, condition_column, iteration_column, rule_id_column, logger,
+                raise_exceptions,
+            )
+            continue
 
         def write_rule_numbers(rule_num):
             """Need to allow for fact that there will be > 1 sometimes if we have > iteration."""
@@ -1323,6 +1499,7 @@ def apply_rules(df, df_rules, target_columns=None, include_once=True, show_rules
                 return '{}, {}'.format(rule_id, str(rule[rule_id_column]))
 
         matches = []  # for use when include_once is False
+        masks = {}
         for index, rule in df_rules[df_rules[iteration_column] == iteration].iterrows():
             # Find subset based on condition
             df_subset = df[df['include'] == True]
@@ -1336,7 +1513,7 @@ def apply_rules(df, df_rules, target_columns=None, include_once=True, show_rules
 
             if rule[condition_column] is not None and rule[condition_column] != '' and str(rule[condition_column]) != 'nan':
                 try:
-                    df_subset = df_subset.query(rule[condition_column])#, engine='python')
+                    df_subset = df_subset[_subset_mask(df, df_subset, rule[condition_column], masks)]
                     if show_rules is True:
                         if include_once is True:
                             df.loc[list(df_subset.index), 'rule_number'] = list(map(write_rule_numbers, df.loc[list(df_subset.index), 'rule_number']))
@@ -1422,6 +1599,298 @@ def apply_rules(df, df_rules, target_columns=None, include_once=True, show_rules
     return [df, df_summary]
 
 
+_RULE_BLOCK_SIZE = 256
+_CONDITION_CACHE_SIZE = 8192
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+def _has_condition(condition):
+    return condition is not None and condition != '' and str(condition) != 'nan'
+
+
+def _literal(node):
+    """Returns the str or number a node holds, raising ValueError for anything else"""
+    value = ast.literal_eval(node)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('Not a str or number literal')
+    return value
+
+
+def _compile_term(node):
+    """Compiles one ANDed term of a condition to `(source, column, op, value)`
+
+    Comparisons of a column name to a str or number literal (`ACCOUNT == 'x'`, `ENTITY in [1, 2]`) keep the
+    column, comparison and literal so they can be evaluated without `DataFrame.eval`.  Anything else keeps
+    only its source and a `None` column.
+    """
+    source = ast.unparse(node)
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.left, ast.Name):
+        op = node.ops[0]
+        try:
+            if isinstance(op, (ast.In, ast.NotIn)) and isinstance(node.comparators[0], (ast.List, ast.Tuple)):
+                value = tuple(_literal(element) for element in node.comparators[0].elts)
+                return source, node.left.id, type(op), value
+            if type(op) in _COMPARISONS:
+                return source, node.left.id, type(op), _literal(node.comparators[0])
+        except ValueError:
+            pass
+    return source, None, None, None
+
+
+@lru_cache(maxsize=_CONDITION_CACHE_SIZE)
+def _compile_condition(condition):
+    """Compiles a `DataFrame.query` condition into the terms it ANDs together
+
+    `&` and `|` are read as `and` and `or` as pandas does.  The result is cached by condition string, so a rule
+    table applied again only compiles the conditions it has not seen.  Conditions this cannot read (backtick
+    quoted names, `@` variables, ...) come back as a single term evaluated as written.
+
+    Args:
+        condition (str): A `DataFrame.query` style condition
+
+    Returns:
+        tuple: `(source, column, op, value)` terms, see `_compile_term`
+    """
+    try:
+        tokens = []
+        for token in tokenize.generate_tokens(io.StringIO(condition.strip()).readline):
+            if token.type == tokenize.OP and token.string in ('&', '|'):
+                token = (tokenize.NAME, 'and' if token.string == '&' else 'or')
+            else:
+                token = (token.type, token.string)
+            tokens.append(token)
+        tree = ast.parse(tokenize.untokenize(tokens).strip(), mode='eval').body
+    except (SyntaxError, ValueError, tokenize.TokenError):
+        return ((condition, None, None, None),)
+
+    if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And):
+        return tuple(_compile_term(node) for node in tree.values)
+    return (_compile_term(tree),)
+
+
+def _term_mask(frame, term, masks, engine):
+    source, column, op, value = term
+    if column is None or column not in frame.columns or not frame.columns.is_unique:
+        series = None
+    else:
+        series = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(series.dtype) or pd.api.types.is_timedelta64_dtype(series.dtype):
+            series = None
+
+    if series is not None and isinstance(series.dtype, pd.CategoricalDtype) and op is not None:
+        # Compare the categories once and pick each row's answer by its code, nulls never matching
+        categories = series.cat.categories
+        if op in (ast.In, ast.NotIn):
+            hits = categories.isin(value)
+        else:
+            hits = np.asarray(_COMPARISONS[ast.Eq if op is ast.NotEq else op](categories, value), dtype=bool)
+        mask = np.append(hits, False)[series.cat.codes.to_numpy()]
+        return ~mask if op in (ast.NotEq, ast.NotIn) else mask
+
+    if series is not None and series.dtype == object and op in (ast.Eq, ast.NotEq, ast.In, ast.NotIn):
+        # Equality against text is a Python level comparison per row, so factorize the column once and compare codes
+        factorized = masks.get(('codes', column))
+        if factorized is None:
+            try:
+                codes, uniques = pd.factorize(series)
+                factorized = (codes, {unique: code for code, unique in enumerate(uniques)})
+            except TypeError:
+                factorized = False  # unhashable values, compare row by row
+            masks[('codes', column)] = factorized
+        if factorized is not False:
+            codes, lookup = factorized
+            values = value if op in (ast.In, ast.NotIn) else (value,)
+            mask = np.isin(codes, [lookup[v] for v in values if v in lookup])
+            return ~mask if op in (ast.NotEq, ast.NotIn) else mask
+
+    if series is None:
+        result = frame.eval(source, engine=engine)
+    elif op in (ast.In, ast.NotIn):
+        result = series.isin(value) if op is ast.In else ~series.isin(value)
+    else:
+        result = _COMPARISONS[op](series, value)
+    if not isinstance(result, pd.Series) or not pd.api.types.is_bool_dtype(result.dtype):
+        raise ValueError('Condition {} does not evaluate to a boolean mask'.format(source))
+    return result.to_numpy(dtype=bool, na_value=False)
+
+
+def _condition_mask(frame, condition, masks, engine=None):
+    """Evaluates a rule condition over every row of `frame` as a boolean numpy mask
+
+    The condition is compiled once per process (see `_compile_condition`) and each of its ANDed terms is
+    memoised in `masks`, so rules sharing a sub-predicate such as `ACCOUNT == 'x'` only evaluate it once
+    against `frame`.  Simple column to literal comparisons skip `DataFrame.eval` altogether.
+
+    Args:
+        frame (pandas.DataFrame): The frame to evaluate the condition against
+        condition (str): A `DataFrame.query` style condition
+        masks (dict): Masks already evaluated against `frame`, keyed by term source
+        engine (str, optional): The `DataFrame.eval` engine for terms that need it
+
+    Returns:
+        numpy.ndarray: One boolean per row of `frame`
+    """
+    mask = None
+    for term in _compile_condition(condition):
+        term_mask = masks.get(term[0])
+        if term_mask is None:
+            term_mask = masks[term[0]] = _term_mask(frame, term, masks, engine)
+        mask = term_mask if mask is None else mask & term_mask
+    return mask
+
+
+def _subset_mask(df, df_subset, condition, masks, engine=None):
+    """Evaluates a rule condition over `df_subset`, the rows of `df` still included
+
+    A condition made only of column to literal comparisons gives each row the same answer whichever other rows
+    are there, so while the subset is more than half of `df` it is evaluated against `df` and its terms shared
+    with later rules through `masks`.  Anything else (`amount > amount.mean()`, `.shift()`, ...) may depend on
+    the other rows, so it is always evaluated against `df_subset` alone.
+    """
+    row_wise = all(column is not None for _, column, _, _ in _compile_condition(condition))
+    if row_wise and len(df_subset) * 2 > len(df):
+        return _condition_mask(df, condition, masks, engine)[df['include'].to_numpy(dtype=bool)]
+    return _condition_mask(df_subset, condition, {}, engine)
+
+
+def _apply_rules_vectorized(df, df_rules, iteration, summary, row_num, target_columns, show_rules, verbose,
+                            unmatched_rule, condition_column, iteration_column, rule_id_column, logger,
+                            raise_exceptions):
+    """Applies one iteration of include_once rules to `df` in place, appending to `summary`
+
+    Rules are processed in blocks of `_RULE_BLOCK_SIZE`.  Each block's conditions are evaluated into a
+    rules x rows mask matrix, and each row still unmatched takes the first rule in the block that matches it
+    (`argmax` down the matrix).  Once most rows are matched the remaining rows are taken into a smaller
+    frame so later blocks only evaluate what is left, as the row by row engine does.
+
+    Returns:
+        int: The next summary row number
+    """
+    rules = df_rules.to_dict('records')
+    rule_indexes = list(df_rules.index)
+    row_count = len(df)
+    remaining = np.ones(row_count, dtype=bool)
+    remaining_count = row_count
+    matched_rule = np.full(row_count, -1, dtype=np.int64)  # position in `rules` of the rule each row matched
+
+    frame = df
+    frame_positions = np.arange(row_count)
+    masks = {}
+    for block_start in range(0, len(rules), _RULE_BLOCK_SIZE):
+        if remaining_count == 0:
+            break
+        if remaining_count * 2 <= len(frame):
+            frame_positions = np.flatnonzero(remaining)
+            frame = df.take(frame_positions)
+            masks = {}
+
+        block = rules[block_start:block_start + _RULE_BLOCK_SIZE]
+        mask_matrix = np.zeros((len(block), len(frame)), dtype=bool)
+        errors = {}
+        for offset, rule in enumerate(block):
+            if _has_condition(rule[condition_column]):
+                try:
+                    mask_matrix[offset] = _condition_mask(frame, rule[condition_column], masks)
+                except Exception as e:
+                    errors[offset] = e
+            else:
+                mask_matrix[offset] = True
+
+        mask_matrix &= remaining[frame_positions]
+        matched = mask_matrix.any(axis=0)
+        first_match = mask_matrix.argmax(axis=0)[matched]
+        matched_counts = np.bincount(first_match, minlength=len(block))
+
+        for offset, rule in enumerate(block):
+            index = rule_indexes[block_start + offset]
+            input_length = remaining_count
+            if input_length == 0:
+                break
+            if verbose:
+                logger.debug('')
+                logger.debug('iteration:{} - rule:{} - {}'.format(iteration, index, rule[condition_column]))
+                logger.debug('{} - input length'.format(input_length))
+
+            if offset in errors:
+                try:
+                    raise errors[offset]
+                except Exception as e:
+                    if raise_exceptions:
+                        raise
+                    if show_rules is True:
+                        df['log'] = ['<{} ::: {}>'.format(e, log) for log in df['log']]
+                    error_msg = ' (rule_num {0}) {1} error: {2}'.format(index, rule[condition_column], e)
+                    logger.exception('EXCEPTION {}'.format(error_msg))
+
+            matched_length = int(matched_counts[offset])
+            if verbose:
+                logger.debug('{} - matched length'.format(matched_length))
+            remaining_count -= matched_length
+
+            summary_record = {
+                'row_num': row_num,
+                iteration_column: iteration,
+                'input_records': input_length,
+                'matched_records': matched_length,
+            }
+            summary_record.update(rule)
+            summary.append(summary_record)
+            row_num += 1
+
+        matched_positions = frame_positions[matched]
+        matched_rule[matched_positions] = block_start + first_match
+        remaining[matched_positions] = False
+
+    positions = np.flatnonzero(matched_rule >= 0)
+    if len(positions):
+        row_rules = matched_rule[positions]
+
+        # Populate target columns as specified in the matched rule
+        for column in target_columns:
+            values = np.empty(len(rules), dtype=object)
+            values[:] = [rule[column] for rule in rules]
+            populate = np.array([value not in ['nan', '', 'None', None] for value in values])[row_rules]
+            if populate.any():
+                column_values = pd.Series(values[row_rules[populate]]).infer_objects().to_numpy()
+                df.iloc[positions[populate], df.columns.get_loc(column)] = column_values
+
+        if show_rules is True:
+            conditioned = np.array([_has_condition(rule[condition_column]) for rule in rules])[row_rules]
+            shown = positions[conditioned]
+            shown_rules = row_rules[conditioned]
+
+            def append_labels(column, labels):
+                """Need to allow for fact that there will be > 1 sometimes if we have > iteration."""
+                current = df[column].to_numpy(dtype=object)[shown]
+                labels = labels[shown_rules]
+                df.iloc[shown, df.columns.get_loc(column)] = np.where(current == '', labels, current + ', ' + labels)
+
+            append_labels('rule_number', np.array([str(index) for index in rule_indexes], dtype=object))
+            # Set this to empty string.  Waaaaaay to much data being generated.
+            df.iloc[shown, df.columns.get_loc('rule')] = ''
+            if rule_id_column:
+                append_labels('rule_id', np.array([str(rule[rule_id_column]) for rule in rules], dtype=object))
+
+    df['include'] = remaining
+
+    # unmatched record:
+    summary.append({
+        'row_num': row_num,
+        iteration_column: iteration,
+        'input_records': remaining_count,
+        'matched_records': remaining_count,
+        'rule': unmatched_rule
+    })
+    return row_num + 1
+
+
 def memoize(fn):
     cache = fn.cache = {}
 
@@ -1539,7 +2008,7 @@ def apply_agg(df, group_by, column_operations):
         if column_operations[co] in valid_operations:
             final[co] = column_operations[co]
 
-    return df.groupby(group_by).agg(final).reset_index()
+    return df.groupby(group_by, observed=True).agg(final).reset_index()
 
 
 def distinct(df, columns=None, keep='first', inplace=False):
@@ -1840,8 +2309,181 @@ def has_data(df):
         return False
 
 
-def convert_currency(
-    df_data,
+class CurrencyRates(object):
+    """Currency rates prepared once for converting any number of frames
+
+    Loaded rates are kept in a compact (period, source, target, rate) frame with the currencies coded as integers.
+    The effective rate matrix for a set of periods, or for a single period, is worked out the first time it is
+    needed and cached on the object, so a rates frame shared by many steps is only resolved once.  `save` and
+    `load` persist the rates to Feather to share them between processes.
+
+    `find_rates` finds the rate for each record and `convert` applies it.  A missing or zero point-to-point rate
+    is triangulated through each of the `intermediate_currencies` in turn until one gives a non-zero rate.
+
+    Args:
+        df_rates (`pandas.DataFrame`): A frame containing currency rates
+        rate_field (str, optional): Column of `df_rates` containing the rate
+        source_currency (str, optional): Column of `df_rates` with the currency converted from
+        target_currency (str, optional): Column of `df_rates` with the currency converted to
+        intermediate_currencies (str or list, optional): Currencies to convert through, in order of preference
+
+    Examples:
+        >>> rates = CurrencyRates(pd.DataFrame({
+        ...     'PERIOD': ['2020-01', '2020-01'], 'RATE': [1.25, 0.01],
+        ...     'CURRENCY_SOURCE': ['EUR', 'JPY'], 'CURRENCY_TARGET': ['USD', 'USD'],
+        ... }))
+        >>> rates.convert(pd.DataFrame({
+        ...     'PERIOD': ['2020-01', '2020-01'], 'AMOUNT': [10.0, 500.0],
+        ...     'CURRENCY_SOURCE': ['EUR', 'JPY'], 'CURRENCY_TARGET': ['JPY', 'EUR'],
+        ... }), 'AMOUNT', 'CONVERTED')
+            PERIOD  AMOUNT CURRENCY_SOURCE CURRENCY_TARGET     RATE  CONVERTED
+        0  2020-01    10.0             EUR             JPY  125.000     1250.0
+        1  2020-01   500.0             JPY             EUR    0.008        4.0
+    """
+
+    def __init__(self, df_rates, rate_field='RATE', source_currency='CURRENCY_SOURCE',
+                 target_currency='CURRENCY_TARGET', intermediate_currencies='USD'):
+        if not isinstance(intermediate_currencies, list):
+            intermediate_currencies = [intermediate_currencies]
+
+        currencies = list(set(df_rates[source_currency]) | set(df_rates[target_currency]))
+        currencies.sort()
+        self.currencies = pd.Index(currencies)
+        self.intermediate_currencies = intermediate_currencies
+        self.rates = pd.DataFrame({
+            'PERIOD': df_rates['PERIOD'].to_numpy(),
+            'SOURCE': self.currency_codes(df_rates[source_currency]),
+            'TARGET': self.currency_codes(df_rates[target_currency]),
+            'RATE': pd.to_numeric(df_rates[rate_field], errors='coerce').to_numpy(dtype=float),
+        })
+        self._matrices = {}
+
+    def currency_codes(self, currencies):
+        """Returns the integer code of each currency, currencies without any rate all sharing the last code"""
+        codes = self.currencies.get_indexer(currencies)
+        codes[codes == -1] = len(self.currencies)
+        return codes
+
+    def matrix(self, periods):
+        """Returns the (source x target) effective rate matrix using the rates loaded for `periods`
+
+        Where a currency pair has rates in several periods the first one loaded is used.
+
+        Args:
+            periods (iterable): The periods whose rates to use
+
+        Returns:
+            numpy.ndarray: Effective rates, indexed by `currency_codes`
+        """
+        periods = frozenset(periods)
+        matrix = self._matrices.get(periods)
+        if matrix is None:
+            rates = self.rates[self.rates['PERIOD'].isin(periods)]
+            matrix = _rate_matrix(
+                rates['SOURCE'].to_numpy(), rates['TARGET'].to_numpy(), rates['RATE'].to_numpy(), len(self.currencies)
+            )
+            matrix = self._matrices[periods] = _effective_rates(
+                matrix, self.currency_codes(self.intermediate_currencies)
+            )
+        return matrix
+
+    def find_rates(self, df_data, source_currency='CURRENCY_SOURCE', target_currency='CURRENCY_TARGET',
+                   by_period=False):
+        """Finds the effective rate for each record of `df_data`
+
+        Args:
+            df_data (`pandas.DataFrame`): The frame containing source data, with a `PERIOD` column
+            source_currency (str, optional): Column of `df_data` with the currency to convert from
+            target_currency (str, optional): Column of `df_data` with the currency to convert to
+            by_period (bool, optional): Use each record's own `PERIOD` rates. Defaults to `False`, where the
+                rates of every period in `df_data` are used together
+
+        Returns:
+            numpy.ndarray: The rate for each record, 0 where there is no way to convert
+        """
+        periods = pd.Index(pd.unique(df_data['PERIOD']))
+        if by_period:
+            matrix = np.stack([self.matrix([period]) for period in periods])
+            data_periods = periods.get_indexer(df_data['PERIOD'])
+        else:
+            matrix = self.matrix(periods)[np.newaxis]
+            data_periods = np.zeros(len(df_data), dtype=np.int64)
+        return matrix[
+            data_periods, self.currency_codes(df_data[source_currency]), self.currency_codes(df_data[target_currency])
+        ]
+
+    def convert(self, df_data, source_amount_column=None, target_amount_column=None, rate_field='RATE',
+                source_currency='CURRENCY_SOURCE', target_currency='CURRENCY_TARGET', by_period=False):
+        """Converts `df_data` with the rates found by `find_rates`
+
+        Args:
+            df_data (`pandas.DataFrame`): The frame containing source data, with a `PERIOD` column
+            source_amount_column (str, optional): Column of `df_data` containing the pre-converted amount
+            target_amount_column (str, optional): Column name of the final converted amount
+            rate_field (str, optional): Column name for the rate used
+            source_currency (str, optional): Column of `df_data` with the currency to convert from
+            target_currency (str, optional): Column of `df_data` with the currency to convert to
+            by_period (bool, optional): Use each record's own `PERIOD` rates. Defaults to `False`
+
+        Returns:
+            `pandas.DataFrame`: A copy of `df_data` with the rate, and the converted amount if both amount
+            columns are given
+        """
+        df_data = df_data.reset_index(drop=True)
+        df_data[rate_field] = self.find_rates(df_data, source_currency, target_currency, by_period=by_period)
+        if source_amount_column and target_amount_column:
+            df_data[target_amount_column] = df_data[source_amount_column] * df_data[rate_field]
+        return df_data
+
+    def save(self, path):
+        """Saves the rates to a Feather file at `path`
+
+        Args:
+            path (str): The file to write
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.feather as feather
+        except ImportError as exc:
+            raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+        table = pa.Table.from_pandas(self.rates, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b'plaidcloud.currency_rates': json.dumps({
+                'currencies': list(self.currencies),
+                'intermediate_currencies': self.intermediate_currencies,
+            }),
+        })
+        feather.write_feather(table, path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads rates saved by `save`
+
+        Args:
+            path (str): The file to read
+
+        Returns:
+            CurrencyRates: The saved rates
+        """
+        try:
+            import pyarrow.feather as feather
+        except ImportError as exc:
+            raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+        table = feather.read_table(path, memory_map=True)
+        metadata = json.loads(table.schema.metadata[b'plaidcloud.currency_rates'])
+        currency_rates = cls.__new__(cls)
+        currency_rates.currencies = pd.Index(metadata['currencies'])
+        currency_rates.intermediate_currencies = metadata['intermediate_currencies']
+        currency_rates.rates = table.to_pandas()
+        currency_rates._matrices = {}
+        return currency_rates
+
+
+def convert_currency(
+    df_data,
     df_rates,
     source_amount_column=None,
     target_amount_column=None,
@@ -1851,6 +2493,7 @@ def convert_currency(
     rates_frame_source_currency='CURRENCY_SOURCE',
     rates_frame_target_currency='CURRENCY_TARGET',
     intermediate_currency='USD',
+    by_period=False,
 ):
     """
     Convert currency from unconverted amount to amount of target currency
@@ -1862,14 +2505,18 @@ def convert_currency(
     We are going to try to do a point-to-point lookup first.  If that fails, we will attempt to lookup
     from source to USD and then from USD to target, applying correct math along the way.
 
-    TODO 1: We should optionally consider period, but for now we'll assume records of both tables pertain to the same period.
+    The rates are laid out once as a (period x source x target) matrix of effective rates, inverse and
+    triangulated rates included, and every row is converted with a single gather on integer currency codes.
+    Pass a `CurrencyRates` as `df_rates` to reuse the same rates across calls.
+
     TODO 2: Build test cases
     TODO 3: Build appropriate warnings for things like:
         Sending in source tables with columns that do not line up with expected source columns
 
     Args:
         df_data (`pandas.DataFrame`): The frame containing source data
-        df_rates (`pandas.DataFrame`): A frame containing currency rates
+        df_rates (`pandas.DataFrame` or `CurrencyRates`): A frame containing currency rates, or the rates
+            already prepared, in which case the rates frame arguments are ignored
         source_amount_column (str): Column of the `source_frame` containing pre-converted amount
         target_amount_column (str): Column name of the final converted amount
         rate_field (str, optional): Column name of column of the `rates_frame` containing the amount to convert
@@ -1877,166 +2524,172 @@ def convert_currency(
         source_frame_target_currency (str, optional): Column of source frame indicating currency of intended post-converted amount
         rates_frame_source_currency (str, optional): Column of source frame indicating currency of pre-converted amount
         rates_frame_target_currency (str, optional): Column of source frame indicating currency of intended post-converted amount
-        intermediate_currency (str, optional):
+        intermediate_currency (str or list, optional): Currency, or currencies in order of preference, to
+            convert through when there is no point-to-point rate
+        by_period (bool, optional): Convert each record with the rates of its own `PERIOD`. Defaults to `False`,
+            where the first rate found for a currency pair in any period in use applies to every period
 
     Returns:
         `pandas.DataFrame`: The results of the lookup
     """
+    if not isinstance(df_rates, CurrencyRates):
+        df_rates = CurrencyRates(
+            df_rates[df_rates['PERIOD'].isin(pd.unique(df_data['PERIOD']))],
+            rate_field=rate_field,
+            source_currency=rates_frame_source_currency,
+            target_currency=rates_frame_target_currency,
+            intermediate_currencies=intermediate_currency,
+        )
 
-    periods_in_use = set(df_data['PERIOD'])
-
-    # Set intermediate currency for 2-step currency conversion
-    df_data['CURRENCY_INTERMEDIATE'] = intermediate_currency
-
-    if source_frame_source_currency != 'CURRENCY_SOURCE':
-        df_data['CURRENCY_SOURCE'] = df_data[source_frame_source_currency]
-        delete_curr_src_col = True #Clean up after ourselves so we don't send extra columns back that wouldn't be expected.
-    else:
-        delete_curr_src_col = False
-
-    if source_frame_target_currency != 'CURRENCY_TARGET':
-        df_data['CURRENCY_TARGET'] = df_data[source_frame_target_currency]
-        delete_curr_tgt_col = True #Clean up after ourselves so we don't send extra columns back that wouldn't be expected.
-    else:
-        delete_curr_tgt_col = False
-
-    df_rates = df_rates[df_rates['PERIOD'].isin(periods_in_use)]
-
-    df_rates['CURRENCY_SOURCE'] = df_rates[rates_frame_source_currency]
-    df_rates['CURRENCY_TARGET'] = df_rates[rates_frame_target_currency]
-    df_rates[rate_field] = df_rates[rate_field]
-    df_rates['RATE_TYPE'] = '1' #Loaded rates are preferred
+    #Note, We return the effective rate that was used to do the conversion.
+    #We will also return a converted amount if a source amount was passed & target converted amount field name were passed in.
 
-    df_rates = df_rates[[
-        'PERIOD', #object
-        rate_field, #float64
-        'CURRENCY_SOURCE', #object
-        'CURRENCY_TARGET', #object
-    ]]
+    #TODO: We could send back a diagnostic field that shows HOW we arrived at the currency rate
+    return df_rates.convert(
+        df_data,
+        source_amount_column,
+        target_amount_column,
+        rate_field=rate_field,
+        source_currency=source_frame_source_currency,
+        target_currency=source_frame_target_currency,
+        by_period=by_period,
+    )
 
-    df_rates_flipped = df_rates.copy(deep=True)
-    df_rates_flipped['CURRENCY_SOURCE_old'] = df_rates_flipped['CURRENCY_SOURCE']
-    df_rates_flipped['CURRENCY_TARGET_old'] = df_rates_flipped['CURRENCY_TARGET']
-    df_rates_flipped['CURRENCY_SOURCE']     = df_rates_flipped['CURRENCY_TARGET_old']
-    df_rates_flipped['CURRENCY_TARGET']     = df_rates_flipped['CURRENCY_SOURCE_old']
-    df_rates_flipped[rate_field] = 1.0 / df_rates_flipped[rate_field]
-    del df_rates_flipped['CURRENCY_SOURCE_old']
-    del df_rates_flipped['CURRENCY_TARGET_old']
-    df_rates_flipped['RATE_TYPE'] = '2' #Flipped rates are to be used only if loaded rates do not exist
 
-    currencies_in_use = list(set(list(set(df_rates['CURRENCY_SOURCE'])) +  list(set(df_rates['CURRENCY_TARGET']))))
-    currencies_in_use.sort()
+def _rate_matrix(source_codes, target_codes, rates, size):
+    """Lays out loaded rates as a (source x target) matrix with one extra, all NaN, row and column
 
-    df_rates_passthrough_wip = pd.DataFrame({'CURRENCY_SOURCE' : currencies_in_use})
-    df_rates_passthrough_wip['CURRENCY_TARGET'] = df_rates_passthrough_wip['CURRENCY_SOURCE']
-    df_rates_passthrough_wip[rate_field]=1.0
-    df_rates_passthrough_wip['RATE_TYPE'] = '3'
+    Loaded rates are preferred over flipped (inverse) rates, which are preferred over the 1.0 passthrough of a
+    currency with any rate to itself.  The first rate loaded for a currency pair wins.
 
-    df_rates_passthrough = pd.DataFrame()
+    Args:
+        source_codes (numpy.ndarray): Source currency code of each loaded rate
+        target_codes (numpy.ndarray): Target currency code of each loaded rate
+        rates (numpy.ndarray): The loaded rates
+        size (int): How many currencies there are
 
-    #Create passthrough rates for each period.
-    for period in periods_in_use:
-        df_rates_passthrough_chunk = df_rates_passthrough_wip.copy(deep=True)
-        df_rates_passthrough_chunk['PERIOD'] = period
-        df_rates_passthrough = pd.concat([df_rates_passthrough, df_rates_passthrough_chunk])
+    Returns:
+        numpy.ndarray: A `size + 1` square matrix of rates, NaN where there is none
+    """
+    matrix = np.full((size + 1, size + 1), np.nan)
+    in_use = np.unique(np.concatenate([source_codes, target_codes]))
+    in_use = in_use[in_use < size]
+    matrix[in_use, in_use] = 1.0
 
+    pairs = pd.DataFrame({'source': source_codes, 'target': target_codes})
+    first = ~pairs.duplicated().to_numpy() & (source_codes < size) & (target_codes < size)
+    source_codes, target_codes, rates = source_codes[first], target_codes[first], rates[first]
+    with np.errstate(divide='ignore'):
+        matrix[target_codes, source_codes] = 1.0 / rates
+    matrix[source_codes, target_codes] = rates
+    return matrix
 
-    df_rates = pd.concat([df_rates, df_rates_flipped, df_rates_passthrough])
 
-    #Keep loaded rates rather than flipped rates if both exist for a given currency
-    df_rates.sort_values(['RATE_TYPE'], ascending=[True], inplace=True)
-    df_rates = distinct(df_rates, columns=['CURRENCY_SOURCE', 'CURRENCY_TARGET'], keep='first')
+def _effective_rates(matrix, intermediates):
+    """Resolves a rate matrix to the rate each conversion uses
 
-    #If multiple rates exist, keep only the one from the most-recent period.
-    #df_rates.sort_values(['PERIOD'], ascending=[False], inplace=True)
-    #df_rates = distinct(df_rates, columns=['CURRENCY_SOURCE', 'CURRENCY_TARGET'])
+    A missing or zero point-to-point rate falls back to converting through each intermediate currency in turn,
+    missing legs counting as zero.
+    """
+    matrix = np.where(np.isnan(matrix), 0.0, matrix)
+    effective = matrix
+    for intermediate in intermediates:
+        with np.errstate(invalid='ignore'):
+            two_step = np.outer(matrix[:, intermediate], matrix[intermediate, :])
+        effective = np.where(effective != 0, effective, two_step)
+    return effective
 
-    df_data = lookup(
-        df_data,
-        df_rates,
-        ['CURRENCY_SOURCE','CURRENCY_TARGET'],
-        ['CURRENCY_SOURCE', 'CURRENCY_TARGET'],
-        keep_columns=rate_field,
-        exclude_duplicate_columns=False,
-        keep="first",
-        inplace=False
-    )
 
-    df_data.rename(
-        columns={
-            rate_field   : 'RATE_1', #for 1-step conversion
-        }, inplace = True
-    )
+class LookupIndex(object):
+    """A lookup frame hashed on its key columns, ready to be probed by many source frames
 
+    The lookup frame is trimmed to `keep_columns`, de-duplicated on its keys and hashed once when the index is
+    built.  Each `probe` then gathers the matching lookup rows by position, giving the same result as
+    `lookup` without copying the lookup frame or merging, so repeated lookups against the same master data
+    only pay for hashing the source keys.
 
-    df_data = lookup(
-        df_data,
-        df_rates,
-        ['CURRENCY_SOURCE','CURRENCY_INTERMEDIATE'],
-        ['CURRENCY_SOURCE', 'CURRENCY_TARGET'],
-        keep_columns=rate_field,
-        exclude_duplicate_columns=False,
-        keep="first",
-        inplace=False
-    )
-
-    df_data.rename(
-        columns={
-            rate_field   : 'RATE_2a', #for 2-step conversion
-        }, inplace = True
-    )
+    Args:
+        lookup_frame (`pandas.DataFrame`): A frame containing data to look up
+        right_on (str or list): The key column(s) of `lookup_frame`
+        keep_columns (:type:`list` of :type:`str`, optional): The lookup columns to keep. Defaults to all
+        keep (str, optional): Which duplicate to use, defaults to `'first'`
 
-    df_data = lookup(
-        df_data,
-        df_rates,
-        ['CURRENCY_INTERMEDIATE', 'CURRENCY_TARGET'],
-        ['CURRENCY_SOURCE', 'CURRENCY_TARGET'],
-        keep_columns=rate_field,
-        exclude_duplicate_columns=False,
-        keep="first",
-        inplace=False
-    )
+    Examples:
+        >>> rates = pd.DataFrame({'CURRENCY': ['EUR', 'GBP', 'EUR'], 'RATE': [1.1, 1.3, 1.2]})
+        >>> rates_index = LookupIndex(rates, 'CURRENCY')
+        >>> rates_index.probe(pd.DataFrame({'CURRENCY': ['GBP', 'EUR', 'JPY']}))
+          CURRENCY  RATE
+        0      GBP   1.3
+        1      EUR   1.1
+        2      JPY   NaN
+    """
 
-    df_data.rename(
-        columns={
-            rate_field   : 'RATE_2b', #for 2-step conversion
-        }, inplace = True
-    )
+    def __init__(self, lookup_frame, right_on, keep_columns=None, keep='first'):
+        if not isinstance(right_on, list):
+            right_on = [right_on]
+        if isinstance(keep_columns, str):
+            keep_columns = [keep_columns]
 
-    def get_effective_rate(rate_1, rate_2a, rate_2b):
-        rate_1 = dh.cast_as_float(rate_1)
-        rate_2a = dh.cast_as_float(rate_2a)
-        rate_2b = dh.cast_as_float(rate_2b)
+        columns = [
+            col for col in lookup_frame.columns if keep_columns is None or col in keep_columns or col in right_on
+        ]
+        frame = lookup_frame.loc[~lookup_frame.duplicated(subset=right_on, keep=keep), columns]
+        keys = pd.MultiIndex.from_arrays([frame[col] for col in right_on])
+        if not keys.is_unique:
+            # drop_duplicates tells None and NaN keys apart, but they hash to the same key
+            unique = ~keys.duplicated(keep=keep)
+            frame = frame[unique]
+            keys = keys[unique]
 
-        if rate_1 != 0.0:
-            #We have a direct point-to-point rate between source and target
-            return rate_1
-        else:
-            #We do not have a direct point-to-point rate between source and target, so we try to pass through intermediate currency.
-            return rate_2a * rate_2b
+        self.right_on = right_on
+        self.frame = frame.reset_index(drop=True)
+        self._keys = keys
 
-    df_data[rate_field] = list(map(get_effective_rate, df_data['RATE_1'], df_data['RATE_2a'], df_data['RATE_2b']))
+    def probe(self, source_frame, left_on=None, exclude_duplicate_columns=False):
+        """Looks up each row of `source_frame` in the index
 
-    del df_data['CURRENCY_INTERMEDIATE']
-    del df_data['RATE_1']
-    del df_data['RATE_2a']
-    del df_data['RATE_2b']
+        Args:
+            source_frame (`pandas.DataFrame`): The frame containing source data
+            left_on (str or list, optional): The key column(s) of `source_frame`, in the same order as
+                `right_on`. Defaults to `right_on`
+            exclude_duplicate_columns (bool, optional): Leave out lookup columns that `source_frame` already has.
+                Defaults to `False`
 
-    if source_amount_column and target_amount_column:
-        df_data[target_amount_column] = df_data[source_amount_column] * df_data[rate_field]
+        Returns:
+            `pandas.DataFrame`: `source_frame` with the lookup columns appended, null where no key matched
+        """
+        if left_on is None:
+            left_on = self.right_on
+        if not isinstance(left_on, list):
+            left_on = [left_on]
+        if len(left_on) != len(self.right_on):
+            raise ValueError('len(right_on) must equal len(left_on)')
+
+        for left_col, right_col in zip(left_on, self.right_on):
+            left_key, right_key = source_frame[left_col], self.frame[right_col]
+            if _is_numeric_key(left_key) and is_string_dtype(right_key) or \
+                    _is_numeric_key(right_key) and is_string_dtype(left_key):
+                raise ValueError('You are trying to look up {} column {} in {} column {}'.format(
+                    left_key.dtype, left_col, right_key.dtype, right_col
+                ))
+
+        indexer = self._keys.get_indexer(pd.MultiIndex.from_arrays([source_frame[col] for col in left_on]))
+
+        value_columns = [
+            col for col in self.frame.columns
+            if col not in self.right_on and not (exclude_duplicate_columns and col in source_frame.columns)
+        ]
+        return _gather(source_frame, self.frame, indexer, value_columns)
 
-    if delete_curr_src_col:
-        del df_data['CURRENCY_SOURCE']
 
-    if delete_curr_tgt_col:
-        del df_data['CURRENCY_TARGET']
+def _is_numeric_key(series):
+    return pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
 
-    #Note, We return the effective rate that was used to do the conversion.
-    #We will also return a converted amount if a source amount was passed & target converted amount field name were passed in.
 
-    #TODO: We could send back a diagnostic field that shows HOW we arrived at the currency rate
-    #TODO: This possibly could be converted to 2 methods, one to find the rate and another to apply it, with the 2nd optionally calling the first.
-    return df_data
+def _take(series, indexer):
+    """Gathers `series` values by position, with nulls (upcasting as pandas.merge does) where `indexer` is -1"""
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    return pd.api.extensions.take(values, indexer, allow_fill=True)
 
 
 def lookup(source_frame, lookup_frame, left_on, right_on=None, keep_columns=None, exclude_duplicate_columns=False, keep="first", inplace=False):
@@ -2047,6 +2700,8 @@ def lookup(source_frame, lookup_frame, left_on, right_on=None, keep_columns=None
     left_on, right_on, keep_columns are all lists.
     Remaining optional parameters are all bool.
 
+    Builds a one-off `LookupIndex`; build one yourself to look up several frames in the same lookup frame.
+
     Args:
         source_frame (`pandas.DataFrame`): The frame containing source data
         lookup_frame (`pandas.DataFrame`): A frame containing data to look up
@@ -2056,7 +2711,7 @@ def lookup(source_frame, lookup_frame, left_on, right_on=None, keep_columns=None
         exclude_duplicate_columns (bool, optional): if duplicate columns should be excluded. Defaults
             to `False`
         keep (str, optional): Which duplicate to use, defaults to `'first'`
-        inplace (bool, optional): Should the input frame be modified? Defaults ot `False`
+        inplace (bool, optional): Unused, the lookup frame is never modified
 
     Returns:
         `pandas.DataFrame`: The results of the lookup
@@ -2065,84 +2720,8 @@ def lookup(source_frame, lookup_frame, left_on, right_on=None, keep_columns=None
     if right_on is None:
         right_on = left_on
 
-    if not isinstance(left_on, list):
-        left_on = [left_on]
-
-    if not isinstance(right_on, list):
-        right_on = [right_on]
-
-    drop_columns = []
-
-    # optional arg to remove duplicate columns from lookup table
-    if exclude_duplicate_columns is True:
-        for col in source_frame:
-            if col in lookup_frame:
-                drop_columns.append(col)
-
-    # optional arg to specify which columns in lookup table to keep
-    if keep_columns is not None:
-        for i in list(lookup_frame):
-            if i in keep_columns:
-                pass
-            else:
-                # column not being kept... append to list to drop cols
-                if i not in drop_columns:
-                    drop_columns.append(i)
-
-    # have to keep right_on match keys for lookup operation to work
-    for i in right_on:
-        if i in drop_columns:
-            drop_columns.remove(i)
-
-    # cannot modify the actual lookup frame or it will blow up the original.
-    # make a copy first.
-    trimmed_lookup_frame = lookup_frame.copy()
-
-    # drop columns from lookup table
-    if len(drop_columns) > 0:
-        trimmed_lookup_frame = drop_column(trimmed_lookup_frame, drop_columns)
-
-    # default for drop_duplicates. Effectively returns the 1st result and drops others
-    # moved to param default
-    # take_last = False
-
-    # default for drop_duplicates. drop them in place, do not return a copy
-    # moved to param default
-    # inplace = False
-
-    # ensure that lookup table is distinct based on lookup values
-    distinct_lookup_frame = distinct(trimmed_lookup_frame, right_on, keep, inplace)
-
-    df = left_join(source_frame, distinct_lookup_frame, left_on, right_on)
-
-    # for cases in which left_on != right_on, delete the right_on cols which vary
-
-    if set(left_on) != set(right_on):
-        limit = len(left_on)
-        iter = 0
-        while iter < limit:
-            if left_on[iter] != right_on[iter]:
-                try:
-                    del df[right_on[iter]]
-                except:
-                    try:
-                        # Pandas automatically adds _x and _y suffixes to data when a join causes a duplicate column.
-                        # This behavior is not desirable in the case of the plaidtools lookup function.  When this edge
-                        # case occurs, the first table's matching column and column name should be preserved and the second
-                        # table's matching column name should be dropped.
-                        col_x = right_on[iter] + '_x'
-                        col_y = right_on[iter] + '_y'
-                        del df[col_y]
-                        df.rename(
-                            columns={
-                                col_x: right_on[iter]
-                            }, inplace=True
-                        )
-                    except:
-                        pass
-            iter += 1
-
-    return df
+    lookup_index = LookupIndex(lookup_frame, right_on, keep_columns=keep_columns, keep=keep)
+    return lookup_index.probe(source_frame, left_on, exclude_duplicate_columns=exclude_duplicate_columns)
 
 
 def coalesce(first_col, *subsequent_cols, **kwargs):
@@ -2265,6 +2844,14 @@ def summarize(df, group_by_columns, summarize_columns):
             df[col] = df[col].fillna('')
             if col in summarize_columns:
                 agg_map[col] = pd.Series.nunique
+        elif isinstance(col_dtype, pd.CategoricalDtype):
+            # Categorical text is grouped and counted as is, without converting it back to objects
+            if df[col].isna().any():
+                if '' not in col_dtype.categories:
+                    df[col] = df[col].cat.add_categories('')
+                df[col] = df[col].fillna('')
+            if col in summarize_columns:
+                agg_map[col] = pd.Series.nunique
         else:
             if col in group_by_columns:
                 # All columns used in the groupby must be converted to string
@@ -2280,7 +2867,7 @@ def summarize(df, group_by_columns, summarize_columns):
                     pass
                 agg_map[col] = np.sum
 
-    return df.groupby(group_by_columns).agg(agg_map).reset_index()
+    return df.groupby(group_by_columns, observed=True).agg(agg_map).reset_index()
 
 
 def json_to_csv(json_file_name, csv_file_name, columns=None, writeheader=True):
@@ -2383,6 +2970,8 @@ def allocate(
     driver_data,                 # Specify col with driver data.
     driver_numerator_keys,        # Specify numerator join col(s).
     driver_denominator_keys,    # Specify denominator join col(s).
+    sort_by_status=True,        # Sort allocated records ahead of stranded ones.
+    split_signs=False,          # Allocate over positive and negative drivers separately.
     ):
     """Allocates a given set of input data based on a driver contained in a set of driver data, subject to
     limiting conditions. Expressed as hierarchy filters.
@@ -2396,91 +2985,351 @@ def allocate(
         driver_data (str): column containing driver values
         driver_numerator_keys (str or list): Driver data numerator join columns
         driver_denominator_keys (str or list): Driver data denominator join columns
+        sort_by_status (bool, optional): Sort the result by `alloc_status`, allocated records first. Defaults
+            to `True`; skip the sort when the order of the result does not matter
+        split_signs (bool, optional): Treat the positive and the negative driver values of each denominator as
+            separate pools, so that offsetting driver values cannot produce huge opposing splits. Input records
+            with a negative first `input_data` column are allocated over the negative pool, all others over the
+            positive pool, falling back to the other pool when the denominator has none of that sign
 
     """
-    # Remove any unused columns from the driver data
-    df_driver.drop(columns=[
-        col for col in df_driver.columns if col not in driver_numerator_keys + driver_denominator_keys + [driver_data]
-    ], inplace=True)
-
     #20180422 Make this more user-friendly.  #allocable needs to be added in if it's not already there.  It's *not* required in order to call the function.
     if 'allocable' not in df_input.columns:
         df_input['allocable'] = 1
 
-    def alloc_status(driver_value):
-        """
-        0: Stranded cost
-        1: Allocated cost
+    driver = _prepare_allocation_driver(
+        df_driver, driver_data, driver_numerator_keys, driver_denominator_keys, split_signs=split_signs
+    )
+    return _apply_allocation(df_input, driver, input_data, input_keys, sort_by_status=sort_by_status)
 
-        This is used internally in allocate()
-        """
-        if math.isnan(driver_value) or driver_value == 0:
-            return 0
-        else:
-            return 1
 
-    def shred(coeff, numerator, denominator, allocable):
-        """Apply split ratio to coefficient.
+def allocate_pipeline(logging, df_input, stages, sort_by_status=True):
+    """Runs an ordered list of allocation stages, feeding the result of each stage into the next.
 
-        Args:
-            coeff (int): The coefficient to apply a split ratio to
-            numerator (int): The numerator of the ratio
-            denominator (int): The denominator or the ratio
-            allocable (int): 1 If this is allocable.
+    Each stage is a dict holding the arguments of `allocate`: `df_driver`, `input_data`, `input_keys`,
+    `driver_data`, `driver_numerator_keys` and `driver_denominator_keys`, plus optional `split_signs`,
+    `reallocate_stranded` and `name`. Stages that use the same driver frame, driver column and keys share one
+    prepared driver, so the driver aggregation and denominators are only built once.
 
-        Returns:
-            int: The value after shredding
-        """
-        # This can be refactored to be smarter & more efficient.  Also, first if clause is new. Need to make
-        # sure it does not break something.
-        if allocable == 1:
-            if numerator < 0:
-                pass
+    Intermediate results are handed to the next stage as they are, the same as chaining `allocate` calls. The
+    `shred`, `alloc_status` and driver value columns of the previous stage are dropped, but `allocable` is kept,
+    so records stranded by an earlier stage stay stranded. Set `reallocate_stranded` on a stage to make every
+    record entering it allocable again. An `allocable` column on `df_input` is honoured by the first stage.
 
-            if math.isnan(numerator) or numerator == 0:
-                return 0
-            if math.isnan(denominator) or denominator == 0:
-                return coeff  # This is for passing stranded costs through to result set.
-            else:
-                try:
-                    return coeff * numerator / denominator
-                except ValueError:
-                    return 0
-        else:
-            # Not Allocable.  Pass input through to output.
-            return coeff
+    Args:
+        logging (logger): Logger, control totals are written to it at debug level. May be `None`
+        df_input (pandas.DataFrame): Input data frame, it is not modified
+        stages (list): The allocation stages, in order
+        sort_by_status (bool, optional): Sort the final result by `alloc_status`, allocated records first
 
-    def _clean_names(frame):
-        """
-        Delete input columns "foo__in" from frame.
-        Clean output columns "foo__out" -> "foo"
-        """
-        col_list = list(frame.columns)
+    Returns:
+        list: The allocated data frame and a data frame of control totals with one row per stage and input
+            data column: the input total, the amounts allocated and stranded, the output total and the
+            difference between output and input
 
-        for col in col_list:
-            if col.endswith('__value'):
-                del frame[col]
-            elif col.endswith('__split'):
-                frame.rename(columns={col: col[:-7]}, inplace=True)
+    Examples:
+        >>> df = pd.DataFrame({'DEPT': ['A', 'B'], 'AMOUNT': [100.0, 50.0]})
+        >>> df_heads = pd.DataFrame({'DEPT': ['A', 'A'], 'CC': ['X', 'Y'], 'HEADCOUNT': [1, 3]})
+        >>> df_sqft = pd.DataFrame({'CC': ['X', 'Y'], 'SITE': ['N', 'S'], 'SQFT': [1, 1]})
+        >>> df_result, df_control = allocate_pipeline(None, df, [
+        ...     {'name': 'heads', 'df_driver': df_heads, 'input_data': 'AMOUNT', 'input_keys': 'DEPT',
+        ...      'driver_data': 'HEADCOUNT', 'driver_numerator_keys': 'CC', 'driver_denominator_keys': 'DEPT'},
+        ...     {'name': 'space', 'df_driver': df_sqft, 'input_data': 'AMOUNT', 'input_keys': 'CC',
+        ...      'driver_data': 'SQFT', 'driver_numerator_keys': 'SITE', 'driver_denominator_keys': 'CC'},
+        ... ])
+        >>> df_result[['DEPT', 'CC', 'SITE', 'AMOUNT']]
+          DEPT   CC SITE  AMOUNT
+        0    A    Y    S    75.0
+        1    A    X    N    25.0
+        2    B  NaN  NaN    50.0
+        >>> df_control[['stage', 'input', 'allocated', 'stranded', 'difference']]
+           stage  input  allocated  stranded  difference
+        0  heads  150.0      100.0      50.0         0.0
+        1  space  150.0      100.0      50.0         0.0
+    """
+    bookkeeping = ['shred', 'alloc_status', '__DRIVER_VALUE__']
+    drivers = {}
+    controls = []
+    df_result = df_input
+    for number, stage in enumerate(stages):
+        name = stage.get('name', number)
+        input_data = stage['input_data']
+        if not isinstance(input_data, list):
+            input_data = [input_data]
+
+        numerator_keys = stage['driver_numerator_keys']
+        denominator_keys = stage['driver_denominator_keys']
+        key = (
+            id(stage['df_driver']),
+            stage['driver_data'],
+            tuple(numerator_keys) if isinstance(numerator_keys, list) else (numerator_keys,),
+            tuple(denominator_keys) if isinstance(denominator_keys, list) else (denominator_keys,),
+            stage.get('split_signs', False),
+        )
+        if key not in drivers:
+            drivers[key] = _prepare_allocation_driver(
+                stage['df_driver'], stage['driver_data'], numerator_keys, denominator_keys,
+                split_signs=stage.get('split_signs', False),
+            )
 
-        return frame
+        if number > 0:
+            drop = bookkeeping + ['allocable'] if stage.get('reallocate_stranded', False) else bookkeeping
+            df_result.drop(columns=[col for col in drop if col in df_result.columns], inplace=True)
+
+        totals = df_result[input_data].sum()
+        df_result = _apply_allocation(
+            df_result,
+            drivers[key],
+            input_data,
+            stage['input_keys'],
+            sort_by_status=sort_by_status and number == len(stages) - 1,
+        )
+
+        allocated = df_result['alloc_status'].to_numpy() == 1
+        for col in input_data:
+            values = df_result[col].to_numpy(dtype=float)
+            control = {
+                'stage': name,
+                'column': col,
+                'input': float(totals[col]),
+                'allocated': float(np.nansum(values[allocated])),
+                'stranded': float(np.nansum(values[~allocated])),
+            }
+            control['output'] = control['allocated'] + control['stranded']
+            control['difference'] = control['output'] - control['input']
+            controls.append(control)
+            if logging:
+                logging.debug(
+                    'Control total: stage {} {} input:output {} : {}'.format(
+                        name, col, control['input'], control['output']
+                    )
+                )
 
-    #OUTPUT_PATH_EXCEL = 'C:/UBS/Dev/models/debug/allocate.xlsx'
-    #xlsx = pd.ExcelWriter(OUTPUT_PATH_EXCEL)
+    df_control = pd.DataFrame(
+        controls, columns=['stage', 'column', 'input', 'allocated', 'stranded', 'output', 'difference']
+    )
+    return [df_result, df_control]
+
+
+def allocate_partitioned(
+    logging,
+    df_input,
+    df_driver,
+    input_data,
+    input_keys,
+    driver_data,
+    driver_numerator_keys,
+    driver_denominator_keys,
+    partitions=16,
+    processes=None,
+    spill_dir=None,
+    output_path=None,
+    chunk_rows=1000000,
+    sort_by_status=True,
+    split_signs=False,
+):
+    """Allocates input data too large for memory, one hash partition of the denominator keys at a time
 
-    #0.) Set nan driver values to zero
-    #df_driver[driver_data].fillna(0, inplace=True) #Not this
+    The input and the driver are read a chunk at a time, hash partitioned on `input_keys` and
+    `driver_denominator_keys` respectively and spilled to local Parquet files. Every denominator falls
+    entirely within one partition, so each partition is allocated on its own, in sequence or in a pool of
+    `processes` worker processes, and only one partition per worker needs to be in memory.
 
-    original_driver_col = driver_data
-    driver_data = '__DRIVER_VALUE__'
-    df_driver.rename(columns={
-        original_driver_col: driver_data
-    }, inplace=True)
-    df_driver = df_driver[(np.isfinite(df_driver[driver_data])) & (df_driver[driver_data] != 0)]
+    Args:
+        logging (logger): Logger, partition progress is written to it at debug level. May be `None`
+        df_input (pandas.DataFrame, str or iterable): Input data, as a frame, the path of a Parquet file or an
+            iterable of frames
+        df_driver (pandas.DataFrame, str or iterable): Driver data, in any of the forms of `df_input`
+        input_data (str or list): column(s) of input data that should be allocated
+        input_keys (str or list): column(s) in input data to be joined with driver data
+        driver_data (str): column containing driver values
+        driver_numerator_keys (str or list): Driver data numerator join columns
+        driver_denominator_keys (str or list): Driver data denominator join columns
+        partitions (int, optional): Number of hash partitions
+        processes (int, optional): Number of worker processes, partitions are allocated in sequence in this
+            process if `None` or 1
+        spill_dir (str, optional): Directory to spill partitions to, a temporary directory if `None`. Spilled
+            files are removed once the allocation is done
+        output_path (str, optional): Directory to write each allocated partition to as a Parquet file, rather
+            than returning one frame of all of them
+        chunk_rows (int, optional): Rows to read at a time from a Parquet file
+        sort_by_status (bool, optional): Sort the result by `alloc_status`. Ignored with `output_path`
+        split_signs (bool, optional): Pool positive and negative driver values separately, see `allocate`
+
+    Returns:
+        pandas.DataFrame or list: The allocated data, as `allocate` would return it but for the order of the
+            records and the index, or the paths of the files written to `output_path`
+    """
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as exc:
+        raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
 
     if not isinstance(input_keys, list):
         input_keys = [input_keys]
 
+    if not isinstance(driver_denominator_keys, list):
+        driver_denominator_keys = [driver_denominator_keys]
+
+    with tempfile.TemporaryDirectory(dir=spill_dir) as spill:
+        input_files, input_empty = _spill_partitions(
+            df_input, input_keys, partitions, spill, 'input', chunk_rows,
+            input_keys, input_data if isinstance(input_data, list) else [input_data],
+        )
+        driver_files, driver_empty = _spill_partitions(
+            df_driver, driver_denominator_keys, partitions, spill, 'driver', chunk_rows,
+            (driver_numerator_keys if isinstance(driver_numerator_keys, list) else [driver_numerator_keys])
+            + driver_denominator_keys, [driver_data],
+        )
+
+        if output_path:
+            os.makedirs(output_path, exist_ok=True)
+
+        tasks = [
+            (
+                input_files[partition],
+                driver_files[partition] or [driver_empty],
+                input_data,
+                input_keys,
+                driver_data,
+                driver_numerator_keys,
+                driver_denominator_keys,
+                split_signs,
+                os.path.join(output_path, f'part-{partition:05d}.parquet') if output_path else None,
+            )
+            for partition in range(partitions)
+            if input_files[partition]
+        ]
+        if not tasks and not output_path:
+            # Nothing to allocate, but the result still has the columns `allocate` gives an empty input
+            tasks = [(
+                [input_empty], [driver_empty], input_data, input_keys, driver_data, driver_numerator_keys,
+                driver_denominator_keys, split_signs, None,
+            )]
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_allocate_partition, tasks))
+        else:
+            results = []
+            for task in tasks:
+                if logging:
+                    logging.debug('Allocating partition {}'.format(os.path.basename(task[0][0])))
+                results.append(_allocate_partition(task))
+
+    if output_path:
+        return results
+
+    df_result = pd.concat(results, ignore_index=True)
+    if sort_by_status:
+        df_result = df_result.sort_values(by=['alloc_status'], ascending=[False])
+    return df_result
+
+
+def _frame_chunks(data, chunk_rows):
+    """Yields a frame, the frames of an iterable or the record batches of a Parquet file as frames"""
+    if isinstance(data, pd.DataFrame):
+        yield data
+    elif isinstance(data, (str, os.PathLike)):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(data).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from data
+
+
+def _partition_numbers(frame, keys, partitions):
+    """The hash partition of each record of `frame`, from the values of its `keys`
+
+    Numbers are hashed as floats and everything else as text, with nulls as the blank `dh.cast_as_str` makes
+    of them, so that keys `allocate` would join end up in the same partition.
+    """
+    normalized = {}
+    for key in keys:
+        values = frame[key]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            normalized[key] = values.astype(float).to_numpy()
+        else:
+            normalized[key] = values.astype(object).where(values.notna(), ' ').astype(str).to_numpy()
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy()
+    return hashes % np.uint64(partitions)
+
+
+def _spill_partitions(data, keys, partitions, directory, name, chunk_rows, text_columns, number_columns):
+    """Writes the records of `data` to one Parquet file per chunk and partition
+
+    `data` with no chunks at all is taken to have `text_columns` of text and `number_columns` of numbers.
+
+    Returns:
+        tuple: The files of each partition, and a file with no records but the columns of `data`
+    """
+    files = [[] for _ in range(partitions)]
+    empty = os.path.join(directory, f'{name}-empty.parquet')
+    has_chunks = False
+    for chunk_number, chunk in enumerate(_frame_chunks(data, chunk_rows)):
+        if not has_chunks:
+            has_chunks = True
+            chunk.iloc[:0].to_parquet(empty, index=False)
+        if not len(chunk):
+            continue
+        numbers = _partition_numbers(chunk, keys, partitions)
+        order = np.argsort(numbers, kind='stable')
+        bounds = np.searchsorted(numbers[order], np.arange(partitions + 1, dtype=np.uint64))
+        for partition in range(partitions):
+            start, stop = bounds[partition], bounds[partition + 1]
+            if start == stop:
+                continue
+            path = os.path.join(directory, f'{name}-{partition:05d}-{chunk_number:06d}.parquet')
+            chunk.take(order[start:stop]).to_parquet(path, index=False)
+            files[partition].append(path)
+
+    if not has_chunks:
+        pd.DataFrame({
+            **{col: pd.Series(dtype=object) for col in text_columns},
+            **{col: pd.Series(dtype=np.float64) for col in number_columns},
+        }).to_parquet(empty, index=False)
+    return files, empty
+
+
+def _allocate_partition(task):
+    """Allocates one spilled partition, the unit of work of `allocate_partitioned`"""
+    (
+        input_files, driver_files, input_data, input_keys, driver_data, driver_numerator_keys,
+        driver_denominator_keys, split_signs, output_file,
+    ) = task
+
+    df_input = pd.concat([pd.read_parquet(path) for path in input_files], ignore_index=True)
+    df_driver = pd.concat([pd.read_parquet(path) for path in driver_files], ignore_index=True)
+    if 'allocable' not in df_input.columns:
+        df_input['allocable'] = 1
+
+    driver = _prepare_allocation_driver(
+        df_driver, driver_data, driver_numerator_keys, driver_denominator_keys, split_signs=split_signs
+    )
+    df_result = _apply_allocation(df_input, driver, input_data, input_keys, sort_by_status=False)
+
+    if output_file:
+        df_result.to_parquet(output_file, index=False)
+        return output_file
+    return df_result
+
+
+def _prepare_allocation_driver(df_driver, driver_data, driver_numerator_keys, driver_denominator_keys, split_signs=False):
+    """Aggregates a driver frame into splits and denominators, ready to be applied by `_apply_allocation`
+
+    The driver frame is not modified, so a prepared driver can be shared between allocations.
+
+    Args:
+        df_driver (pandas.Dataframe): Driver data frame
+        driver_data (str): column containing driver values
+        driver_numerator_keys (str or list): Driver data numerator join columns
+        driver_denominator_keys (str or list): Driver data denominator join columns
+        split_signs (bool, optional): Pool the positive and the negative driver values of each denominator
+            separately
+
+    Returns:
+        dict: The aggregated driver, the split sums by denominator and the names of the driver columns
+    """
     if not isinstance(driver_numerator_keys, list):
         driver_numerator_keys = [driver_numerator_keys] #If a single column is specified, convert to 1-item list.
 
@@ -2491,6 +3340,16 @@ def allocate(
     driver_numerator_and_denominator_keys.extend(driver_numerator_keys)
     driver_numerator_and_denominator_keys.extend(driver_denominator_keys)
 
+    #0.) Remove any unused columns from the driver data and set aside the driver values
+    original_driver_col = driver_data
+    driver_data = '__DRIVER_VALUE__'
+    df_driver = df_driver[[
+        col for col in df_driver.columns if col in driver_numerator_and_denominator_keys + [original_driver_col]
+    ]].rename(columns={
+        original_driver_col: driver_data
+    })
+    df_driver = df_driver[(np.isfinite(df_driver[driver_data])) & (df_driver[driver_data] != 0)]
+
     #0.1) Build table w/ numerators...should be same as input table unless
     #      We are summarizing to get to numerator level.
 
@@ -2506,17 +3365,19 @@ def allocate(
             else:
                 lookup_passthrough.append(item)
 
-        if len(df_driver) > 0 and item in driver_numerator_and_denominator_keys and is_string_dtype(df_driver[item]):
+        # categorical keys are kept as they are, grouping them exactly as the text they stand for
+        if len(df_driver) > 0 and item in driver_numerator_and_denominator_keys and is_string_dtype(df_driver[item]) \
+                and not isinstance(df_driver[item].dtype, pd.CategoricalDtype):
             # cast null string values to string so that subsequent groupby statement doesn't drop records
-            df_driver[item] = list(map(dh.cast_as_str, df_driver[item]))
+            df_driver[item] = dh.cast_as_str_series(df_driver[item])
 
     #This is for safely (without any chance of dupes or buggering up our primary group-by) passing through extra masterdata string columns.
     lookup_passthrough.extend(driver_numerator_and_denominator_keys)
-    df_lookup_passthrough_masterdata = df_driver.groupby(lookup_passthrough).agg({driver_data: 'sum'}).reset_index()
+    df_lookup_passthrough_masterdata = df_driver.groupby(lookup_passthrough, observed=True).agg({driver_data: 'sum'}).reset_index()
 
     #20180422 https://stackoverflow.com/questions/44123874/dataframe-object-has-no-attribute-sort
     df_driver = df_driver.groupby(
-        driver_numerator_and_denominator_keys
+        driver_numerator_and_denominator_keys, observed=True
         ).agg(
             agg_items
         ).sort_values(
@@ -2540,15 +3401,20 @@ def allocate(
         exclude_duplicate_columns=True
     )
 
-    # TODO: WE REALLY NEED TO SPLIT AND HANDLE POSITIVES AND NEGATIVES SEPARATELY OR IT WILL BITE US HARD SOME DAY!
     # One split = 1,000,000. Another = -999,999. Driver Value = 1,000,000 + -999,999. Allocate a dollar and
     # get 1,000,000 to cost object A and -999,999 to cost object B.  This is bad.
-    # This split would possibly start here in the code. Has to be throught through.
+    # With split_signs the sign of each numerator becomes part of the denominator, so positives and negatives
+    # are separate pools with splits between 0 and 1.
+    sign = None
+    if split_signs:
+        sign = '__DRIVER_SIGN__'
+        df_driver[sign] = np.where(df_driver[driver_data].to_numpy(dtype=float) < 0, -1, 1)
+        driver_denominator_keys = driver_denominator_keys + [sign]
 
 
     #1.) Build denominators by creating summary table by join columns
     df_denominators = df_driver.groupby(
-        driver_denominator_keys
+        driver_denominator_keys, observed=True
     ).agg(
         {
             driver_data: 'sum',
@@ -2560,27 +3426,11 @@ def allocate(
         ascending=[0]
     ).reset_index()
 
-    # 2.) Check driver sum
-    #pre_sum = df_driver[driver_data].sum()
-    #post_sum = df_denominators[driver_data].sum()
-    #logging.debug('\nControl total: driver pre:post sum ' + num(pre_sum) + ' : ' + num(post_sum))
-    #logging.debug(get_text_table(df_denominators, 5, 'df_denominators'))
-
-    # 3.) Cost control total
-    if not isinstance(input_data, list):
-        input_data = [input_data]
-
-    #for col in input_data:
-    #    logging.debug('\nControl total: input to allocate ' + col + ': '+ num(df_input[col].sum()))
-
-    #if not isinstance(driver_numerator_keys, list):
-        #driver_numerator_keys = [driver_numerator_keys]
-
-    # 4.) Rename numerators (driver data) to "split"
+    # 2.) Rename numerators (driver data) to "split"
     driver_split = driver_data + '__split'
     df_driver.rename(columns={driver_data: driver_split}, inplace=True)
 
-    # 5.) Join denominators
+    # 3.) Join denominators
     df_driver = lookup(
         df_driver,
         df_denominators,
@@ -2599,44 +3449,127 @@ def allocate(
         driver_cols
     ]
 
-    #logging.debug('\nDriver Table w n/d splits...')
-    #logging.debug(get_text_table(df_driver, 5, 'df_result'))
-
-    #logging.debug('#5.) Join denominators')
-    #logging.debug(get_text_table(df_driver, 5, 'drivers'))
-    #logging.debug('Control total: numerators: ' + num(df_driver[driver_split].sum()))
-
-    #7.) Only consider input records with keys matching allocable cost pools & driver split sums <> 0.
-
-    #20150330 Could add 2nd condition check to say "If you don't have any non-zero driver data, you sir are NOT allocable.
-
-
-    #TODO 1 : Temporarily add '__split_check_sum' column to df_input.  Look it up from df_temp_check.
-    #         Lookup is on driver_denominator_keys
-
+    #4.) Split sums by denominator, used to tell which input records have anything to be allocated to.
     df_driver_split_sum = df_driver.groupby(
-        driver_denominator_keys
+        driver_denominator_keys, observed=True
         ).agg(
             {
                 driver_split: 'sum'
             }
         ).reset_index()
 
-    #TODO 2 : Turn this pseudo-code into real code:
+    return {
+        'driver': df_driver,
+        'split_sum': df_driver_split_sum,
+        'split': driver_split,
+        'value': driver_value,
+        'denominator_keys': driver_denominator_keys,
+        'sign': sign,
+    }
+
+
+def _apply_allocation(df_input, driver, input_data, input_keys, sort_by_status=True):
+    """Allocates input data with a driver prepared by `_prepare_allocation_driver`
+
+    Args:
+        df_input (pandas.Dataframe): Input data frame
+        driver (dict): The prepared driver
+        input_data (str or list): column(s) of input data that should be allocated
+        input_keys (str or list): column(s) in input data to be joined with driver data
+        sort_by_status (bool, optional): Sort the result by `alloc_status`, allocated records first
+
+    Returns:
+        pandas.DataFrame: The allocated data
+    """
+    def alloc_status(driver_value):
+        """
+        0: Stranded cost
+        1: Allocated cost
+
+        This is used internally in allocate()
+        """
+        driver_value = driver_value.to_numpy(dtype=float)
+        return np.where(np.isnan(driver_value) | (driver_value == 0), 0, 1)
+
+    def shred(numerator, denominator, allocable):
+        """Split ratio of each record.
+
+        Args:
+            numerator (pandas.Series): The numerator of the ratio
+            denominator (pandas.Series): The denominator or the ratio
+            allocable (pandas.Series): 1 If this is allocable.
+
+        Returns:
+            numpy.ndarray: The split ratio, integer unless some record is actually split
+        """
+        numerator = numerator.to_numpy(dtype=float)
+        denominator = denominator.to_numpy(dtype=float)
+        allocable = (allocable == 1).to_numpy(dtype=bool)
+
+        stranded = np.isnan(denominator) | (denominator == 0)  # passed through to the result set
+        no_driver = np.isnan(numerator) | (numerator == 0)
+        split = allocable & ~no_driver & ~stranded
+        ratio = np.where(allocable & no_driver, 0, 1)
+        if split.any():
+            ratio = ratio.astype(float)
+            ratio[split] = numerator[split] / denominator[split]
+        return ratio
+
+    def _clean_names(frame):
+        """
+        Delete input columns "foo__in" from frame.
+        Clean output columns "foo__out" -> "foo"
+        """
+        col_list = list(frame.columns)
+
+        for col in col_list:
+            if col.endswith('__value'):
+                del frame[col]
+            elif col.endswith('__split'):
+                frame.rename(columns={col: col[:-7]}, inplace=True)
+
+        return frame
+
+    df_driver = driver['driver']
+    driver_split = driver['split']
+    driver_value = driver['value']
+    driver_denominator_keys = driver['denominator_keys']
+
+    if not isinstance(input_keys, list):
+        input_keys = [input_keys]
+
+    if not isinstance(input_data, list):
+        input_data = [input_data]
+
+    sign = driver['sign']
+    if sign:
+        df_input = df_input.assign(**{
+            sign: _allocation_signs(df_input, driver, input_data[0])
+        })
+        input_keys = input_keys + [sign]
+
+    #5.) Only consider input records with keys matching allocable cost pools & driver split sums <> 0.
+
+    #20150330 Could add 2nd condition check to say "If you don't have any non-zero driver data, you sir are NOT allocable.
+
     df_input = lookup(
         df_input,
-        df_driver_split_sum,
+        driver['split_sum'],
         driver_denominator_keys,
         driver_denominator_keys,
         keep_columns=[driver_split],
         exclude_duplicate_columns=True
-    ) #19714,311
+    )
 
-    # Beware any soul who enters here.  If ye seek refactor, test ye NaN driver_split.
+    if 'allocable' not in df_input.columns:
+        df_input['allocable'] = 1
 
-    #df_temp_delete = df_input(math.isnan(df_input[driver_split]))
+    df_driver = df_driver.copy(deep=False)  # the prepared driver may be shared, so only this copy is recoded
+    _share_categories(df_input, df_driver, input_keys, driver_denominator_keys)
 
-    df_input[driver_split] = list(map(dh.cast_as_float, df_input[driver_split]))
+    # Beware any soul who enters here.  If ye seek refactor, test ye NaN driver_split.
+
+    df_input[driver_split] = dh.cast_as_float_series(df_input[driver_split])
     df_input_allocable = df_input[(df_input['allocable'] == True) & (df_input[driver_split] != 0)]
     df_input_not_allocable = df_input[(df_input['allocable'] == False) | (df_input[driver_split] == 0)]
 
@@ -2645,12 +3578,9 @@ def allocate(
     del df_input_allocable[driver_split]
     del df_input_not_allocable[driver_split]
 
-    #TODO 3 : Drop our '__split_check_sum'.
-
-    # TODO: At some point, we need to separate negative driver data from positive driver data, and
-    # handle it appropriately.  Right now, mix of negative and positive driver data would really foul things
-    # up. Not important when drive = email count, but it'd eventually bite us.
-    # 8.) Join driver data to input costs
+    # Without split_signs a mix of negative and positive driver data would really foul things up. Not
+    # important when drive = email count, but it'd eventually bite us.
+    # 6.) Join driver data to input costs
 
     df_result = left_join(
         df_input_allocable,
@@ -2659,39 +3589,54 @@ def allocate(
         driver_denominator_keys,
     )
 
-    # 9.) Glue together allocable results and unallocable-by-design input data
+    # 7.) Glue together allocable results and unallocable-by-design input data
     df_result = pd.concat([df_result, df_input_not_allocable])
 
-    # 10.) Allocate costs
-    # result_checksum_columns = input_keys
+    # 8.) Allocate costs
 
     #21051118 New Goodness Starts here.  We're going to shred ONE thing, (all ones) and multiply this new shred coefficient X all of
     # the cols we wish to shred.
-    df_result['shred'] = 1
-    df_result['shred'] = list(map(
-        shred,
-        df_result['shred'],
-        df_result[driver_split],
-        df_result[driver_value],
-        df_result['allocable']
-    ))
-    #May not need this
-    axis = list(set(df_result.columns) - set(input_data) - {'shred'})
-    #df_result.set_index(axis)
-    #df_result_2 = df_result.copy(deep=True)
+    df_result['shred'] = shred(df_result[driver_split], df_result[driver_value], df_result['allocable'])
     df_result[input_data] = df_result[input_data].multiply(df_result['shred'], axis='index')
 
-    df_result['alloc_status'] = list(map(alloc_status, df_result[driver_value]))
+    df_result['alloc_status'] = alloc_status(df_result[driver_value])
+    if sign:
+        del df_result[sign]
 
-    #df_result = df_result.sort_index(by=['alloc_status'], ascending=[False])
-
-    df_result = df_result.sort_values(by=['alloc_status'], ascending=[False])
+    if sort_by_status:
+        df_result = df_result.sort_values(by=['alloc_status'], ascending=[False])
 
     df_result = _clean_names(df_result)
 
     return df_result
 
 
+def _allocation_signs(df_input, driver, amount_column):
+    """The driver pool each input record is allocated over when splitting signs
+
+    Negative amounts go to the negative pool of their denominator and all others to the positive pool, unless
+    the denominator only has a pool of the other sign.
+
+    Args:
+        df_input (pandas.Dataframe): Input data frame
+        driver (dict): The driver prepared with `split_signs`
+        amount_column (str): The input column whose sign picks the pool
+
+    Returns:
+        numpy.ndarray: 1 or -1 for each input record
+    """
+    sign = driver['sign']
+    keys = driver['denominator_keys']
+    amounts = pd.to_numeric(df_input[amount_column], errors='coerce').to_numpy(dtype=float)
+    preferred = np.where(amounts < 0, -1, 1)
+
+    pools = LookupIndex(driver['split_sum'], keys, keep_columns=[driver['split']])
+    df_keys = df_input[keys[:-1]].reset_index(drop=True)
+    df_keys[sign] = preferred
+    splits = pools.probe(df_keys)[driver['split']].to_numpy(dtype=float)
+    return np.where(np.isnan(splits) | (splits == 0), -preferred, preferred)
+
+
 def save(frame, name, conn=None, append=False, chunk_size=500000):
     """Saves the frame to the specified name
 
@@ -2719,7 +3664,7 @@ def save(frame, name, conn=None, append=False, chunk_size=500000):
     t = Table(conn, name, columns=[
         {
             'id': col,
-            'dtype': analyze_type(dtype)
+            'dtype': analyze_type(dh.storage_dtype(dtype))
         }
         for col, dtype in zip(frame.columns, frame.dtypes)
     ])
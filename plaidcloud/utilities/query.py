@@ -1,9 +1,15 @@
 import base64
+import copy
+import gzip
 import logging
 import os
 import tempfile
+import threading
+import time
 import uuid
 import csv
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, overload, NamedTuple
 
 import pandas as pd
@@ -34,6 +40,13 @@ __email__ = 'paul.morel@tartansolutions.com'
 logger = logging.getLogger(__name__)
 SCHEMA_PREFIX = 'anlz'
 TABLE_PREFIX = 'analyzetable_'
+# Parquet uploads are encoded in memory up to this size, then spilled to a temporary file.
+_UPLOAD_SPILL_BYTES = 64 * 1024 * 1024
+_UPLOAD_POOL_MAXSIZE = 10
+# Seconds that table ids and column metadata are reused before they are fetched again.
+_METADATA_TTL = 300
+# Compiled statements kept per connection.
+_COMPILED_CACHE_SIZE = 512
 
 # We must override the default pandas na values to disallow 'NA'.
 # We are doing this by setting our own list, rather than using pandas.io.common._NA_VALUES in
@@ -54,8 +67,14 @@ class UDFParams(NamedTuple):
 class Connection:
 
     _NOT_LOADED = object()
+    # Cached in place of a compiled statement whose SQL has to be rendered per call.
+    _RENDER_POSTCOMPILE = object()
 
-    def __init__(self, project: str = None, rpc: [Connect, PlaidXLConnect] = None, dialect: str = None):
+    def __init__(
+        self, project: str = None, rpc: [Connect, PlaidXLConnect] = None, dialect: str = None,
+        upload_pool_size: int = _UPLOAD_POOL_MAXSIZE, upload_compression: str = None,
+        metadata_ttl: float = _METADATA_TTL, log_sql: bool = False,
+    ):
         """
 
         Args:
@@ -66,7 +85,30 @@ class Connection:
                 carries it on the run payload as ``datastore_dialect`` — passes it here, and
                 that value wins. Omitted, it is resolved from the project over RPC
                 (sc-23158 WS-J4).
+            upload_pool_size (int, optional): Number of kept-alive connections in the pooled
+                session that data uploads share.
+            upload_compression (str, optional): 'gzip' or 'zstd' to compress upload request
+                bodies. The server must accept that `Content-Encoding`. 'zstd' requires the
+                `zstandard` package.
+            metadata_ttl (float, optional): Seconds to reuse a table's id and column metadata
+                before asking the server again. 0 or None turns the cache off.
+            log_sql (bool, optional): Log each compiled statement at INFO. Otherwise it is
+                logged at DEBUG.
         """
+        if upload_compression not in (None, 'gzip', 'zstd'):
+            raise ValueError(f'Unsupported upload compression {upload_compression!r}')
+        self._upload_pool_size = upload_pool_size
+        self._upload_compression = upload_compression
+        self._upload_http = None
+        self._upload_http_lock = threading.Lock()
+        self._metadata_ttl = metadata_ttl
+        self._table_meta_cache = {}
+        self._table_id_cache = {}
+        self._metadata_lock = threading.Lock()
+        self.log_sql = log_sql
+        self._compiled_cache = OrderedDict()
+        self._compiled_cache_lock = threading.Lock()
+
         if rpc:
             self.rpc = rpc
         else:
@@ -150,14 +192,49 @@ class Connection:
 
     def _compiled(self, sa_query):
         """Returns SQL query for datastore dialect, in the form of a string, given a
-        sqlalchemy query. Also returns a params dict."""
-        compiled_query = sa_query.compile(dialect=self.dialect, compile_kwargs={"render_postcompile": True})
-        logger.info(self.dialect.name)
-        logger.info(str(compiled_query))
-        # Flatten to one line with a SPACE, not '': dropping the newline outright
-        # welds tokens across clause boundaries on multi-line SQL (`"col"FROM`,
-        # `aliasJOIN`), producing invalid SQL.
-        return str(compiled_query).replace('\n', ' '), compiled_query.params
+        sqlalchemy query. Also returns a params dict.
+
+        Statements are cached by SQLAlchemy's cache key and the dialect, so a query that only
+        differs in its bound values is compiled once and gets its own values back each time."""
+        cache_key = sa_query._generate_cache_key()
+        entry = None
+        if cache_key is not None:
+            lookup = (cache_key.key, self.dialect.name)
+            with self._compiled_cache_lock:
+                entry = self._compiled_cache.get(lookup)
+                if entry is not None:
+                    self._compiled_cache.move_to_end(lookup)
+
+            if entry is None:
+                compiled_query = sa_query.compile(dialect=self.dialect, cache_key=cache_key)
+                # Expanding (IN) and literal-execute parameters are rendered into the SQL, so
+                # its text depends on the values and cannot be shared. Remember that, so later
+                # calls skip straight to the per-call render below.
+                if compiled_query.post_compile_params or compiled_query.literal_execute_params:
+                    entry = self._RENDER_POSTCOMPILE
+                else:
+                    # Flatten to one line with a SPACE, not '': dropping the newline outright
+                    # welds tokens across clause boundaries on multi-line SQL (`"col"FROM`,
+                    # `aliasJOIN`), producing invalid SQL.
+                    entry = (str(compiled_query).replace('\n', ' '), compiled_query)
+                with self._compiled_cache_lock:
+                    self._compiled_cache[lookup] = entry
+                    if len(self._compiled_cache) > _COMPILED_CACHE_SIZE:
+                        self._compiled_cache.popitem(last=False)
+
+        if entry is not None and entry is not self._RENDER_POSTCOMPILE:
+            query_string, compiled_query = entry
+            # _check=False matches `Compiled.params`: binds without a value come back as None.
+            params = compiled_query.construct_params(extracted_parameters=cache_key.bindparams, _check=False)
+        else:
+            compiled_query = sa_query.compile(dialect=self.dialect, compile_kwargs={"render_postcompile": True})
+            query_string, params = str(compiled_query).replace('\n', ' '), compiled_query.params
+
+        level = logging.INFO if self.log_sql else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, self.dialect.name)
+            logger.log(level, query_string)
+        return query_string, params
 
     def get_csv(self, table: "str|Table", encoding="utf-8", clean=False):
         """Returns a file path to the entire table as a CSV file.
@@ -176,27 +253,7 @@ class Connection:
             table = Table(self, table[1:-1], sa_meta)
 
         if clean:
-            if len(table.columns) == 0:
-                raise Exception('The table is not created in the database')
-
-            if encoding != 'utf-8':
-                sa_query = sqlalchemy.select(
-                    *[sqlalchemy.func.convert(
-                        sqlalchemy.func.replace(
-                            col, '\\n', ''
-                        ),
-                        f'utf8_to_{encoding.replace("-", "_").lower()}'
-                    ).label(col.name) if isinstance(col.type, sqlalchemy.String) else col
-                    for col in table.columns]
-                )
-            else:
-                sa_query = sqlalchemy.select(
-                    *[sqlalchemy.func.replace(
-                        col, '\\n', ''
-                    ).label(col.name) if isinstance(col.type, sqlalchemy.String) else col
-                    for col in table.columns]
-                )
-            query, params = self._compiled(sa_query)
+            query, params = self._compiled(self._clean_select(table, encoding))
             return self.rpc.analyze.query.download_csv(
                 project_id=self._project_id,
                 query=query,
@@ -208,6 +265,29 @@ class Connection:
             table_name=self.dialect.identifier_preparer.format_table(table),
         )
 
+    @staticmethod
+    def _clean_select(table: "Table", encoding="utf-8"):
+        """Returns a select over `table` with newlines stripped from its string columns."""
+        if len(table.columns) == 0:
+            raise Exception('The table is not created in the database')
+
+        if encoding != 'utf-8':
+            return sqlalchemy.select(
+                *[sqlalchemy.func.convert(
+                    sqlalchemy.func.replace(
+                        col, '\\n', ''
+                    ),
+                    f'utf8_to_{encoding.replace("-", "_").lower()}'
+                ).label(col.name) if isinstance(col.type, sqlalchemy.String) else col
+                for col in table.columns]
+            )
+        return sqlalchemy.select(
+            *[sqlalchemy.func.replace(
+                col, '\\n', ''
+            ).label(col.name) if isinstance(col.type, sqlalchemy.String) else col
+            for col in table.columns]
+        )
+
     def get_csv_by_query(self, query, params=None) -> str:
         """Returns a file path to the query results as a CSV file."""
         if isinstance(query, str):
@@ -221,39 +301,108 @@ class Connection:
             params=params,
         )
 
-    def get_iterator(self, table, preserve_nulls=True):
-        """Returns a generator that yields each row as a dict."""
+    def get_parquet(self, table: "str|Table", clean=False) -> str:
+        """Returns a file path to the entire table in a columnar (Parquet or Arrow IPC) file.
+
+        Args:
+            table (str|Table): The table's full name, in "schema"."table" format, or a Table Object
+            clean (bool, optional): If set to True, will remove newlines from string columns.
+
+        Returns:
+            The columnar file streamed from PlaidCloud
+        """
+        if isinstance(table, str):
+            schema, table = table.split('.')
+            table = Table(self, table[1:-1], sqlalchemy.MetaData())
+
+        if clean:
+            query, params = self._compiled(self._clean_select(table))
+            return self.rpc.analyze.query.download_dataframe(
+                project_id=self._project_id,
+                query=query,
+                params=params,
+            )
+
+        return self.rpc.analyze.query.download_dataframe(
+            project_id=self._project_id,
+            table_name=self.dialect.identifier_preparer.format_table(table),
+        )
+
+    def get_parquet_by_query(self, query, params=None) -> str:
+        """Returns a file path to the query results in a columnar (Parquet or Arrow IPC) file."""
+        if isinstance(query, str):
+            query_string = query
+        else:
+            query_string, params = self._compiled(query)
+
+        return self.rpc.analyze.query.download_dataframe(
+            project_id=self._project_id,
+            query=query_string,
+            params=params,
+        )
+
+    def get_iterator(self, table, preserve_nulls=True, batch_rows=None):
+        """Returns a generator that yields each row as a dict.
+
+        Args:
+            table (Table): The table to read
+            preserve_nulls (bool, optional): Keep missing values as None rather than converting them
+            batch_rows (int, optional): If set, convert this many rows at a time, a column at a
+                                        time, rather than converting each cell as it is read
+        """
+        if batch_rows:
+            return self._csv_stream_batched(self.get_csv(table), table.columns, preserve_nulls, batch_rows)
         return self._csv_stream(self.get_csv(table), table.columns, preserve_nulls)
 
-    def get_iterator_by_query(self, sa_query, preserve_nulls=True):
+    def get_iterator_by_query(self, sa_query, preserve_nulls=True, batch_rows=None):
         """Returns a generator that yields each row as a dict."""
         query, params = self._compiled(sa_query)
+        if batch_rows:
+            return self._csv_stream_batched(self.get_csv_by_query(query, params), sa_query.selected_columns, preserve_nulls, batch_rows)
         return self._csv_stream(self.get_csv_by_query(query, params), sa_query.selected_columns, preserve_nulls)
 
     def _csv_stream(self, file_name, columns, preserve_nulls):
         type_lookup = {c.name: c.type for c in columns}
-        with open(file_name, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
+        with open(file_name, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if header is None:
+                return
+            # Resolve each column's conversion once, rather than per cell.
+            plan = [_csv_converter(type_lookup.get(name), preserve_nulls) for name in header]
+            width = len(header)
             for row in reader:
-                for k, v in row.items():
-                    # Keep the value as None if we want to preserve nulls.
-                    if preserve_nulls and v is None:
-                        pass
-                    elif isinstance(type_lookup[k], sqlalchemy.types.Numeric):
-                        row[k] = float(v or 0)
-                    elif isinstance(type_lookup[k], sqlalchemy.types.Integer):
-                        row[k] = int(v or 0)
-                    elif any((
-                        isinstance(type_lookup[k], sqlalchemy.types.DateTime),
-                        isinstance(type_lookup[k], PlaidDate),
-                        isinstance(type_lookup[k], sqlalchemy.types.Date),
-                        isinstance(type_lookup[k], sqlalchemy.types.Time),
-                    )):
-                        row[k] = pd.to_datetime(v)
-                    elif isinstance(type_lookup[k], sqlalchemy.types.Interval):
-                        row[k] = pd.to_timedelta(v)
-
-                yield row
+                if not row:
+                    continue
+                if len(row) < width:
+                    row = row + [None] * (width - len(row))
+                yield {name: convert(v) for name, convert, v in zip(header, plan, row)}
+
+    def _csv_stream_batched(self, file_name, columns, preserve_nulls, batch_rows=10000):
+        """As `_csv_stream`, but converts `batch_rows` rows at a time, a whole column per call."""
+        type_lookup = {c.name: c.type for c in columns}
+        with open(file_name, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if header is None:
+                return
+            plan = [_csv_batch_converter(type_lookup.get(name), preserve_nulls) for name in header]
+            width = len(header)
+            while True:
+                batch = []
+                for row in reader:
+                    if not row:
+                        continue
+                    if len(row) < width:
+                        row = row + [None] * (width - len(row))
+                    batch.append(row)
+                    if len(batch) >= batch_rows:
+                        break
+                if not batch:
+                    return
+                converted = [convert(list(values)) for convert, values in zip(plan, zip(*batch))]
+                for values in zip(*converted):
+                    yield dict(zip(header, values))
 
     def get_data(self, data_source: "Table|str|sqlalchemy.sql.Select", return_type='df', encoding='utf-8', clean=True) -> "str|pd.DataFrame":
         if return_type == 'df':
@@ -275,7 +424,7 @@ class Connection:
         else:
             raise Exception('Unsupported type {} for get_data.'.format(return_type))
 
-    def get_dataframe(self, table, encoding="utf-8", clean=True):
+    def get_dataframe(self, table, encoding="utf-8", clean=True, columnar=False, categorical=False):
         """Returns a pandas dataframe representation of `table`
 
         Args:
@@ -283,13 +432,23 @@ class Connection:
             encoding (str, optional):
             clean (bool, optional): If set to true, newline characters and non-ascii
                                     characters will be removed from the resulting data
+            columnar (bool, optional): If set to true, the table is downloaded as Parquet/Arrow
+                                       and the frame is built from its typed buffers rather
+                                       than by parsing a CSV. `encoding` does not apply.
+            categorical (bool, optional): If set to true, low-cardinality text columns are
+                                          returned as pandas categoricals, see `data_helpers.categorize`
 
         Returns:
             `pandas.DataFrame`: A DataFrame representing the table and the data it contains"""
-        file_path = self.get_csv(table, encoding=encoding, clean=clean)
+        if columnar:
+            file_path = self.get_parquet(table, clean=clean)
+        else:
+            file_path = self.get_csv(table, encoding=encoding, clean=clean)
 
         try:
-            return self._get_df_from_csv(file_path, table.columns, encoding)
+            if columnar:
+                return self._get_df_from_parquet(file_path, table.columns, categorical=categorical)
+            return self._get_df_from_csv(file_path, table.columns, encoding, categorical=categorical)
         finally:
             try:
                 os.remove(file_path)
@@ -297,12 +456,17 @@ class Connection:
                 # import traceback
                 logger.warning('Failed to delete temporary file {}, {}.'.format(file_path, str(e)))
 
-    def get_dataframe_by_query(self, sa_query, encoding='utf-8'):
+    def get_dataframe_by_query(self, sa_query, encoding='utf-8', columnar=False, categorical=False):
         # TODO: Somehow get a list of column names/types from query arg to use with _get_df_from_csv.
         query, params = self._compiled(sa_query)
-        file_path = self.get_csv_by_query(query, params)
+        if columnar:
+            file_path = self.get_parquet_by_query(query, params)
+        else:
+            file_path = self.get_csv_by_query(query, params)
         try:
-            return self._get_df_from_csv(file_path, sa_query.selected_columns, encoding)
+            if columnar:
+                return self._get_df_from_parquet(file_path, sa_query.selected_columns, categorical=categorical)
+            return self._get_df_from_csv(file_path, sa_query.selected_columns, encoding, categorical=categorical)
         finally:
             try:
                 os.remove(file_path)
@@ -310,11 +474,11 @@ class Connection:
                 # import traceback
                 logger.warning('Failed to delete temporary file {}, {}.'.format(file_path, str(e)))
 
-    def get_dataframe_by_querystring(self, query, encoding='utf-8'):
+    def get_dataframe_by_querystring(self, query, encoding='utf-8', categorical=False):
         # TODO: Somehow get a list of column names/types from query arg to use with _get_df_from_csv.
         file_path = self.get_csv_by_query(query)
         try:
-            return self._get_df_from_csv(file_path=file_path, encoding=encoding)
+            return self._get_df_from_csv(file_path=file_path, encoding=encoding, categorical=categorical)
         finally:
             try:
                 os.remove(file_path)
@@ -322,44 +486,12 @@ class Connection:
                 # import traceback
                 logger.warning('Failed to delete temporary file {}, {}.'.format(file_path, str(e)))
 
-    def _get_df_from_csv(self, file_path: str, columns=None, encoding='utf-8'):
+    def _get_df_from_csv(self, file_path: str, columns=None, encoding='utf-8', categorical=False):
         # TODO: Determine if converters are needed for various column types.
         # Examples:
         #   default null dates to a valid date (1900-01-01) for better parsing
         #   encode string values as ascii for backward compatibility
-        falsey_strings = {'f', 'F', 'no', 'false', 'FALSE'}
-
-        def to_bool(val):
-            if val in falsey_strings:
-                return False
-            return bool(val)
-
-        def to_timedelta(val):
-            return pd.to_timedelta(val)
-
-        converters = {}
-        dtypes = {}
-        parse_dates = []
-        # raise Exception('\n'.join(['c.name: {}, c.type: {}'.format(repr(c.name), repr(c.type)) for c in columns]))
         if columns:
-            for c in columns:
-                if isinstance(c.type, sqlalchemy.types.Boolean):
-                    converters[c.name] = to_bool
-                elif any((
-                    isinstance(c.type, sqlalchemy.types.Date),
-                    isinstance(c.type, sqlalchemy.types.Time),
-                    isinstance(c.type, sqlalchemy.types.DateTime),
-                    isinstance(c.type, sqlalchemy.types.TIMESTAMP),
-                    isinstance(c.type, PlaidTimestamp),
-                    isinstance(c.type, PlaidDate),
-                )):
-                    # https://stackoverflow.com/a/37453925
-                    parse_dates.append(c.name)
-                elif isinstance(c.type, sqlalchemy.types.Interval):
-                    converters[c.name] = to_timedelta
-                else:
-                    dtypes[c.name] = pandas_dtype_from_sql(c.type)
-
             # So, here's the why of all of this. Our expected behavior is that nulls become empty string in data frames if they are strings, and they
             # stay as nulls if they are other data types (floats, etc.)  We got this behavior out of the box in the old days, and thus stuff we built downstream
             # now expects it.  We need to keep it now, and do so as efficiently as possible.
@@ -369,30 +501,150 @@ class Connection:
             # a set of object columns with keep_default_na = True and then recombine them into 1 dataframe with all of the columns.
             # Pandas supports reading a subset of columns from a source file. See 'usecols' kwarg.
             # Probably not a big deal though. We're being memory-efficient with our non-object columns now (nans come in as Null now in numeric cols (float, int, etc)
-            df = pd.read_csv(
-                file_path,
-                dtype=dtypes,
-                parse_dates=parse_dates,
-                converters=converters,
-                encoding=encoding,
-                keep_default_na=False,
-                na_values=_NA_VALUES,
-            )
-            nan_overrides = {}
-
-            # Create a list of string (object) columns and NaN override for each ('').
-            for col in df.columns:
-                if df[col].dtype == np.dtype('object'):
-                    nan_overrides[col] = ''
-
-            df = df.fillna(value=nan_overrides)  # pylint: disable=no-member
+            df = pd.read_csv(file_path, encoding=encoding, **_csv_read_options(columns))
+            df = _fill_string_nulls(df)
 
         else:
             # No column information is available.  Blind dataframe creation with implicit guessing.
             df = pd.read_csv(file_path, encoding=encoding, keep_default_na=False)
 
+        if categorical:
+            dh.categorize(df)
+        return df
+
+    def _get_df_from_parquet(self, file_path: str, columns=None, categorical=False):
+        """Builds a dataframe from a downloaded Parquet or Arrow IPC file.
+
+        The file is memory-mapped and converted column block by column block, so the
+        peak is close to one copy of the frame rather than the file, the parsed text and
+        the frame at once. Column types then follow the same conventions as
+        `_get_df_from_csv`: null strings become '', null booleans become False. With
+        `categorical`, low-cardinality text columns come back as pandas categoricals.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+        if _is_parquet(file_path):
+            arrow_table = pq.read_table(file_path, memory_map=True)
+        else:
+            with pa.memory_map(file_path, 'r') as source:
+                try:
+                    arrow_table = pa.ipc.open_file(source).read_all()
+                except pa.ArrowInvalid:
+                    source.seek(0)
+                    arrow_table = pa.ipc.open_stream(source).read_all()
+
+        df = _arrow_to_df(arrow_table, columns)
+        if categorical:
+            dh.categorize(df)
         return df
 
+    def iter_dataframes(self, query, chunk_rows: int = None, chunk_bytes: int = None, params=None, encoding='utf-8', columnar=False):
+        """Yields the results of `query` as a series of typed dataframes.
+
+        The result is downloaded once, then read back a chunk at a time, so memory is
+        bounded by the chunk size rather than the result size. Column types are
+        resolved once from `query.selected_columns`; a query string is read blind, as
+        with `get_dataframe_by_querystring`.
+
+        Args:
+            query (str|sqlalchemy.sql.Select): The query to run
+            chunk_rows (int, optional): Rows per chunk. Defaults to 100,000 unless `chunk_bytes` is given
+            chunk_bytes (int, optional): Approximate in-memory size of each chunk. The row count is
+                re-estimated from each chunk read, so the first chunk of a CSV download is a small probe
+            params (dict, optional): Bind parameters for a query string
+            encoding (str, optional): Encoding of the CSV download
+            columnar (bool, optional): If set to true, download as Parquet/Arrow rather than CSV
+
+        Yields:
+            `pandas.DataFrame`: Consecutive chunks of the result, with a running RangeIndex
+        """
+        if chunk_rows is not None and chunk_rows < 1:
+            raise ValueError('chunk_rows must be a positive integer')
+        if chunk_bytes is not None and chunk_bytes < 1:
+            raise ValueError('chunk_bytes must be a positive integer')
+
+        if isinstance(query, str):
+            query_string = query
+            columns = None
+        else:
+            query_string, params = self._compiled(query)
+            columns = query.selected_columns
+
+        if columnar:
+            file_path = self.get_parquet_by_query(query_string, params)
+        else:
+            file_path = self.get_csv_by_query(query_string, params)
+
+        try:
+            if columnar:
+                yield from self._iter_df_from_parquet(file_path, columns, chunk_rows, chunk_bytes)
+            else:
+                yield from self._iter_df_from_csv(file_path, columns, chunk_rows, chunk_bytes, encoding)
+        finally:
+            try:
+                os.remove(file_path)
+            except Exception as e:
+                logger.warning('Failed to delete temporary file {}, {}.'.format(file_path, str(e)))
+
+    @staticmethod
+    def _iter_df_from_csv(file_path: str, columns=None, chunk_rows=None, chunk_bytes=None, encoding='utf-8'):
+        if columns:
+            options = _csv_read_options(columns)
+        else:
+            options = dict(keep_default_na=False)
+
+        rows = _chunk_row_count(None, chunk_rows, chunk_bytes)
+        with pd.read_csv(file_path, encoding=encoding, iterator=True, **options) as reader:
+            while True:
+                try:
+                    df = reader.get_chunk(rows)
+                except StopIteration:
+                    break
+                if df.empty:
+                    break
+                if columns:
+                    df = _fill_string_nulls(df)
+                if chunk_bytes:
+                    rows = _chunk_row_count(df.memory_usage(deep=True).sum() / len(df), chunk_rows, chunk_bytes)
+                yield df
+
+    @staticmethod
+    def _iter_df_from_parquet(file_path: str, columns=None, chunk_rows=None, chunk_bytes=None):
+        try:
+            import pyarrow as pa
+        except ImportError as exc:
+            raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
+
+        rows = _chunk_row_count(None, chunk_rows, chunk_bytes)
+        pending = []
+        pending_rows = 0
+        offset = 0
+        for batch in _arrow_batches(file_path):
+            while batch.num_rows:
+                if chunk_bytes:
+                    rows = _chunk_row_count(batch.nbytes / batch.num_rows, chunk_rows, chunk_bytes)
+                # A wider batch shrinks the chunk, possibly below what is already pending.
+                if pending_rows < rows:
+                    take = min(rows - pending_rows, batch.num_rows)
+                    pending.append(batch.slice(0, take))
+                    pending_rows += take
+                    batch = batch.slice(take)
+                if pending_rows >= rows:
+                    df = _arrow_to_df(pa.Table.from_batches(pending), columns)
+                    df.index = pd.RangeIndex(offset, offset + len(df))
+                    offset += len(df)
+                    yield df
+                    pending = []
+                    pending_rows = 0
+        if pending:
+            df = _arrow_to_df(pa.Table.from_batches(pending), columns)
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            yield df
+
     def execute(self, query, params=None, return_df=False):
 
         if isinstance(query, str):
@@ -490,12 +742,25 @@ class Connection:
         #
         #         self._load_csv(table_object, path)
 
-    def bulk_insert_dataframe(self, table_object: 'Table', df: pd.DataFrame, append: bool = False, chunk_size: int = 500000, load_greenplum_parquet: bool = False):
+    def bulk_insert_dataframe(
+        self, table_object: 'Table', df: pd.DataFrame, append: bool = False, chunk_size: int = 500000,
+        load_greenplum_parquet: bool = False, part_rows: int = None, max_workers: int = None,
+        spill_bytes: int = _UPLOAD_SPILL_BYTES,
+    ):
         """Pandas-flavored wrapper method to the load data into PlaidCloud Table from a Dataframe
         bulk_insert_dataframe(table_object, df, append, chunk_size)
+
+        Args:
+            part_rows (int, optional): Split a Parquet load into parts of this many rows, each a
+                single row group, which are encoded and uploaded concurrently and then loaded
+                together. Defaults to one part for the whole frame.
+            max_workers (int, optional): Number of parts to encode and upload at once. Defaults to 4.
+            spill_bytes (int, optional): Parquet parts are encoded in memory and spilled to a
+                temporary file only once they grow past this many bytes. Defaults to 64 MiB.
+                None never spills; 0 always writes to disk.
         """
         try:
-            import pyarrow as pa
+            import pyarrow  # noqa: F401
         except ImportError as exc:
             raise ImportError('Use of this method requires full install. Try running `pip install plaid-rpc[full]`') from exc
         if len(df) == 0:
@@ -503,7 +768,7 @@ class Connection:
             return
 
         # get table metadata for existing table object from analyze
-        table_meta_in = self.rpc.analyze.table.table_meta(project_id=self._project_id, table_id=table_object.id)
+        table_meta_in = self.table_meta(table_object.id)
         cols_analyze = []
         col_order = []
         if table_meta_in and len(table_meta_in) > 0:
@@ -545,7 +810,7 @@ class Connection:
 
         if not table_meta_out:
             # either there was no inbound metadata (table didn't exist) or append is false, so we're overwriting anyway
-            dtype_list = [str(dtype) for dtype in list(df[col_order].dtypes)]
+            dtype_list = [str(dh.storage_dtype(dtype)) for dtype in list(df[col_order].dtypes)]
             table_meta_out = [
                 {
                     'id': col,
@@ -567,27 +832,12 @@ class Connection:
             load_greenplum_parquet=load_greenplum_parquet,
         )
         if data_load:
-            try:
-                schema = pa.Schema.from_pandas(df)
-            except pa.lib.ArrowTypeError as e:
-                bad_columns = []
-                for col in df.columns:
-                    try:
-                        pa.Schema.from_pandas(df[[col]].copy())
-                    except pa.lib.ArrowTypeError:
-                        bad_columns.append(col)
-                raise Exception(f'Mixed data in column(s) {bad_columns}') from e
-
-            for col in schema:
-                if isinstance(col.type, (pa.ListType, pa.StructType)):
-                    df[col.name] = df[col.name].map(str)
-            with tempfile.NamedTemporaryFile(mode='wb+') as pq_file:
-                df.to_parquet(pq_file)
-                # upload the file
-                pq_file.seek(0)
-                self._upload(table_object.id, data_load['load_type'], data_load['upload_path'], pq_file)
+            # The schema is inferred once here and reused for every part.
+            schema = _parquet_schema(df)
+            self._upload_parquet_parts(table_object.id, data_load, df, schema, part_rows, max_workers, spill_bytes)
 
             # execute the load
+            self.invalidate_table(table_object.id)
             self.rpc.analyze.table.execute_data_load(
                 project_id=self._project_id,
                 table_id=table_object.id,
@@ -598,6 +848,7 @@ class Connection:
             )
         else:
             # Do it the old way
+            self.invalidate_table(table_object.id)
             for row in range(0, df.shape[0], chunk_size):
                 with tempfile.NamedTemporaryFile(mode='wb+') as csv_file:
                     df[row:row + chunk_size].to_csv(
@@ -632,7 +883,62 @@ class Connection:
                         compressed=True,
                     )
 
-    def _upload(self, table_id: str, load_type: str, upload_path: str, pfile):
+    def _upload_parquet_parts(
+        self, table_id: str, data_load: dict, df: pd.DataFrame, schema, part_rows: int = None, max_workers: int = None,
+        spill_bytes: int = _UPLOAD_SPILL_BYTES,
+    ):
+        """Encodes `df` as Parquet parts of `part_rows` rows and uploads them to one data load.
+
+        Every part is written with the same `schema`, so a part whose slice of a column is all
+        null still matches the others. Parts are named in row order. Each part is encoded into
+        memory, rolling over to a temporary file past `spill_bytes`.
+        """
+        part_rows = part_rows or len(df)
+        starts = range(0, len(df), part_rows)
+        workers = min(max_workers or 4, len(starts))
+
+        def upload_part(index_start):
+            index, start = index_start
+            with tempfile.SpooledTemporaryFile(max_size=spill_bytes or 0, mode='w+b', suffix='.parquet') as pq_file:
+                if spill_bytes == 0:
+                    pq_file.rollover()
+                df.iloc[start:start + part_rows].to_parquet(pq_file, schema=schema, row_group_size=part_rows)
+                # upload the file
+                pq_file.seek(0)
+                return self._upload(
+                    table_id, data_load['load_type'], data_load['upload_path'],
+                    (f'part-{index:05d}.parquet', pq_file),
+                )
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(upload_part, enumerate(starts)))
+        return [upload_part(index_start) for index_start in enumerate(starts)]
+
+    @property
+    def upload_session(self) -> requests.Session:
+        """The pooled, kept-alive session shared by every upload on this connection.
+
+        Built on first use. It is safe to share between threads; `close` releases it.
+        """
+        if self._upload_http is None:
+            with self._upload_http_lock:
+                if self._upload_http is None:
+                    session = requests.sessions.Session()
+                    retry = Retry(
+                        total=5,
+                        allowed_methods=None,  # retry for any method
+                        status_forcelist=[500, 502, 504],
+                        backoff_factor=0.1,
+                    )
+                    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=self._upload_pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers['Connection'] = 'keep-alive'
+                    self._upload_http = session
+        return self._upload_http
+
+    def _upload(self, table_id: str, load_type: str, upload_path: str, pfile, session: requests.Session = None):
 
         upload_url = urlunparse(urlparse(self.rpc.rpc_uri)._replace(path='upload_data'))
 
@@ -647,17 +953,22 @@ class Connection:
 
         # logger.info('Preparing to open and upload {}'.format(archive_name))
 
-        with requests.sessions.Session() as session:
-            retry = Retry(
-                total=5,
-                allowed_methods=None,  # retry for any method
-                status_forcelist=[500, 502, 504],
-                backoff_factor=0.1,
-            )
-            adapter = HTTPAdapter(max_retries=retry)
-            session.mount('http://', adapter)
-            session.mount('https://', adapter)
-
+        session = session or self.upload_session
+        if self._upload_compression:
+            request = session.prepare_request(requests.Request(
+                'POST',
+                upload_url,
+                headers=headers,
+                files={
+                    'upload_file': pfile
+                },
+                params=params,
+            ))
+            request.body = _compress(request.body, self._upload_compression)
+            request.headers['Content-Encoding'] = self._upload_compression
+            request.headers['Content-Length'] = str(len(request.body))
+            r = session.send(request, verify=self.rpc.verify_ssl, timeout=300)
+        else:
             r = session.post(
                 upload_url,
                 headers=headers,
@@ -668,8 +979,8 @@ class Connection:
                 params=params,
                 timeout=300,
             )
-            r.raise_for_status()
-            return r.json()
+        r.raise_for_status()
+        return r.json()
 
     def commit(self):
         """Here for completeness.  Does nothing"""
@@ -680,8 +991,11 @@ class Connection:
         raise Exception('No Rollback is possible using a PlaidTools connection.')
 
     def close(self):
-        """Here for completeness.  Does nothing"""
-        pass
+        """Releases the pooled upload session, if one was opened"""
+        with self._upload_http_lock:
+            if self._upload_http is not None:
+                self._upload_http.close()
+                self._upload_http = None
 
     def add(self, mapping):
         """Inserts a single record"""
@@ -689,15 +1003,64 @@ class Connection:
         self.bulk_save_objects(objects=objects)
 
     def truncate(self, table):
+        self.invalidate_table(table.id)
         return self.rpc.analyze.table.clear_data(
                 project_id=self._project_id, table_id=table.id
             )
 
     def drop(self, table):
+        self.invalidate_table(table.id)
         return self.rpc.analyze.table.delete(
                 project_id=self._project_id, table_id=table.id
             )
 
+    def table_meta(self, table_id: str) -> list:
+        """Returns the column metadata of `table_id`, reusing a cached copy while it is fresh.
+
+        Entries live for `metadata_ttl` seconds and are dropped when this connection changes
+        the table. Each call gets its own copy, so callers may modify it.
+        """
+        key = (self._project_id, table_id)
+        with self._metadata_lock:
+            entry = self._table_meta_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return copy.deepcopy(entry[1])
+
+        meta = self.rpc.analyze.table.table_meta(project_id=self._project_id, table_id=table_id)
+        if self._metadata_ttl:
+            with self._metadata_lock:
+                self._table_meta_cache[key] = (time.monotonic() + self._metadata_ttl, copy.deepcopy(meta))
+        return meta
+
+    def _resolve_table_id(self, name: str, raise_if_not_found=True):
+        """`_get_table_id` for this connection's project, reusing resolved names while fresh.
+
+        A name that resolves to no table is not cached, so a table created elsewhere is
+        found on the next lookup.
+        """
+        key = (self._project_id, name)
+        with self._metadata_lock:
+            entry = self._table_id_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        result = _get_table_id(self.rpc, self._project_id, name, raise_if_not_found=raise_if_not_found)
+        if self._metadata_ttl and result[0] is not None:
+            with self._metadata_lock:
+                self._table_id_cache[key] = (time.monotonic() + self._metadata_ttl, result)
+        return result
+
+    def invalidate_table(self, table_id: str = None):
+        """Drops cached metadata for `table_id`, or for every table if it is None."""
+        with self._metadata_lock:
+            if table_id is None:
+                self._table_meta_cache.clear()
+                self._table_id_cache.clear()
+                return
+            self._table_meta_cache.pop((self._project_id, table_id), None)
+            for key in [k for k, (_, result) in self._table_id_cache.items() if result[0] == table_id]:
+                del self._table_id_cache[key]
+
     def save_data(self, query, table, append: bool = False):
         """Saves the data from the give query as a table in the database
 
@@ -733,6 +1096,7 @@ class Connection:
 
         # use the upsert method to add the data
         insert_query, insert_params = self._compiled(table.insert().from_select(query.selected_columns, query))
+        self.invalidate_table(table.id)
         self.rpc.analyze.query.upsert(
             project_id=self._project_id,
             table_id=table.id,
@@ -773,6 +1137,28 @@ class Connection:
     def get_table(self, table_name):
         return Table(self, table_name)
 
+    def get_tables(self, table_names: list, max_workers: int = 8) -> list:
+        """Returns a Table for each of `table_names`, in the same order.
+
+        Each distinct name is resolved once, and up to `max_workers` of them are looked up
+        and built at the same time, so many tables cost about as long as the slowest one.
+        The resolved ids and metadata land in the connection's metadata cache.
+
+        Args:
+            table_names (list): Table names, paths or ids, as accepted by `get_table`
+            max_workers (int, optional): Maximum number of tables to resolve at once
+
+        Returns:
+            list: Table objects. A name given more than once gets the same object.
+        """
+        distinct = list(dict.fromkeys(table_names))
+        if max_workers and max_workers > 1 and len(distinct) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(distinct))) as executor:
+                tables = dict(zip(distinct, executor.map(self.get_table, distinct)))
+        else:
+            tables = {name: self.get_table(name) for name in distinct}
+        return [tables[name] for name in table_names]
+
     def _load_udf_params(self) -> "UDFParams | None":
         if not isinstance(self.rpc.step_id, str):
             return None
@@ -780,13 +1166,20 @@ class Connection:
             project_id=self._project_id,
             step_id=self.rpc.step_id
         )
+        source_config = config.get('sources', [])
+        target_config = config.get('targets', [])
+        # Resolve every source and target together rather than one RPC round trip after another.
+        tables = self.get_tables([
+            *[apply_variables(s['source'], self.variables) for s in source_config],
+            *[apply_variables(t['target'], self.variables) for t in target_config],
+        ])
         _sources = [
-            (self.get_table(apply_variables(s['source'], self.variables)), s['id'])
-            for s in config.get('sources', [])
+            (table, s['id'])
+            for table, s in zip(tables[:len(source_config)], source_config)
         ]
         _targets = [
-            (self.get_table(apply_variables(t['target'], self.variables)), t['id'])
-            for t in config.get('targets', [])
+            (table, t['id'])
+            for table, t in zip(tables[len(source_config):], target_config)
         ]
         _variables = [
             (apply_variables(v['value'], self.variables), v['name'])
@@ -843,7 +1236,10 @@ class Table(sqlalchemy.Table):
         else:
             _metadata = sqlalchemy.MetaData()
 
-        _table_id, _, _ = _get_table_id(_rpc, _project_id, table, raise_if_not_found=False)
+        if isinstance(conn, Connection):
+            _table_id, _, _ = conn._resolve_table_id(table, raise_if_not_found=False)
+        else:
+            _table_id, _, _ = _get_table_id(_rpc, _project_id, table, raise_if_not_found=False)
 
         if create_on_missing and _table_id is None:
             # Since this is a new table.  Set overwrite to true to create physical table
@@ -875,11 +1271,16 @@ class Table(sqlalchemy.Table):
 
         if columns:
             # Only try to create a physical table if columns have been defined
+            if isinstance(conn, Connection):
+                conn.invalidate_table(_table_id)
             _rpc.analyze.table.touch(project_id=_project_id, table_id=_table_id, meta=columns, overwrite=overwrite)
 
-        columns = _rpc.analyze.table.table_meta(
-            project_id=_project_id, table_id=_table_id,
-        )
+        if isinstance(conn, Connection):
+            columns = conn.table_meta(_table_id)
+        else:
+            columns = _rpc.analyze.table.table_meta(
+                project_id=_project_id, table_id=_table_id,
+            )
         if not columns:
             columns = []  # If the table doesn't actually exist, we assume it's got no columns
 
@@ -941,6 +1342,8 @@ class Table(sqlalchemy.Table):
         Ideally this would be named 'columns' but there is a
         name collision with SQLAlchemy's table.columns
         """
+        if isinstance(self._conn, Connection):
+            return self._conn.table_meta(self.id)
         return self._rpc.analyze.table.table_meta(  # pylint: disable=no-member
             project_id=self.project_id,
             table_id=self.id,
@@ -970,6 +1373,261 @@ class Table(sqlalchemy.Table):
         return self._conn.save_data(datasource, self)
 
 
+_DATE_TYPES = (sqlalchemy.types.DateTime, PlaidDate, sqlalchemy.types.Date, sqlalchemy.types.Time)
+
+
+def _to_timestamp(v):
+    return pd.to_datetime(v) if v is None else pd.Timestamp(v)
+
+
+def _to_timedelta(v):
+    return pd.to_timedelta(v) if v is None else pd.Timedelta(v)
+
+
+def _csv_converter(type_, preserve_nulls):
+    """Returns the callable that converts one CSV cell of SQLAlchemy type `type_`."""
+    if isinstance(type_, sqlalchemy.types.Numeric):
+        def convert(v):
+            return float(v or 0)
+    elif isinstance(type_, sqlalchemy.types.Integer):
+        def convert(v):
+            return int(v or 0)
+    elif isinstance(type_, _DATE_TYPES):
+        convert = _to_timestamp
+    elif isinstance(type_, sqlalchemy.types.Interval):
+        convert = _to_timedelta
+    else:
+        def convert(v):
+            return v
+
+    if not preserve_nulls:
+        return convert
+
+    def convert_or_none(v):
+        # Keep the value as None if we want to preserve nulls.
+        return None if v is None else convert(v)
+
+    return convert_or_none
+
+
+def _csv_batch_converter(type_, preserve_nulls):
+    """Returns a callable that converts a list of CSV cells of SQLAlchemy type `type_`.
+
+    The result is a list of the same values `_csv_converter` would give, cell by cell.
+    A batch the vectorised path cannot parse falls back to the per-cell converter, so
+    errors are raised exactly as they would be when streaming row by row.
+    """
+    scalar = _csv_converter(type_, preserve_nulls)
+
+    if isinstance(type_, (sqlalchemy.types.Numeric, sqlalchemy.types.Integer)):
+        dtype = np.float64 if isinstance(type_, sqlalchemy.types.Numeric) else np.int64
+
+        def vectorised(values):
+            arr = np.array(['0' if not v else v for v in values])
+            return arr.astype(dtype).tolist()
+    elif isinstance(type_, _DATE_TYPES):
+        def vectorised(values):
+            return list(pd.to_datetime(['' if v is None else v for v in values]))
+    elif isinstance(type_, sqlalchemy.types.Interval):
+        def vectorised(values):
+            return list(pd.to_timedelta(['' if v is None else v for v in values]))
+    else:
+        return lambda values: values
+
+    def convert(values):
+        nulls = [i for i, v in enumerate(values) if v is None]
+        try:
+            result = vectorised(values)
+        except (ValueError, TypeError, OverflowError):
+            return [scalar(v) for v in values]
+        if nulls and (preserve_nulls or isinstance(type_, (_DATE_TYPES, sqlalchemy.types.Interval))):
+            # None is kept by preserve_nulls, and to_datetime/to_timedelta return None for None.
+            for i in nulls:
+                result[i] = None
+        return result
+
+    return convert
+
+
+_DEFAULT_CHUNK_ROWS = 100000
+_CHUNK_PROBE_ROWS = 1000
+
+
+def _chunk_row_count(bytes_per_row, chunk_rows=None, chunk_bytes=None) -> int:
+    """Returns the number of rows to read for the next chunk."""
+    if not chunk_bytes:
+        return chunk_rows or _DEFAULT_CHUNK_ROWS
+    if not bytes_per_row:
+        # Nothing has been read yet, so there is nothing to size from.
+        return min(chunk_rows or _CHUNK_PROBE_ROWS, _CHUNK_PROBE_ROWS)
+    rows = max(1, int(chunk_bytes // bytes_per_row))
+    if chunk_rows:
+        rows = min(rows, chunk_rows)
+    return rows
+
+
+def _csv_read_options(columns) -> dict:
+    """Returns the `read_csv` dtype, date and converter options for SQLAlchemy `columns`."""
+    falsey_strings = {'f', 'F', 'no', 'false', 'FALSE'}
+
+    def to_bool(val):
+        if val in falsey_strings:
+            return False
+        return bool(val)
+
+    def to_timedelta(val):
+        return pd.to_timedelta(val)
+
+    converters = {}
+    dtypes = {}
+    parse_dates = []
+    for c in columns:
+        if isinstance(c.type, sqlalchemy.types.Boolean):
+            converters[c.name] = to_bool
+        elif any((
+            isinstance(c.type, sqlalchemy.types.Date),
+            isinstance(c.type, sqlalchemy.types.Time),
+            isinstance(c.type, sqlalchemy.types.DateTime),
+            isinstance(c.type, sqlalchemy.types.TIMESTAMP),
+            isinstance(c.type, PlaidTimestamp),
+            isinstance(c.type, PlaidDate),
+        )):
+            # https://stackoverflow.com/a/37453925
+            parse_dates.append(c.name)
+        elif isinstance(c.type, sqlalchemy.types.Interval):
+            converters[c.name] = to_timedelta
+        else:
+            dtypes[c.name] = pandas_dtype_from_sql(c.type)
+
+    return {
+        'dtype': dtypes,
+        'parse_dates': parse_dates,
+        'converters': converters,
+        'keep_default_na': False,
+        'na_values': _NA_VALUES,
+    }
+
+
+def _fill_string_nulls(df: pd.DataFrame) -> pd.DataFrame:
+    """Replaces nulls in the string (object) columns of `df` with ''."""
+    nan_overrides = {col: '' for col in df.columns if df[col].dtype == np.dtype('object')}
+    return df.fillna(value=nan_overrides)  # pylint: disable=no-member
+
+
+def _is_parquet(file_path: str) -> bool:
+    with open(file_path, 'rb') as f:
+        return f.read(4) == b'PAR1'
+
+
+def _arrow_batches(file_path: str):
+    """Yields the record batches of a Parquet or Arrow IPC file without reading it whole."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if _is_parquet(file_path):
+        yield from pq.ParquetFile(file_path, memory_map=True).iter_batches()
+        return
+
+    with pa.memory_map(file_path, 'r') as source:
+        try:
+            reader = pa.ipc.open_file(source)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            yield from pa.ipc.open_stream(source)
+            return
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+
+def _compress(body: bytes, compression: str) -> bytes:
+    """Compresses an upload request body with 'gzip' or 'zstd'."""
+    if compression == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise ImportError('zstd upload compression requires the `zstandard` package') from exc
+    return zstandard.ZstdCompressor().compress(body)
+
+
+def _parquet_schema(df: pd.DataFrame):
+    """Infers the Arrow schema `df` is uploaded with, stringifying its List and Struct columns.
+
+    `df` is modified in place: nested columns are replaced with their `str()` text, which is
+    what the loader stores, and their fields become strings without re-inferring the rest.
+
+    Raises:
+        Exception: Naming every column whose values Arrow cannot give a single type
+    """
+    import pyarrow as pa
+
+    try:
+        schema = pa.Schema.from_pandas(df)
+    except (pa.lib.ArrowTypeError, pa.lib.ArrowInvalid) as e:
+        # Only object columns can hold mixed values. Infer each one on its own, in place,
+        # rather than copying a one-column frame per column.
+        bad_columns = []
+        for col in df.columns:
+            if df[col].dtype != np.dtype('object'):
+                continue
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.lib.ArrowTypeError, pa.lib.ArrowInvalid):
+                bad_columns.append(col)
+        raise Exception(f'Mixed data in column(s) {bad_columns}') from e
+
+    for i, field in enumerate(schema):
+        if isinstance(field.type, (pa.ListType, pa.LargeListType, pa.StructType)):
+            # Arrow has no cast from nested types to strings, and the stored text is the Python
+            # repr, so this is one str() per value - but no second inference of the frame.
+            df[field.name] = df[field.name].astype(str)
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+
+    return schema
+
+
+def _arrow_to_df(arrow_table, columns=None) -> pd.DataFrame:
+    """Converts a pyarrow Table to a dataframe typed from the SQLAlchemy `columns`.
+
+    `arrow_table` is consumed - its buffers are released as each column is converted.
+    """
+    df = arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+    del arrow_table
+
+    if not columns:
+        return df
+
+    for c in columns:
+        if c.name not in df.columns:
+            continue
+        series = df[c.name]
+        if isinstance(c.type, sqlalchemy.types.Boolean):
+            if series.dtype != np.dtype('bool'):
+                df[c.name] = series.fillna(False).astype(bool)
+        elif any((
+            isinstance(c.type, sqlalchemy.types.Date),
+            isinstance(c.type, sqlalchemy.types.Time),
+            isinstance(c.type, sqlalchemy.types.DateTime),
+            isinstance(c.type, sqlalchemy.types.TIMESTAMP),
+            isinstance(c.type, PlaidTimestamp),
+            isinstance(c.type, PlaidDate),
+        )):
+            if series.dtype == np.dtype('object'):
+                df[c.name] = pd.to_datetime(series)
+        elif isinstance(c.type, sqlalchemy.types.Interval):
+            if not pd.api.types.is_timedelta64_dtype(series.dtype):
+                df[c.name] = pd.to_timedelta(series)
+        else:
+            dtype = pandas_dtype_from_sql(c.type)
+            if dtype == 'object':
+                if series.dtype == np.dtype('object'):
+                    df[c.name] = series.fillna('')
+            elif series.dtype != dtype:
+                df[c.name] = series.astype(dtype)
+
+    return df
+
+
 def _get_table_id(rpc, project_id, name, raise_if_not_found=True):
     if name.startswith(TABLE_PREFIX):
         # This is already the ID.  Use it
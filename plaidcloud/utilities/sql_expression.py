@@ -1604,7 +1604,7 @@ def import_data_query(
 def allocate(
     source_query, driver_query, allocate_columns, numerator_columns, denominator_columns, driver_value_column,
     overwrite_cols_for_allocated=True, include_source_columns=None, unique_cte_index=1,
-    parent_context_queries: dict = None
+    parent_context_queries: dict = None, split_signs=False
 ):
     """Performs an allocation based on the provided sqlalchemy source and driver data queries
 
@@ -1620,6 +1620,10 @@ def allocate(
         unique_cte_index (int, optional): Unique index to use in the common table expressions if more than one
             allocation will be done within the same query
         parent_context_queries (dict, optional): Dict of queries for use with 'Parent' driver data {col: {'PARENT_CHILD': Selectable, 'LEAVES': Selectable}}
+        split_signs (bool, optional): Treat the positive and the negative driver values of each denominator as
+            separate pools, so that offsetting driver values cannot produce huge opposing splits. Source records
+            with a negative first allocate column are allocated over the negative pool, all others over the
+            positive pool, falling back to the other pool when the denominator has none of that sign
 
     Returns:
         sqlalchemy.Selectable: A Sqlalchemy query representing the allocation
@@ -1642,6 +1646,19 @@ def allocate(
     if allocable_col not in all_target_columns:
         source_query = source_query.add_columns(sqlalchemy.literal(1).label(allocable_col))
 
+    # Sign of each consolidated driver value, the pool it belongs to when splitting signs
+    sign_col = 'alloc_sign'
+    pool_columns = denominator_columns + [sign_col] if split_signs else denominator_columns
+
+    def _sign_columns(driver_cte):
+        if not split_signs:
+            return []
+        return [
+            sqlalchemy.case(
+                (sqlalchemy.func.sum(driver_cte.columns[driver_value_column]) < 0, -1), else_=1
+            ).label(sign_col)
+        ]
+
     def _get_shred_col_name(col):
         return f'shred_{col}' if driver_count > 1 else 'shred'
 
@@ -1705,6 +1722,7 @@ def allocate(
             sqlalchemy.select(
                 * [cte_parent_driver.columns[d] for d in numerator_columns + denominator_columns]
                 + [sqlalchemy.func.sum(cte_parent_driver.columns[d]).label(d) for d in driver_value_columns]
+                + _sign_columns(cte_parent_driver)
             )
             .where(cte_parent_driver.columns[driver_value_column] != 0)
             .group_by(* [cte_parent_driver.columns[d] for d in numerator_columns + denominator_columns])
@@ -1715,6 +1733,7 @@ def allocate(
             sqlalchemy.select(
                 * [cte_driver.columns[d] for d in numerator_columns + denominator_columns]
                 + [sqlalchemy.func.sum(cte_driver.columns[d]).label(d) for d in driver_value_columns]
+                + _sign_columns(cte_driver)
             )
             .where(cte_driver.columns[driver_value_column] != 0)
             .group_by(*[cte_driver.columns[d] for d in numerator_columns + denominator_columns])
@@ -1723,16 +1742,16 @@ def allocate(
 
     cte_denominator = (
         sqlalchemy.select(
-            * [cte_consol_driver.columns[d] for d in denominator_columns]
+            * [cte_consol_driver.columns[d] for d in pool_columns]
             + [sqlalchemy.func.sum(cte_consol_driver.columns[d]).label(d) for d in driver_value_columns]
         )
-        .group_by(*[cte_consol_driver.columns[d] for d in denominator_columns])
+        .group_by(*[cte_consol_driver.columns[d] for d in pool_columns])
         .cte(f'denominator_{unique_cte_index}')
     )
 
     cte_ratios = (
         sqlalchemy.select(
-            * [cte_consol_driver.columns[d] for d in denominator_columns + numerator_columns + driver_value_columns]
+            * [cte_consol_driver.columns[d] for d in pool_columns + numerator_columns + driver_value_columns]
             + [
                 # set ratio to null if the denominator or numerator is zero, this allows pass-through of value to be allocated
                 sqlalchemy.func.cast(
@@ -1749,15 +1768,41 @@ def allocate(
             sqlalchemy.join(
                 cte_consol_driver,
                 cte_denominator,
-                sqlalchemy.and_(sqlalchemy.true()) if not denominator_columns else
+                sqlalchemy.and_(sqlalchemy.true()) if not pool_columns else
                 sqlalchemy.and_(
-                    *[cte_consol_driver.columns[dn] == cte_denominator.columns[dn] for dn in denominator_columns]
+                    *[cte_consol_driver.columns[dn] == cte_denominator.columns[dn] for dn in pool_columns]
                 ),
             )
         )
         .cte(f'ratios_{unique_cte_index}')
     )
 
+    ratio_join = [cte_source.columns[dn] == cte_ratios.columns[dn] for dn in denominator_columns]
+    if split_signs:
+        # Which pools each denominator has, so a source record can fall back to the other pool
+        cte_pools = (
+            sqlalchemy.select(
+                * [cte_denominator.columns[d] for d in denominator_columns]
+                + [
+                    sqlalchemy.func.max(
+                        sqlalchemy.case((cte_denominator.columns[sign_col] == sign, 1), else_=0)
+                    ).label(label)
+                    for sign, label in ((1, 'has_positive'), (-1, 'has_negative'))
+                ]
+            )
+            .group_by(*[cte_denominator.columns[d] for d in denominator_columns])
+            .cte(f'pools_{unique_cte_index}')
+        )
+        source_amount = sqlalchemy.func.coalesce(cte_source.columns[allocate_columns[0]], 0)
+        ratio_join.append(
+            cte_ratios.columns[sign_col] == sqlalchemy.case(
+                (sqlalchemy.and_(source_amount < 0, cte_pools.columns['has_negative'] == 1), -1),
+                (sqlalchemy.and_(source_amount >= 0, cte_pools.columns['has_positive'] == 1), 1),
+                (cte_pools.columns['has_negative'] == 1, -1),
+                else_=1,
+            )
+        )
+
     def _is_source_col(col):
         return col not in set(reassignment_columns + (allocate_columns if overwrite_cols_for_allocated else []))
 
@@ -1804,16 +1849,24 @@ def allocate(
         cte_source.columns[allocable_col] == 1
     )
 
+    if split_signs:
+        allocation_select = allocation_select.join_from(
+            cte_source,
+            cte_pools,
+            sqlalchemy.and_(sqlalchemy.true()) if not denominator_columns else
+            sqlalchemy.and_(
+                * [
+                     cte_source.columns[dn] == cte_pools.columns[dn]
+                     for dn in denominator_columns
+                 ]
+            ),
+            isouter=True
+        )
+
     allocation_select = allocation_select.join_from(
         cte_source,
         cte_ratios,
-        sqlalchemy.and_(sqlalchemy.true()) if not denominator_columns else
-        sqlalchemy.and_(
-            * [
-                 cte_source.columns[dn] == cte_ratios.columns[dn]
-                 for dn in denominator_columns
-             ]
-        ),
+        sqlalchemy.and_(sqlalchemy.true()) if not ratio_join else sqlalchemy.and_(*ratio_join),
         isouter=True
     )
 
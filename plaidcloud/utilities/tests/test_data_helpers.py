@@ -1,9 +1,11 @@
 # coding=utf-8
-"""Contract tests for data_helpers' optional-IPython handling (sc-23365)."""
+"""Contract tests for data_helpers' optional-IPython handling (sc-23365), its column casts and clean_frame."""
 
 import importlib
 import sys
 
+import numpy as np
+import pandas as pd
 import pytest
 
 from plaidcloud.utilities import data_helpers
@@ -28,3 +30,69 @@ def test_jupyter_table_without_ipython_raises_actionable_error(monkeypatch):
     _block_ipython(monkeypatch)
     with pytest.raises(ImportError, match=r'plaidcloud-utilities\[jupyter\]'):
         data_helpers.jupyter_table('<b>hi</b>')
+
+
+MIXED_VALUES = [
+    '3', ' 4 ', '3.5', 'Three', '', 'nan', '1e400', '1_000', None, np.nan, pd.NA, pd.NaT,
+    3, -2.5, 1e19, True, b'7',
+]
+
+
+@pytest.mark.parametrize('scalar_cast, series_cast', [
+    (data_helpers.cast_as_str, data_helpers.cast_as_str_series),
+    (data_helpers.cast_as_int, data_helpers.cast_as_int_series),
+    (data_helpers.cast_as_float, data_helpers.cast_as_float_series),
+])
+@pytest.mark.parametrize('values', [
+    pd.Series(MIXED_VALUES, dtype=object),
+    pd.Series(['12', None, '-7', 'E1', '8']),
+    pd.Series([1.5, np.nan, -2.0, 1e10]),
+    pd.Series([4, None, 6], dtype='Int64'),
+    pd.Series([True, False]),
+    pd.Series(['E1', None, 'E2', 'E1'], dtype='category'),
+    pd.Series([], dtype=object),
+], ids=['mixed', 'text', 'float', 'nullable-int', 'bool', 'categorical', 'empty'])
+def test_series_casts_match_scalar_casts(scalar_cast, series_cast, values):
+    """Each column cast gives exactly what mapping its scalar cast over the values gives."""
+    values.index = values.index * 2
+    expected = [scalar_cast(value) for value in values]
+    result = series_cast(values)
+    assert list(result.index) == list(values.index)
+    assert [type(value) for value in result.tolist()] == [type(value) for value in expected]
+    pd.testing.assert_series_equal(pd.Series(result.tolist(), dtype=object), pd.Series(expected, dtype=object))
+
+
+def test_series_casts_return_arrays_for_arrays():
+    result = data_helpers.cast_as_float_series(np.array(['1.5', None, 'x'], dtype=object))
+    assert isinstance(result, np.ndarray)
+    np.testing.assert_array_equal(result, [1.5, 0.0, 0.0])
+    np.testing.assert_array_equal(data_helpers.cast_as_int_series([2.9, None]), [2, 0])
+
+
+def _dirty_frame():
+    return pd.DataFrame({
+        'NAME': ['café', 'plain', 'say "hi\n"', None, 'café', ''],
+        'CODE': [b'ab\xc3\xa9', b'cd', None, b'ab\xc3\xa9', b'', b'x'],
+        'MIXED': np.array([1, 2.5, 'naïve', None, np.nan, True], dtype=object),
+        'AMOUNT': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        'REGION': pd.Categorical(['Zürich', 'Bern', 'Zürich', 'Bern', None, 'Bern']),
+    }, index=[5, 4, 3, 2, 1, 0])
+
+
+def test_clean_frame_cleans_text_columns():
+    df = _dirty_frame()
+    result = data_helpers.clean_frame(df)
+    assert result is df
+    assert result['NAME'].tolist() == ['caf', 'plain', 'say "hi"', ' ', 'caf', '']
+    assert result['CODE'].tolist() == ['ab', 'cd', ' ', 'ab', '', 'x']
+    assert result['MIXED'].tolist() == ['1', '2.5', 'nave', ' ', ' ', 'True']
+    assert list(result.index) == [5, 4, 3, 2, 1, 0]
+    # Only object columns are cleaned
+    pd.testing.assert_series_equal(result['AMOUNT'], _dirty_frame()['AMOUNT'])
+    pd.testing.assert_series_equal(result['REGION'], _dirty_frame()['REGION'])
+
+
+def test_clean_frame_in_parallel_matches_serial():
+    pd.testing.assert_frame_equal(
+        data_helpers.clean_frame(_dirty_frame(), max_workers=3), data_helpers.clean_frame(_dirty_frame())
+    )
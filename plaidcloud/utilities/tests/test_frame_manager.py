@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import ast
+import time
 import unittest
+from unittest import mock
 import pytest
 import numpy as np
 import pandas as pd
@@ -322,6 +325,725 @@ class TestFrameManager(unittest.TestCase):
         del self.df6
 
 
+class TestDownload(unittest.TestCase):
+    """download() should give the same result sequentially and on a thread pool."""
+
+    def setUp(self):
+        self.conn = mock.MagicMock()
+        self.tables = []
+        for i in range(6):
+            table_obj = mock.MagicMock()
+            table_obj.cols.return_value = [{'id': 'a'}]
+            table_obj.i = i
+            self.tables.append({'table_name': f'/t{i}', 'table_object': table_obj})
+
+        def get_dataframe(table_obj, clean=False):
+            # Later tables finish first, so ordering must come from the input.
+            time.sleep(0.01 * (6 - table_obj.i))
+            return pd.DataFrame({'a': [table_obj.i]})
+
+        self.conn.get_dataframe.side_effect = get_dataframe
+
+    def test_parallel_keeps_input_order(self):
+        expected = frame_manager.download(self.tables, configuration={}, conn=self.conn)
+        result = frame_manager.download(self.tables, configuration={}, conn=self.conn, max_workers=4)
+        self.assertEqual([d['name'] for d in result], [f'/t{i}' for i in range(6)])
+        for e, r in zip(expected, result):
+            self.assertEqual(e['name'], r['name'])
+            assertFrameEqual(e['df'], r['df'])
+
+    def test_parallel_retries_per_table(self):
+        attempts = {}
+
+        def flaky(query):
+            attempts[query] = attempts.get(query, 0) + 1
+            if attempts[query] < 3:
+                raise IOError('dropped')
+            return pd.DataFrame({'a': [query]})
+
+        self.conn.get_dataframe_by_querystring.side_effect = flaky
+        tables = [dict(t, query=f'SELECT {i}') for i, t in enumerate(self.tables)]
+        result = frame_manager.download(tables, configuration={}, conn=self.conn, max_workers=3)
+        self.assertEqual([d['df']['a'][0] for d in result], [f'SELECT {i}' for i in range(6)])
+        self.assertEqual(set(attempts.values()), {3})
+
+
+class TestApplyRules(unittest.TestCase):
+    """The vectorized rule engine should reproduce the row by row engine exactly."""
+
+    def setUp(self):
+        self.logger = mock.MagicMock()
+        self.df = pd.DataFrame({
+            'ACCOUNT': ['a', 'b', 'c', 'a', 'b', 'c', 'd', 'd'],
+            'ENTITY': [1, 2, 3, 4, 1, 2, 3, 4],
+            'amount': [10.0, -5.0, 2.5, 0.0, 7.0, -1.0, 3.0, 8.0],
+        })
+        self.df_rules = pd.DataFrame([
+            {'condition': "ACCOUNT == 'a'", 'value': 'A', 'iteration': 1, 'rule_id': 'r0'},
+            {'condition': 'amount > 5', 'value': 'BIG', 'iteration': 1, 'rule_id': 'r1'},
+            {'condition': 'ACCOUNT ==', 'value': 'BAD', 'iteration': 1, 'rule_id': 'r2'},
+            {'condition': "ACCOUNT == 'a'", 'value': 'NEVER', 'iteration': 1, 'rule_id': 'r3'},
+            {'condition': 'ENTITY in [2, 3]', 'value': '', 'iteration': 1, 'rule_id': 'r4'},
+            {'condition': "value == 'A' and ENTITY > 1", 'value': 'A2', 'iteration': 2, 'rule_id': 'r5'},
+            {'condition': '', 'value': 'REST', 'iteration': 2, 'rule_id': 'r6'},
+            {'condition': "ACCOUNT == 'z'", 'value': 'Z', 'iteration': 2, 'rule_id': 'r7'},
+        ])
+
+    def assertEnginesMatch(self, **kwargs):
+        expected = frame_manager.apply_rules(self.df.copy(), self.df_rules, logger=self.logger, **kwargs)
+        result = frame_manager.apply_rules(self.df.copy(), self.df_rules, logger=self.logger, vectorized=True, **kwargs)
+        pd.testing.assert_frame_equal(expected[0], result[0])
+        pd.testing.assert_frame_equal(expected[1], result[1])
+        return result
+
+    def test_matches_row_by_row_engine(self):
+        df, df_summary = self.assertEnginesMatch()
+        self.assertEqual(list(df['value']), ['REST', 'REST', 'REST', 'A2', 'REST', 'REST', 'REST', 'REST'])
+        self.assertEqual(list(df_summary['matched_records']), [2, 2, 0, 0, 4, 0, 1, 7, 0])
+
+    def test_show_rules(self):
+        df, _ = self.assertEnginesMatch(show_rules=True, rule_id_column='rule_id')
+        self.assertEqual(df['rule_number'][0], '0')
+        self.assertEqual(df['rule_number'][3], '0, 5')
+        self.assertEqual(df['rule_id'][1], 'r4')
+        self.assertTrue(df['log'].str.startswith('<').all())
+
+    def test_blocks(self):
+        with mock.patch.object(frame_manager, '_RULE_BLOCK_SIZE', 2):
+            self.assertEnginesMatch(show_rules=True)
+
+    def test_raise_exceptions(self):
+        with self.assertRaises(Exception):
+            frame_manager.apply_rules(
+                self.df.copy(), self.df_rules, logger=self.logger, vectorized=True, raise_exceptions=True
+            )
+
+    def test_include_once_false_uses_row_by_row_engine(self):
+        self.df_rules = self.df_rules[self.df_rules['rule_id'] != 'r2']
+        self.assertEnginesMatch(include_once=False)
+
+    def test_compile_condition(self):
+        self.assertEqual(frame_manager._compile_condition("ACCOUNT == 'a' & ENTITY in (1, 2)"), (
+            ("ACCOUNT == 'a'", 'ACCOUNT', ast.Eq, 'a'),
+            ('ENTITY in (1, 2)', 'ENTITY', ast.In, (1, 2)),
+        ))
+        self.assertEqual(
+            frame_manager._compile_condition('amount > 5 | ENTITY == 1'),
+            (('amount > 5 or ENTITY == 1', None, None, None),),
+        )
+        self.assertEqual(frame_manager._compile_condition('`my col` == 1'), (('`my col` == 1', None, None, None),))
+        self.assertIs(
+            frame_manager._compile_condition("ACCOUNT == 'a'"), frame_manager._compile_condition("ACCOUNT == 'a'")
+        )
+
+    def test_shared_terms_are_evaluated_once(self):
+        self.df_rules = pd.DataFrame([
+            {'condition': "ACCOUNT == 'a' and ENTITY == 1", 'value': 'A1'},
+            {'condition': "ACCOUNT == 'a' & ENTITY == 4", 'value': 'A4'},
+            {'condition': "ENTITY == 4 and ACCOUNT != 'a'", 'value': 'X4'},
+            {'condition': "ACCOUNT.str.startswith('c')", 'value': 'C'},
+        ])
+        with mock.patch.object(frame_manager, '_term_mask', wraps=frame_manager._term_mask) as term_mask:
+            df, _ = self.assertEnginesMatch()
+        self.assertEqual(list(df['value']), ['A1', '', 'C', 'A4', '', 'C', '', 'X4'])
+        # Five distinct terms per engine
+        self.assertEqual(term_mask.call_count, 10)
+
+    def test_apply_rule(self):
+        rules = [
+            {'condition': "ACCOUNT == 'a' & ENTITY > 1", 'value': 'A'},
+            {'condition': "ACCOUNT in ['a', 'b']", 'value': 'AB'},
+            {'condition': 'amount < 0', 'value': 'NEG'},
+        ]
+        with mock.patch('builtins.print'):
+            df = frame_manager.apply_rule(self.df.copy(), rules)
+        self.assertEqual(list(df['value']), ['A', 'AB', 'AB', 'AB', 'NEG'])
+        self.assertEqual(list(df['ACCOUNT']), ['a', 'a', 'b', 'b', 'c'])
+
+    def test_aggregate_condition_sees_only_remaining_rows(self):
+        df = pd.DataFrame({'amount': [0.0, 0.0, 0.0] + [10.0] * 7})
+        rules = [
+            {'condition': 'amount < 1', 'value': 'LOW'},
+            {'condition': 'amount > amount.mean()', 'value': 'HIGH'},
+        ]
+        result, summary = frame_manager.apply_rules(df.copy(), pd.DataFrame(rules), logger=self.logger)
+        self.assertEqual(list(result['value']), ['LOW'] * 3 + [''] * 7)
+        self.assertEqual(list(summary['matched_records']), [3, 0, 7])
+
+        with mock.patch('builtins.print'):
+            result = frame_manager.apply_rule(df.copy(), rules)
+        self.assertEqual(list(result['value']), ['LOW'] * 3)
+
+
+class TestLookupIndex(unittest.TestCase):
+    """LookupIndex.probe should give the same result as a merge based lookup."""
+
+    def setUp(self):
+        self.rates = pd.DataFrame({
+            'SOURCE': ['EUR', 'GBP', 'EUR', 'USD', None],
+            'TARGET': ['USD', 'USD', 'USD', 'JPY', 'USD'],
+            'RATE': [1.1, 1.3, 1.2, 110.0, 0.0],
+            'TYPE': [1, 1, 2, 1, 1],
+        })
+        self.df = pd.DataFrame({
+            'SOURCE': ['GBP', 'EUR', 'CAD', None],
+            'MIDDLE': ['USD', 'USD', 'USD', 'USD'],
+            'TARGET': ['USD', 'JPY', 'USD', 'USD'],
+            'TYPE': ['a', 'b', 'c', 'd'],
+        }, index=[10, 20, 30, 40])
+
+    def assertMatchesMerge(self, result, left_on, right_on, keep_columns=None):
+        distinct = self.rates.drop_duplicates(subset=right_on)
+        if keep_columns is not None:
+            distinct = distinct[right_on + keep_columns]
+        expected = pd.merge(self.df, distinct, left_on=left_on, right_on=right_on, how='left')
+        expected = expected.drop(columns=[right for left, right in zip(left_on, right_on) if left != right])
+        pd.testing.assert_frame_equal(expected, result)
+
+    def test_probe(self):
+        rates_index = frame_manager.LookupIndex(self.rates, ['SOURCE', 'TARGET'])
+        self.assertEqual(len(rates_index.frame), 4)
+        result = rates_index.probe(self.df)
+        self.assertMatchesMerge(result, ['SOURCE', 'TARGET'], ['SOURCE', 'TARGET'])
+        self.assertEqual(list(result.columns), ['SOURCE', 'MIDDLE', 'TARGET', 'TYPE_x', 'RATE', 'TYPE_y'])
+        self.assertEqual(list(result['RATE'].fillna(-1)), [1.3, -1, -1, 0.0])
+
+    def test_probe_other_keys(self):
+        rates_index = frame_manager.LookupIndex(self.rates, ['SOURCE', 'TARGET'], keep_columns=['RATE'])
+        self.rates.loc[0, 'RATE'] = 99.0  # the index keeps its own copy
+        result = rates_index.probe(self.df, ['MIDDLE', 'TARGET'])
+        self.rates.loc[0, 'RATE'] = 1.1
+        self.assertEqual(list(result.columns), ['SOURCE', 'MIDDLE', 'TARGET', 'TYPE', 'RATE'])
+        self.assertEqual(list(result['RATE'].fillna(-1)), [-1, 110.0, -1, -1])
+        assertFrameEqual(
+            frame_manager.lookup(self.df, self.rates, ['MIDDLE', 'TARGET'], ['SOURCE', 'TARGET'], keep_columns=['RATE']),
+            result,
+        )
+
+    def test_exclude_duplicate_columns(self):
+        result = frame_manager.LookupIndex(self.rates, 'SOURCE').probe(self.df, exclude_duplicate_columns=True)
+        self.assertEqual(list(result.columns), ['SOURCE', 'MIDDLE', 'TARGET', 'TYPE', 'RATE'])
+        self.assertEqual(list(result.index), [0, 1, 2, 3])
+
+    def test_mismatched_key_types(self):
+        rates_index = frame_manager.LookupIndex(self.rates, 'TYPE')
+        with self.assertRaises(ValueError):
+            rates_index.probe(self.df)
+
+
+class TestConvertCurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.rates = pd.DataFrame({
+            'PERIOD': ['2020-01', '2020-01', '2020-01', '2020-02', '2020-02', '2019-12'],
+            'RATE': [1.25, 0.5, 100.0, 1.5, 3.0, 9.0],
+            'CURRENCY_SOURCE': ['EUR', 'USD', 'USD', 'EUR', 'GBP', 'CAD'],
+            'CURRENCY_TARGET': ['USD', 'EUR', 'JPY', 'USD', 'EUR', 'USD'],
+        })
+        self.df = pd.DataFrame({
+            'PERIOD': ['2020-01', '2020-01', '2020-01', '2020-02', '2020-02', '2020-02', '2020-01'],
+            'AMOUNT': [10.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0],
+            'FROM': ['EUR', 'USD', 'JPY', 'GBP', 'EUR', 'CAD', 'JPY'],
+            'TO': ['USD', 'EUR', 'EUR', 'USD', 'USD', 'USD', 'XXX'],
+        }, index=[7, 6, 5, 4, 3, 2, 1])
+
+    def convert(self, **kwargs):
+        kwargs.setdefault('df_rates', self.rates)
+        return frame_manager.convert_currency(
+            self.df, source_amount_column='AMOUNT', target_amount_column='CONVERTED',
+            source_frame_source_currency='FROM', source_frame_target_currency='TO', **kwargs
+        )
+
+    def test_convert_currency(self):
+        result = self.convert()
+        self.assertEqual(list(result.columns), ['PERIOD', 'AMOUNT', 'FROM', 'TO', 'RATE', 'CONVERTED'])
+        self.assertEqual(list(result.index), list(range(7)))
+        # Loaded EUR->USD beats the flipped USD->EUR, and is taken from the first period it is found in.
+        # JPY->EUR goes through USD, GBP->USD has no route, CAD has no rate in the periods in use and XXX none at all
+        np.testing.assert_allclose(result['RATE'], [1.25, 0.5, 0.005, 0.0, 1.25, 0.0, 0.0])
+        np.testing.assert_allclose(result['CONVERTED'], result['AMOUNT'] * result['RATE'])
+        self.assertNotIn('RATE', self.df.columns)
+
+    def test_by_period(self):
+        result = self.convert(by_period=True)
+        np.testing.assert_allclose(result['RATE'], [1.25, 0.5, 0.005, 0.0, 1.5, 0.0, 0.0])
+
+    def test_intermediate_currency(self):
+        self.df['TO'] = 'JPY'
+        result = self.convert()
+        # Through USD unless there is a direct rate
+        np.testing.assert_allclose(result['RATE'], [125.0, 100.0, 1.0, 0.0, 125.0, 0.0, 1.0])
+        result = self.convert(intermediate_currency='EUR')
+        np.testing.assert_allclose(result['RATE'], [0.0, 100.0, 1.0, 0.0, 0.0, 0.0, 1.0])
+        result = self.convert(intermediate_currency=['EUR', 'USD'])
+        np.testing.assert_allclose(result['RATE'], [125.0, 100.0, 1.0, 0.0, 125.0, 0.0, 1.0])
+
+    def test_currency_rates(self):
+        expected = self.convert(by_period=True)
+        currency_rates = frame_manager.CurrencyRates(self.rates)
+        with mock.patch.object(frame_manager, '_rate_matrix', wraps=frame_manager._rate_matrix) as rate_matrix:
+            for _ in range(3):
+                assertFrameEqual(expected, self.convert(df_rates=currency_rates, by_period=True))
+        # One matrix per period, each worked out once
+        self.assertEqual(rate_matrix.call_count, 2)
+        np.testing.assert_allclose(
+            currency_rates.find_rates(self.df, 'FROM', 'TO'), [1.25, 0.5, 0.005, 0.0, 1.25, 0.0, 0.0]
+        )
+
+    def test_currency_rates_save_load(self):
+        import os
+        import tempfile
+        currency_rates = frame_manager.CurrencyRates(self.rates, intermediate_currencies=['EUR', 'USD'])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'rates.feather')
+            currency_rates.save(path)
+            loaded = frame_manager.CurrencyRates.load(path)
+            self.assertEqual(loaded.intermediate_currencies, ['EUR', 'USD'])
+            assertFrameEqual(currency_rates.rates, loaded.rates)
+            assertFrameEqual(self.convert(df_rates=currency_rates), self.convert(df_rates=loaded))
+
+
+class TestJoins(unittest.TestCase):
+
+    def setUp(self):
+        self.left = pd.DataFrame({
+            'ENTITY': ['E1', 'E1', 'E2', None, 'E3'],
+            'YEAR': [2020, 2021, 2020, 2020, 2021],
+            'AMOUNT': [1.0, 2.0, 3.0, 4.0, 5.0],
+        }, index=[10, 11, 12, 13, 14])
+        self.right = pd.DataFrame({
+            'ENTITY': ['E1', 'E2', None, 'E1'],
+            'YEAR': [2020, 2020, 2020, 2021],
+            'AMOUNT': [7, 8, 9, 10],
+            'REGION': ['N', 'S', 'W', 'N'],
+            'SIZE': [1, 2, 3, 4],
+        })
+
+    def test_multi_column_keys(self):
+        on = ['ENTITY', 'YEAR']
+        for join, how in ((frame_manager.left_join, 'left'), (frame_manager.inner_join, 'inner')):
+            pd.testing.assert_frame_equal(
+                join(self.left, self.right, on), pd.merge(self.left, self.right, on=on, how=how)
+            )
+            pd.testing.assert_frame_equal(
+                join(self.left, self.right, on, keep_columns=['REGION']),
+                pd.merge(self.left, self.right[['ENTITY', 'REGION', 'YEAR']], on=on, how=how),
+            )
+
+    def test_duplicate_right_keys(self):
+        right = pd.concat([self.right, self.right.iloc[:1]])
+        for join, how in ((frame_manager.left_join, 'left'), (frame_manager.inner_join, 'inner')):
+            pd.testing.assert_frame_equal(
+                join(self.left, right, ['ENTITY', 'YEAR']), pd.merge(self.left, right, on=['ENTITY', 'YEAR'], how=how)
+            )
+
+    def test_validate(self):
+        frame_manager.left_join(self.left, self.right, ['ENTITY', 'YEAR'], validate='one_to_one')
+        with self.assertRaises(pd.errors.MergeError):
+            frame_manager.left_join(self.left, self.right, 'ENTITY', validate='many_to_one')
+        with self.assertRaises(pd.errors.MergeError):
+            frame_manager.inner_join(self.right, self.left, 'YEAR', validate='1:m')
+        with self.assertRaises(pd.errors.MergeError):
+            frame_manager.outer_join(self.left, self.right, 'ENTITY', validate='1:1')
+
+    def test_anti_join(self):
+        right = pd.concat([self.right, self.right.iloc[:1]])
+        result = frame_manager.anti_join(self.left, right, ['ENTITY'])
+        # Numbered as the rows of the left join they are taken from
+        self.assertEqual(list(result.index), [8])
+        self.assertEqual(list(result['ENTITY']), ['E3'])
+        result = frame_manager.anti_join(self.left, right, ['ENTITY', 'YEAR'])
+        self.assertEqual(list(result['AMOUNT']), [5.0])
+
+
+class TestAllocate(unittest.TestCase):
+
+    def setUp(self):
+        self.df_input = pd.DataFrame({
+            'DEPT': ['D1', 'D1', 'D2', 'D3', 'D4'],
+            'AMOUNT': [100.0, 50.0, 30.0, 20.0, 10.0],
+            'allocable': [1, 1, 1, 1, 0],
+        })
+        self.df_driver = pd.DataFrame({
+            'DEPT': ['D1', 'D1', 'D1', 'D2', 'D2', 'D3', 'D4'],
+            'CC': ['C1', 'C2', 'C3', 'C1', 'C2', 'C1', 'C1'],
+            'HEADCOUNT': [3.0, 1.0, np.nan, 0.0, 0.0, 5.0, 1.0],
+        })
+
+    def allocate(self, **kwargs):
+        return frame_manager.allocate(
+            None, self.df_input.copy(), self.df_driver.copy(), 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT'],
+            **kwargs
+        )
+
+    def test_allocate(self):
+        result = self.allocate()
+        self.assertEqual(list(result['alloc_status']), [1, 1, 1, 1, 1, 0, 0])
+        # Every input amount is either split or passed through
+        self.assertAlmostEqual(result['AMOUNT'].sum(), self.df_input['AMOUNT'].sum())
+        d1 = result[result['DEPT'] == 'D1'].sort_values(['AMOUNT', 'CC'])
+        self.assertEqual(list(d1['CC']), ['C2', 'C2', 'C1', 'C1'])
+        np.testing.assert_allclose(d1['AMOUNT'], [12.5, 25.0, 37.5, 75.0])
+        np.testing.assert_allclose(d1['shred'], [0.25, 0.25, 0.75, 0.75])
+        stranded = result[result['DEPT'].isin(['D2', 'D4'])]
+        self.assertEqual(list(stranded['shred']), [1.0, 1.0])
+        self.assertEqual(list(stranded['allocable']), [0, 0])
+
+    def test_unsplit_shred_stays_integer(self):
+        self.df_input['allocable'] = 0
+        result = self.allocate()
+        self.assertEqual(result['shred'].dtype, np.int64)
+        self.assertEqual(list(result['shred']), [1, 1, 1, 1, 1])
+
+    def test_skip_sort(self):
+        expected = self.allocate()
+        result = self.allocate(sort_by_status=False)
+        # Allocable records, in join order, then the records passed through
+        self.assertEqual(list(result.index), [0, 1, 2, 3, 4, 2, 4])
+        pd.testing.assert_frame_equal(
+            expected.sort_values(['DEPT', 'AMOUNT']).reset_index(drop=True),
+            result.sort_values(['DEPT', 'AMOUNT']).reset_index(drop=True),
+        )
+
+    def test_driver_not_modified(self):
+        df_driver = self.df_driver.copy()
+        frame_manager.allocate(None, self.df_input.copy(), df_driver, 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT'])
+        pd.testing.assert_frame_equal(df_driver, self.df_driver)
+
+
+    def test_split_signs(self):
+        self.df_input = pd.DataFrame({'DEPT': ['D1', 'D1', 'D2'], 'AMOUNT': [100.0, -50.0, 30.0]})
+        self.df_driver = pd.DataFrame({
+            'DEPT': ['D1', 'D1', 'D1', 'D2'],
+            'CC': ['C1', 'C2', 'C3', 'C1'],
+            'HEADCOUNT': [3.0, 1.0, -2.0, -4.0],
+        })
+        mixed = self.allocate()
+        # The netted denominator of 2 splits 100 into 150, 50 and -100
+        np.testing.assert_allclose(mixed.sort_values('AMOUNT')['AMOUNT'].head(1), [-100.0])
+
+        result = self.allocate(split_signs=True).sort_values(['DEPT', 'CC']).reset_index(drop=True)
+        self.assertEqual(list(result['CC']), ['C1', 'C2', 'C3', 'C1'])
+        # Positive amounts over the positive pool, negative amounts over the negative pool, and D2 falls back
+        # to the only pool it has
+        np.testing.assert_allclose(result['AMOUNT'], [75.0, 25.0, -50.0, 30.0])
+        np.testing.assert_allclose(result['shred'], [0.75, 0.25, 1.0, 1.0])
+        self.assertNotIn('__DRIVER_SIGN__', result.columns)
+        self.assertAlmostEqual(result['AMOUNT'].sum(), self.df_input['AMOUNT'].sum())
+
+
+class TestAllocatePartitioned(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.df_input = pd.DataFrame({
+            'DEPT': rng.choice(['D1', 'D2', 'D3', 'D4', 'D5'], 200),
+            'AMOUNT': rng.normal(size=200).round(2),
+        })
+        self.df_driver = pd.DataFrame({
+            'DEPT': rng.choice(['D1', 'D2', 'D3', 'D5'], 40),
+            'CC': rng.choice(['C1', 'C2', 'C3'], 40),
+            'HEADCOUNT': rng.choice([0.0, 1.0, 2.5, -1.0, 4.0], 40),
+        })
+        self.expected = self.sorted(frame_manager.allocate(
+            None, self.df_input.copy(), self.df_driver.copy(), 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT']
+        ))
+
+    @staticmethod
+    def sorted(frame):
+        return frame.sort_values(list(frame.columns), na_position='last').reset_index(drop=True)
+
+    def allocate(self, df_input, **kwargs):
+        return frame_manager.allocate_partitioned(
+            None, df_input, self.df_driver, 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT'], **kwargs
+        )
+
+    def test_matches_allocate(self):
+        for partitions in (1, 3, 8):
+            result = self.allocate(self.df_input, partitions=partitions)
+            self.assertEqual(list(result['alloc_status'].iloc[:1]), [1])
+            pd.testing.assert_frame_equal(self.expected, self.sorted(result)[self.expected.columns])
+        # The inputs are left alone
+        self.assertEqual(list(self.df_input.columns), ['DEPT', 'AMOUNT'])
+
+    def test_chunks_and_output_path(self):
+        import os
+        import tempfile
+        chunks = [self.df_input.iloc[start:start + 64] for start in range(0, len(self.df_input), 64)]
+        with tempfile.TemporaryDirectory() as tmp:
+            files = self.allocate(chunks, partitions=4, spill_dir=tmp, output_path=os.path.join(tmp, 'out'))
+            result = pd.concat([pd.read_parquet(path) for path in files], ignore_index=True)
+            # Only the output is left behind
+            self.assertEqual(os.listdir(tmp), ['out'])
+        pd.testing.assert_frame_equal(self.expected, self.sorted(result)[self.expected.columns])
+
+    def test_process_pool(self):
+        result = self.allocate(self.df_input, partitions=4, processes=2)
+        pd.testing.assert_frame_equal(self.expected, self.sorted(result)[self.expected.columns])
+
+    def test_empty_input(self):
+        import os
+        import tempfile
+        df_empty = self.df_input.iloc[:0]
+        expected = frame_manager.allocate(
+            None, df_empty.copy(), self.df_driver.copy(), 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT']
+        )
+        self.assertEqual(expected.shape, (0, 7))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'empty.parquet')
+            df_empty.to_parquet(path, index=False)
+            for df_input in (df_empty, path, iter([])):
+                result = self.allocate(df_input, partitions=4)
+                pd.testing.assert_frame_equal(expected.reset_index(drop=True), result[expected.columns])
+            self.assertEqual(self.allocate(df_empty, output_path=os.path.join(tmp, 'out')), [])
+
+    def test_empty_driver(self):
+        expected = frame_manager.allocate(
+            None, self.df_input.copy(), self.df_driver.iloc[:0].copy(), 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT']
+        )
+        result = frame_manager.allocate_partitioned(
+            None, self.df_input, iter([]), 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT'], partitions=4
+        )
+        pd.testing.assert_frame_equal(self.sorted(expected), self.sorted(result)[expected.columns])
+
+
+class TestAllocatePipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.df_input = pd.DataFrame({
+            'DEPT': ['D1', 'D1', 'D2', 'D3'],
+            'AMOUNT': [100.0, 50.0, 30.0, 20.0],
+            'UNITS': [10, 5, 3, 2],
+        })
+        self.df_heads = pd.DataFrame({
+            'DEPT': ['D1', 'D1', 'D3'],
+            'CC': ['C1', 'C2', 'C1'],
+            'HEADCOUNT': [3.0, 1.0, 5.0],
+        })
+        self.df_space = pd.DataFrame({
+            'CC': ['C1', 'C1', 'C2'],
+            'SITE': ['S1', 'S2', 'S1'],
+            'SQFT': [1.0, 4.0, 2.0],
+        })
+        self.stages = [
+            {
+                'name': 'heads', 'df_driver': self.df_heads, 'input_data': ['AMOUNT', 'UNITS'], 'input_keys': 'DEPT',
+                'driver_data': 'HEADCOUNT', 'driver_numerator_keys': ['CC'], 'driver_denominator_keys': ['DEPT'],
+            },
+            {
+                'name': 'space', 'df_driver': self.df_space, 'input_data': ['AMOUNT', 'UNITS'], 'input_keys': 'CC',
+                'driver_data': 'SQFT', 'driver_numerator_keys': ['SITE'], 'driver_denominator_keys': ['CC'],
+            },
+        ]
+
+    def test_matches_chained_allocations(self):
+        result, _ = frame_manager.allocate_pipeline(None, self.df_input, self.stages)
+
+        expected = self._chained(self.stages)
+
+        key = ['DEPT', 'SITE', 'AMOUNT']
+        pd.testing.assert_frame_equal(
+            expected.sort_values(key).reset_index(drop=True), result.sort_values(key).reset_index(drop=True)
+        )
+        # The inputs are left alone
+        self.assertEqual(list(self.df_input.columns), ['DEPT', 'AMOUNT', 'UNITS'])
+        self.assertEqual(list(self.df_heads.columns), ['DEPT', 'CC', 'HEADCOUNT'])
+
+    def _chained(self, stages, reallocate=False):
+        result = self.df_input.copy()
+        for stage in stages:
+            drop = ['shred', 'alloc_status', '__DRIVER_VALUE__'] + (['allocable'] if reallocate else [])
+            result = result.drop(columns=[col for col in drop if col in result])
+            result = frame_manager.allocate(
+                None, result, stage['df_driver'].copy(), stage['input_data'], stage['input_keys'],
+                stage['driver_data'], stage['driver_numerator_keys'], stage['driver_denominator_keys'],
+            )
+        return result
+
+    def _stranding_stages(self, **second):
+        # D2 has no headcount, so the first stage strands it, but the second stage's driver covers it.
+        df_sites = pd.DataFrame({
+            'DEPT': ['D1', 'D2', 'D3'],
+            'SITE': ['S1', 'S2', 'S1'],
+            'SQFT': [1.0, 1.0, 1.0],
+        })
+        return [
+            self.stages[0],
+            dict(
+                name='sites', df_driver=df_sites, input_data=['AMOUNT', 'UNITS'], input_keys='DEPT',
+                driver_data='SQFT', driver_numerator_keys=['SITE'], driver_denominator_keys=['DEPT'], **second,
+            ),
+        ]
+
+    def test_stranded_records_stay_stranded(self):
+        stages = self._stranding_stages()
+        result, control = frame_manager.allocate_pipeline(None, self.df_input, stages)
+
+        expected = self._chained(stages)
+        key = ['DEPT', 'CC', 'AMOUNT']
+        pd.testing.assert_frame_equal(
+            expected.sort_values(key).reset_index(drop=True), result.sort_values(key).reset_index(drop=True)
+        )
+        stranded = result[result['DEPT'] == 'D2']
+        self.assertEqual(list(stranded['alloc_status']), [0])
+        self.assertTrue(stranded['SITE'].isna().all())
+        np.testing.assert_allclose(control['stranded'], [30.0, 3.0, 30.0, 3.0])
+
+    def test_reallocate_stranded_stage(self):
+        stages = self._stranding_stages(reallocate_stranded=True)
+        result, control = frame_manager.allocate_pipeline(None, self.df_input, stages)
+
+        expected = self._chained(stages, reallocate=True)
+        key = ['DEPT', 'CC', 'AMOUNT']
+        pd.testing.assert_frame_equal(
+            expected.sort_values(key).reset_index(drop=True), result.sort_values(key).reset_index(drop=True)
+        )
+        self.assertEqual(list(result.loc[result['DEPT'] == 'D2', 'SITE']), ['S2'])
+        np.testing.assert_allclose(control['stranded'], [30.0, 3.0, 0.0, 0.0])
+
+    def test_shared_driver_prepared_once(self):
+        stages = [
+            dict(self.stages[0], name='first', input_data='AMOUNT'),
+            dict(self.stages[0], name='second', input_data='UNITS'),
+        ]
+        with mock.patch.object(
+            frame_manager, '_prepare_allocation_driver', wraps=frame_manager._prepare_allocation_driver
+        ) as prepare:
+            _, control = frame_manager.allocate_pipeline(None, self.df_input, stages)
+        self.assertEqual(prepare.call_count, 1)
+        self.assertEqual(list(control['stage']), ['first', 'second'])
+        np.testing.assert_allclose(control['difference'], [0.0, 0.0], atol=1e-9)
+
+    def test_control_totals(self):
+        logger = mock.Mock()
+        _, control = frame_manager.allocate_pipeline(logger, self.df_input, self.stages)
+        self.assertEqual(list(control['stage']), ['heads', 'heads', 'space', 'space'])
+        self.assertEqual(list(control['column']), ['AMOUNT', 'UNITS', 'AMOUNT', 'UNITS'])
+        np.testing.assert_allclose(control['input'], [200.0, 20.0, 200.0, 20.0])
+        np.testing.assert_allclose(control['allocated'], [170.0, 17.0, 170.0, 17.0])
+        np.testing.assert_allclose(control['stranded'], [30.0, 3.0, 30.0, 3.0])
+        np.testing.assert_allclose(control['difference'], [0.0, 0.0, 0.0, 0.0], atol=1e-9)
+        self.assertEqual(logger.debug.call_count, 4)
+
+
+class TestCategorical(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'ACCOUNT': ['a', 'b', None, 'a', 'c', 'b'],
+            'ENTITY': ['e1', 'e2', 'e1', 'e3', 'e2', 'e1'],
+            'AMOUNT': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        })
+        self.df_cat = self.df.astype({'ACCOUNT': 'category', 'ENTITY': 'category'})
+
+    def test_rules_match_object_columns(self):
+        df_rules = pd.DataFrame({
+            'condition': ["ACCOUNT == 'a'", "ENTITY in ['e2', 'e3']", "ACCOUNT != 'b'", "ACCOUNT not in ['a']"],
+            'value': ['first', 'second', 'third', 'fourth'],
+            'iteration': [1, 1, 2, 2],
+        })
+        for vectorized in (False, True):
+            expected = frame_manager.apply_rules(
+                self.df.copy(), df_rules, target_columns=['value'], logger=mock.Mock(), vectorized=vectorized
+            )
+            result = frame_manager.apply_rules(
+                self.df_cat.copy(), df_rules, target_columns=['value'], logger=mock.Mock(), vectorized=vectorized
+            )
+            self.assertIsInstance(result[0]['ACCOUNT'].dtype, pd.CategoricalDtype)
+            self.assertEqual(list(expected[0]['value']), list(result[0]['value']))
+
+    def test_summarize_keeps_categories(self):
+        result = frame_manager.summarize(self.df_cat, ['ACCOUNT'], ['AMOUNT', 'ENTITY'])
+        self.assertIsInstance(result['ACCOUNT'].dtype, pd.CategoricalDtype)
+        expected = frame_manager.summarize(self.df, ['ACCOUNT'], ['AMOUNT', 'ENTITY'])
+        pd.testing.assert_frame_equal(
+            expected.sort_values('ACCOUNT').reset_index(drop=True),
+            result.astype({'ACCOUNT': object}).sort_values('ACCOUNT').reset_index(drop=True),
+        )
+
+    def test_allocate_keeps_categorical_keys(self):
+        df_input = pd.DataFrame({'DEPT': ['d1', 'd2', 'd3'], 'AMOUNT': [100.0, 50.0, 10.0]}).astype({'DEPT': 'category'})
+        df_driver = pd.DataFrame({
+            'DEPT': ['d1', 'd1', 'd2'],
+            'CC': ['c1', 'c2', 'c1'],
+            'HEADCOUNT': [1.0, 3.0, 2.0],
+        }).astype({'DEPT': 'category', 'CC': 'category'})
+        result = frame_manager.allocate(None, df_input, df_driver, 'AMOUNT', 'DEPT', 'HEADCOUNT', ['CC'], ['DEPT'])
+        self.assertIsInstance(result['DEPT'].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(result['CC'].dtype, pd.CategoricalDtype)
+        allocated = result[result['alloc_status'] == 1].sort_values(['DEPT', 'CC'])
+        np.testing.assert_allclose(allocated['AMOUNT'], [25.0, 75.0, 50.0])
+        self.assertAlmostEqual(result['AMOUNT'].sum(), 160.0)
+
+    def test_typed_psv_round_trip(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'frame.psv')
+            frame_manager.save_typed_psv(self.df_cat, path)
+            result = frame_manager.load_typed_psv(path, categorical=True)
+            plain = frame_manager.load_typed_psv(path)
+        self.assertIsInstance(result['ENTITY'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(result['ENTITY'].cat.categories), ['e1', 'e2', 'e3'])
+        self.assertEqual(plain['ENTITY'].dtype, np.dtype(object))
+        self.assertEqual(list(result['ENTITY'].astype(object)), list(self.df['ENTITY']))
+
+
+class TestTypedFeather(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.df = pd.DataFrame({
+            'ENTITY': pd.Categorical(['e1', 'e2', 'e1']),
+            'ACCOUNT': ['a', None, 'c'],
+            'AMOUNT': [1.5, np.nan, 3.0],
+            'UNITS': np.array([1, 2, 3], dtype=np.int32),
+            'POSTED': pd.to_datetime(['2024-01-01', None, '2024-03-01']),
+            'ACTIVE': [True, False, True],
+        })
+
+    def test_round_trip_keeps_dtypes(self):
+        import os
+        path = os.path.join(self.tmp.name, 'frame.feather')
+        frame_manager.save_typed_feather(self.df, path)
+        pd.testing.assert_frame_equal(frame_manager.load_typed_feather(path), self.df)
+        self.assertEqual(frame_manager.typed_feather_types(path), {
+            'ENTITY': 'text',
+            'ACCOUNT': 'text',
+            'AMOUNT': 'numeric',
+            'UNITS': 'integer',
+            'POSTED': 'timestamp',
+            'ACTIVE': 'boolean',
+        })
+
+    def test_mixed_text_saved_as_text(self):
+        import os
+        path = os.path.join(self.tmp.name, 'mixed.feather')
+        frame_manager.save_typed_feather(pd.DataFrame({'CODE': [1, 'a', None]}), path)
+        self.assertEqual(frame_manager.load_typed_feather(path)['CODE'].tolist(), ['1', 'a', None])
+
+    def test_dwim_feather(self):
+        import os
+        frame_manager.dwim_save(self.df, 'frame', localdir=self.tmp.name, extension='feather')
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'frame.feather')))
+        result = frame_manager.dwim_load('frame', localdir=self.tmp.name, extension='feather')
+        pd.testing.assert_frame_equal(result, self.df)
+
+    def test_load_caches_as_feather(self):
+        import os
+        configuration = {'LOCAL_STORAGE': self.tmp.name}
+        with mock.patch.object(frame_manager, 'Table'), mock.patch.object(
+            frame_manager, 'download', return_value=[{'df': self.df, 'name': '/frame'}]
+        ):
+            frame_manager.load(
+                'frame', cache_locally=True, configuration=configuration, conn=mock.Mock(), cache_format='feather'
+            )
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'frame.feather')))
+
+        result = frame_manager.load('frame', fetch=False, configuration=configuration, cache_format='feather')
+        pd.testing.assert_frame_equal(result, self.df)
+
+
 class TestCoalesce(unittest.TestCase):
     def setUp(self):
         self.reference_data = {
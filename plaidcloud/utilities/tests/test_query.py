@@ -3,6 +3,7 @@
 import csv
 import os
 import tempfile
+import time
 import unittest
 import uuid
 from unittest.mock import MagicMock, patch, mock_open, ANY
@@ -385,6 +386,72 @@ class TestCompiled(unittest.TestCase):
         self.assertIn('"driver_name" FROM', q)
 
 
+    def _tbl(self):
+        return sqlalchemy.Table(
+            't', sqlalchemy.MetaData(),
+            sqlalchemy.Column('a', sqlalchemy.Integer),
+            sqlalchemy.Column('b', sqlalchemy.String),
+        )
+
+    def test_cached_statement_gets_fresh_params(self):
+        conn = make_connection()
+        tbl = self._tbl()
+        q1, p1 = conn._compiled(sqlalchemy.select(tbl.c.a).where(tbl.c.a == 5).limit(10))
+        with patch.object(sqlalchemy.sql.Select, 'compile') as compile_:
+            q2, p2 = conn._compiled(sqlalchemy.select(tbl.c.a).where(tbl.c.a == 7).limit(20))
+        compile_.assert_not_called()
+        self.assertEqual(q1, q2)
+        self.assertEqual(sorted(p1.values()), [5, 10])
+        self.assertEqual(sorted(p2.values()), [7, 20])
+        self.assertEqual(len(conn._compiled_cache), 1)
+
+    def test_expanding_params_not_cached(self):
+        conn = make_connection()
+        tbl = self._tbl()
+        q1, p1 = conn._compiled(sqlalchemy.select(tbl.c.a).where(tbl.c.a.in_([1, 2])))
+        q2, p2 = conn._compiled(sqlalchemy.select(tbl.c.a).where(tbl.c.a.in_([1, 2, 3])))
+        self.assertNotEqual(q1, q2)
+        self.assertEqual(sorted(p2.values()), [1, 2, 3])
+        self.assertEqual(list(conn._compiled_cache.values()), [Connection._RENDER_POSTCOMPILE])
+
+    def test_expanding_params_compiled_once_per_call(self):
+        conn = make_connection()
+        tbl = self._tbl()
+        compile_ = sqlalchemy.sql.Select.compile
+        with patch.object(sqlalchemy.sql.Select, 'compile', autospec=True, side_effect=compile_) as spy:
+            for values in ([1, 2], [1, 2, 3], [4]):
+                q, params = conn._compiled(sqlalchemy.select(tbl.c.a).where(tbl.c.a.in_(values)))
+        # One extra compile on the first call to find out the SQL can't be shared, then
+        # only the render per call.
+        self.assertEqual(spy.call_count, 4)
+        self.assertIn('IN (%(a_1_1)s)', q)
+        self.assertEqual(list(params.values()), [4])
+
+    def test_compiled_cache_is_bounded(self):
+        conn = make_connection()
+        tbl = self._tbl()
+        with patch.object(query, '_COMPILED_CACHE_SIZE', 2):
+            for col in ('a', 'b', 'a'):
+                conn._compiled(sqlalchemy.select(tbl.c[col]))
+            conn._compiled(sqlalchemy.select(tbl.c.a, tbl.c.b))
+        # 'a' was used more recently than 'b', so 'b' is the one evicted.
+        def key(stmt):
+            return stmt._generate_cache_key().key, conn.dialect.name
+
+        self.assertEqual(
+            list(conn._compiled_cache),
+            [key(sqlalchemy.select(tbl.c.a)), key(sqlalchemy.select(tbl.c.a, tbl.c.b))],
+        )
+
+    def test_sql_logged_at_info_only_with_log_sql(self):
+        tbl = self._tbl()
+        for log_sql, level in ((False, 'DEBUG'), (True, 'INFO')):
+            with patch.object(query, 'Dimensions'):
+                conn = Connection(rpc=make_mock_rpc(), log_sql=log_sql)
+            with self.assertLogs(query.logger, level='DEBUG') as logs:
+                conn._compiled(sqlalchemy.select(tbl.c.a))
+            self.assertEqual({r.levelname for r in logs.records}, {level})
+
 # ---------------------------------------------------------------------------
 # Connection.get_csv / get_csv_by_query
 # ---------------------------------------------------------------------------
@@ -515,6 +582,52 @@ class TestCsvStream(unittest.TestCase):
             os.remove(f.name)
 
 
+    def test_batched_matches_row_stream(self):
+        columns = [
+            sqlalchemy.Column('i', sqlalchemy.Integer),
+            sqlalchemy.Column('n', sqlalchemy.Numeric),
+            sqlalchemy.Column('d', sqlalchemy.DateTime),
+            sqlalchemy.Column('t', sqlalchemy.Interval),
+            sqlalchemy.Column('s', sqlalchemy.String),
+        ]
+        f = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='')
+        f.write('i,n,d,t,s\n')
+        f.write('3,1.5,2024-01-02,1 day,a\n')
+        f.write(',,2024-02-03,2 days,\n')
+        f.write('7,2\n')  # short row, trailing cells are None
+        f.write('9,-4.25,2024-03-04 10:11:12,3 hours,z\n')
+        f.close()
+        try:
+            for preserve_nulls in (True, False):
+                expected = list(self.conn._csv_stream(f.name, columns, preserve_nulls))
+                for batch_rows in (1, 2, 100):
+                    rows = list(self.conn._csv_stream_batched(f.name, columns, preserve_nulls, batch_rows))
+                    self.assertEqual(rows, expected, (preserve_nulls, batch_rows))
+            rows = list(self.conn._csv_stream_batched(f.name, columns, True, 10))
+            self.assertIsNone(rows[2]['d'])
+            self.assertEqual(rows[3]['t'], pd.Timedelta('3 hours'))
+            self.assertIsInstance(rows[0]['i'], int)
+        finally:
+            os.remove(f.name)
+
+    def test_batched_falls_back_to_per_cell_errors(self):
+        columns = [sqlalchemy.Column('i', sqlalchemy.Integer)]
+        path = self._write_csv(['i'], [{'i': '1'}, {'i': 'x'}])
+        try:
+            with self.assertRaises(ValueError):
+                list(self.conn._csv_stream_batched(path, columns, True, 10))
+        finally:
+            os.remove(path)
+
+    def test_untyped_columns_pass_through(self):
+        path = self._write_csv(['i', 'other'], [{'i': '1', 'other': 'x'}])
+        try:
+            rows = list(self.conn._csv_stream(path, [sqlalchemy.Column('i', sqlalchemy.Integer)], True))
+        finally:
+            os.remove(path)
+        self.assertEqual(rows, [{'i': 1, 'other': 'x'}])
+
+
 # ---------------------------------------------------------------------------
 # Connection._get_df_from_csv
 # ---------------------------------------------------------------------------
@@ -579,6 +692,225 @@ class TestGetDfFromCsv(unittest.TestCase):
             os.remove(path)
         self.assertEqual(df.iloc[0]['d'], pd.Timedelta('1 day'))
 
+    def test_categorical_text_columns(self):
+        path = self._write('i,s\n1,east\n2,west\n3,east\n4,east\n')
+        try:
+            columns = [
+                sqlalchemy.Column('i', sqlalchemy.Integer),
+                sqlalchemy.Column('s', sqlalchemy.String),
+            ]
+            df = self.conn._get_df_from_csv(path, columns=columns, categorical=True)
+        finally:
+            os.remove(path)
+        self.assertIsInstance(df['s'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(df['s'].cat.categories), ['east', 'west'])
+        self.assertEqual(df['i'].dtype, pd.Int64Dtype())
+
+
+# ---------------------------------------------------------------------------
+# Connection.get_parquet / _get_df_from_parquet
+# ---------------------------------------------------------------------------
+class TestGetDfFromParquet(unittest.TestCase):
+    def setUp(self):
+        self.rpc = make_mock_rpc()
+        self.rpc.analyze.query.download_dataframe.return_value = '/tmp/x.parquet'
+        self.conn = make_connection(rpc=self.rpc)
+
+    def _write(self, arrow_table, fmt='parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        f = tempfile.NamedTemporaryFile(delete=False, suffix='.tmp')
+        f.close()
+        if fmt == 'parquet':
+            pq.write_table(arrow_table, f.name)
+        elif fmt == 'ipc_file':
+            with pa.OSFile(f.name, 'wb') as sink, pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+        else:
+            with pa.OSFile(f.name, 'wb') as sink, pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+        return f.name
+
+    def _typed_table(self):
+        import pyarrow as pa
+        return pa.table({
+            'i': pa.array([3, None], pa.int64()),
+            'b': pa.array([True, None], pa.bool_()),
+            's': pa.array(['hello', None], pa.string()),
+            'n': pa.array([1.5, 2.5], pa.float64()),
+            'dt': pa.array([pd.Timestamp('2024-01-01'), pd.Timestamp('2024-02-02')], pa.timestamp('us')),
+        })
+
+    def _columns(self):
+        return [
+            sqlalchemy.Column('i', sqlalchemy.Integer),
+            sqlalchemy.Column('b', sqlalchemy.Boolean),
+            sqlalchemy.Column('s', sqlalchemy.String),
+            sqlalchemy.Column('n', sqlalchemy.Numeric),
+            sqlalchemy.Column('dt', sqlalchemy.DateTime),
+        ]
+
+    def test_typed_read_matches_csv_conventions(self):
+        for fmt in ('parquet', 'ipc_file', 'ipc_stream'):
+            path = self._write(self._typed_table(), fmt)
+            try:
+                df = self.conn._get_df_from_parquet(path, columns=self._columns())
+            finally:
+                os.remove(path)
+            self.assertEqual(str(df['i'].dtype), 'Int64', fmt)
+            self.assertEqual(df.iloc[0]['i'], 3)
+            self.assertTrue(pd.isna(df.iloc[1]['i']))
+            # Null booleans are False, null strings are '', as with the CSV reader.
+            self.assertEqual(df['b'].dtype, np.dtype('bool'))
+            self.assertFalse(df.iloc[1]['b'])
+            self.assertEqual(df.iloc[1]['s'], '')
+            self.assertEqual(df.iloc[1]['n'], 2.5)
+            self.assertEqual(df.iloc[0]['dt'], pd.Timestamp('2024-01-01'))
+
+    def test_blind_read_when_no_columns(self):
+        path = self._write(self._typed_table())
+        try:
+            df = self.conn._get_df_from_parquet(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(list(df.columns), ['i', 'b', 's', 'n', 'dt'])
+        self.assertEqual(len(df), 2)
+
+    def test_get_parquet_unclean_path(self):
+        tbl = sqlalchemy.Table('tab', sqlalchemy.MetaData(), sqlalchemy.Column('a', sqlalchemy.Integer), schema='anlz_schema')
+        self.assertEqual(self.conn.get_parquet(tbl), '/tmp/x.parquet')
+        kwargs = self.rpc.analyze.query.download_dataframe.call_args.kwargs
+        self.assertIn('table_name', kwargs)
+        self.rpc.analyze.query.download_csv.assert_not_called()
+
+    def test_get_parquet_clean_uses_query(self):
+        tbl = sqlalchemy.Table('tab', sqlalchemy.MetaData(), sqlalchemy.Column('b', sqlalchemy.String), schema='anlz_schema')
+        self.conn.get_parquet(tbl, clean=True)
+        kwargs = self.rpc.analyze.query.download_dataframe.call_args.kwargs
+        self.assertIn('replace', kwargs['query'].lower())
+
+    def test_get_parquet_by_query_str(self):
+        self.conn.get_parquet_by_query('SELECT 1', params={'p': 1})
+        kwargs = self.rpc.analyze.query.download_dataframe.call_args.kwargs
+        self.assertEqual(kwargs['query'], 'SELECT 1')
+        self.assertEqual(kwargs['params'], {'p': 1})
+
+    def test_get_dataframe_columnar_deletes_temp_file(self):
+        path = self._write(self._typed_table())
+        tbl = MagicMock()
+        tbl.columns = self._columns()
+        with patch.object(self.conn, 'get_parquet', return_value=path) as gp, \
+             patch.object(self.conn, 'get_csv') as gc:
+            df = self.conn.get_dataframe(tbl, columnar=True)
+        gp.assert_called_once_with(tbl, clean=True)
+        gc.assert_not_called()
+        self.assertEqual(df.iloc[0]['s'], 'hello')
+        self.assertFalse(os.path.exists(path))
+
+    def test_get_dataframe_by_query_columnar(self):
+        path = self._write(self._typed_table())
+        tbl = sqlalchemy.Table('tab', sqlalchemy.MetaData(), *self._columns(), schema='anlz_schema')
+        sa_q = sqlalchemy.select(tbl)
+        with patch.object(self.conn, 'get_parquet_by_query', return_value=path):
+            df = self.conn.get_dataframe_by_query(sa_q, columnar=True)
+        self.assertEqual(df.iloc[1]['s'], '')
+        self.assertFalse(os.path.exists(path))
+
+
+# ---------------------------------------------------------------------------
+# Connection.iter_dataframes
+# ---------------------------------------------------------------------------
+class TestIterDataframes(unittest.TestCase):
+    def setUp(self):
+        self.conn = make_connection()
+        self.tbl = sqlalchemy.Table(
+            'tab', sqlalchemy.MetaData(),
+            sqlalchemy.Column('i', sqlalchemy.Integer),
+            sqlalchemy.Column('s', sqlalchemy.String),
+            schema='anlz_schema',
+        )
+        self.sa_q = sqlalchemy.select(self.tbl)
+
+    def _write_csv(self, n):
+        f = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv')
+        f.write('i,s\n')
+        for i in range(n):
+            f.write(f'{i},{"" if i % 2 else "v" + str(i)}\n')
+        f.close()
+        return f.name
+
+    def _write_parquet(self, n):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        f = tempfile.NamedTemporaryFile(delete=False, suffix='.parquet')
+        f.close()
+        pq.write_table(
+            pa.table({'i': list(range(n)), 's': [None if i % 2 else f'v{i}' for i in range(n)]}),
+            f.name, row_group_size=3,
+        )
+        return f.name
+
+    def test_csv_chunks_by_rows(self):
+        path = self._write_csv(10)
+        with patch.object(self.conn, 'get_csv_by_query', return_value=path):
+            chunks = list(self.conn.iter_dataframes(self.sa_q, chunk_rows=4))
+        self.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        df = pd.concat(chunks)
+        self.assertEqual(list(df.index), list(range(10)))
+        self.assertEqual(str(df['i'].dtype), 'Int64')
+        self.assertEqual(df.loc[1, 's'], '')
+        self.assertFalse(os.path.exists(path))
+
+    def test_parquet_chunks_span_row_groups(self):
+        path = self._write_parquet(10)
+        with patch.object(self.conn, 'get_parquet_by_query', return_value=path):
+            chunks = list(self.conn.iter_dataframes(self.sa_q, chunk_rows=4, columnar=True))
+        self.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        df = pd.concat(chunks)
+        self.assertEqual(list(df.index), list(range(10)))
+        self.assertEqual(list(df['i']), list(range(10)))
+        self.assertEqual(df.loc[1, 's'], '')
+        self.assertFalse(os.path.exists(path))
+
+    def test_chunk_bytes_bounds_chunk_size(self):
+        path = self._write_parquet(100)
+        with patch.object(self.conn, 'get_parquet_by_query', return_value=path):
+            chunks = list(self.conn.iter_dataframes(self.sa_q, chunk_bytes=200, columnar=True))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(len(c) for c in chunks), 100)
+
+    def test_chunk_bytes_with_wider_later_batch(self):
+        # A wider batch shrinks the chunk below the rows already pending from a narrower one.
+        import pyarrow as pa
+        schema = pa.schema([('i', pa.int64()), ('s', pa.string())])
+        narrow = pa.record_batch([pa.array(range(500)), pa.array([''] * 500)], schema=schema)
+        wide = pa.record_batch(
+            [pa.array(range(500, 1500)), pa.array(['x' * 500] * 1000)], schema=schema,
+        )
+        f = tempfile.NamedTemporaryFile(delete=False, suffix='.arrow')
+        f.close()
+        with pa.ipc.new_file(f.name, schema) as writer:
+            writer.write_batch(narrow)
+            writer.write_batch(wide)
+        with patch.object(self.conn, 'get_parquet_by_query', return_value=f.name):
+            chunks = list(self.conn.iter_dataframes(self.sa_q, chunk_bytes=100000, columnar=True))
+        self.assertTrue(all(len(c) for c in chunks))
+        df = pd.concat(chunks)
+        self.assertEqual(list(df.index), list(range(1500)))
+        self.assertEqual(list(df['i']), list(range(1500)))
+
+    def test_temp_file_removed_when_closed_early(self):
+        path = self._write_csv(10)
+        with patch.object(self.conn, 'get_csv_by_query', return_value=path):
+            gen = self.conn.iter_dataframes(self.sa_q, chunk_rows=2)
+            next(gen)
+            gen.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_invalid_chunk_rows_raises(self):
+        with self.assertRaises(ValueError):
+            list(self.conn.iter_dataframes(self.sa_q, chunk_rows=0))
+
 
 # ---------------------------------------------------------------------------
 # Connection.get_data / get_dataframe variants
@@ -668,6 +1000,15 @@ class TestGetData(unittest.TestCase):
         self.assertEqual(rows, [{'x': 1}])
         ms.assert_called_once_with('/tmp/zzz.csv', tbl.columns, True)
 
+    def test_get_iterator_batch_rows_uses_batched_stream(self):
+        tbl = MagicMock()
+        tbl.columns = [sqlalchemy.Column('x', sqlalchemy.Integer)]
+        with patch.object(self.conn, 'get_csv', return_value='/tmp/zzz.csv'), \
+             patch.object(self.conn, '_csv_stream_batched', return_value=iter([{'x': 1}])) as ms:
+            rows = list(self.conn.get_iterator(tbl, batch_rows=500))
+        self.assertEqual(rows, [{'x': 1}])
+        ms.assert_called_once_with('/tmp/zzz.csv', tbl.columns, True, 500)
+
     def test_get_iterator_by_query(self):
         sa_q = sqlalchemy.select(sqlalchemy.literal(1).label('x'))
         with patch.object(self.conn, 'get_csv_by_query', return_value='/tmp/q.csv'), \
@@ -972,7 +1313,10 @@ class TestTable(unittest.TestCase):
         self.assertIn(tbl.schema, result)
 
     def test_cols_calls_table_meta(self):
-        tbl = Table(self.conn, 'some_table')
+        # With the metadata cache off, every cols() is a fresh RPC.
+        with patch.object(query, 'Dimensions'):
+            conn = Connection(rpc=self.rpc, metadata_ttl=0)
+        tbl = Table(conn, 'some_table')
         # Reset mocks to count subsequent calls only.
         self.rpc.analyze.table.table_meta.reset_mock()
         self.rpc.analyze.table.table_meta.return_value = [{'id': 'x'}]
@@ -982,6 +1326,48 @@ class TestTable(unittest.TestCase):
             project_id=tbl.project_id, table_id=tbl.id,
         )
 
+    def test_cols_served_from_metadata_cache(self):
+        tbl = Table(self.conn, 'some_table')
+        Table(self.conn, 'some_table')
+        self.assertEqual(self.rpc.analyze.table.search_by_name.call_count, 1)
+        self.assertEqual(self.rpc.analyze.table.table_meta.call_count, 1)
+        # Callers get their own copy to modify.
+        tbl.cols()[0]['id'] = 'changed'
+        self.assertEqual(tbl.cols(), [{'id': 'col1', 'dtype': 'numeric'}])
+        self.assertEqual(self.rpc.analyze.table.table_meta.call_count, 1)
+
+    def test_metadata_cache_expires(self):
+        tbl = Table(self.conn, 'some_table')
+        with patch.object(query.time, 'monotonic', return_value=time.monotonic() + query._METADATA_TTL + 1):
+            tbl.cols()
+            Table(self.conn, 'some_table')
+        # cols() refetched the stale entry; the second Table reuses that refresh.
+        self.assertEqual(self.rpc.analyze.table.table_meta.call_count, 2)
+        self.assertEqual(self.rpc.analyze.table.search_by_name.call_count, 2)
+
+    def test_metadata_cache_invalidated_by_writes(self):
+        tbl = Table(self.conn, 'some_table')
+        for change in (
+            lambda: self.conn.truncate(tbl),
+            lambda: self.conn.drop(tbl),
+            lambda: Table(self.conn, 'some_table', columns=[{'id': 'c', 'dtype': 'numeric'}]),
+        ):
+            self.rpc.analyze.table.table_meta.reset_mock()
+            change()
+            tbl.cols()
+            self.assertGreaterEqual(self.rpc.analyze.table.table_meta.call_count, 1)
+        # Dropping the table forgets its name, too.
+        self.rpc.analyze.table.search_by_name.reset_mock()
+        self.conn.drop(tbl)
+        Table(self.conn, 'some_table')
+        self.rpc.analyze.table.search_by_name.assert_called_once()
+
+    def test_missing_table_name_not_cached(self):
+        self.rpc.analyze.table.search_by_name.return_value = []
+        self.assertIsNone(self.conn._resolve_table_id('gone', raise_if_not_found=False)[0])
+        self.rpc.analyze.table.search_by_name.return_value = [{'id': 'analyzetable_new', 'paths': ['/']}]
+        self.assertEqual(self.conn._resolve_table_id('gone')[0], 'analyzetable_new')
+
     def test_table_info_calls_analyze_table(self):
         tbl = Table(self.conn, 'some_table')
         self.rpc.analyze.table.return_value = {'k': 'v'}
@@ -1040,6 +1426,38 @@ class TestGetTable(unittest.TestCase):
         self.assertEqual(tbl.id, 'analyzetable_t')
 
 
+    def test_get_tables_keeps_order_and_dedupes(self):
+        rpc = make_mock_rpc(table_meta=[{'id': 'a', 'dtype': 'text'}])
+        rpc.analyze.table.search_by_name.side_effect = (
+            lambda project_id, text, criteria, keys: [{'id': f'analyzetable_{text}', 'paths': ['/']}]
+        )
+        conn = make_connection(rpc=rpc)
+        names = ['t3', 't1', 't2', 't1', TABLE_PREFIX + 'raw']
+        tables = conn.get_tables(names, max_workers=4)
+        self.assertEqual(
+            [t.id for t in tables],
+            ['analyzetable_t3', 'analyzetable_t1', 'analyzetable_t2', 'analyzetable_t1', TABLE_PREFIX + 'raw'],
+        )
+        self.assertIs(tables[1], tables[3])
+        # One search per distinct name; the raw id needs none.
+        self.assertEqual(rpc.analyze.table.search_by_name.call_count, 3)
+        self.assertEqual(rpc.analyze.table.table_meta.call_count, 4)
+
+    def test_load_udf_params_resolves_tables_together(self):
+        rpc = make_mock_rpc(step_id='step-123', workflow_id=None)
+        rpc.analyze.project.variable_values.return_value = {}
+        rpc.analyze.step.step.return_value = {
+            'sources': [{'source': 's1', 'id': 'a'}, {'source': 's2', 'id': 'b'}],
+            'targets': [{'target': 't1', 'id': 'c'}],
+            'variables': [],
+        }
+        conn = make_connection(rpc=rpc)
+        with patch.object(conn, 'get_tables', side_effect=lambda names: [f'table:{n}' for n in names]) as gt:
+            udf = conn.udf
+        gt.assert_called_once_with(['s1', 's2', 't1'])
+        self.assertEqual(udf.sources, ['table:s1', 'table:s2'])
+        self.assertEqual(udf.target_by_name, {'c': 'table:t1'})
+
 # ---------------------------------------------------------------------------
 # Connection._upload (mocked HTTP)
 # ---------------------------------------------------------------------------
@@ -1083,6 +1501,53 @@ class TestUpload(unittest.TestCase):
         )
 
 
+    def test_upload_reuses_given_session(self):
+        conn = make_connection()
+        session = MagicMock()
+        session.post.return_value.json.return_value = {'status': 'ok'}
+        with patch.object(query.requests.sessions, 'Session') as mock_session_cls:
+            result = conn._upload('tab-1', 'parquet', 'p', ('part-00000.parquet', b''), session=session)
+        mock_session_cls.assert_not_called()
+        self.assertEqual(result, {'status': 'ok'})
+        self.assertEqual(session.post.call_args.kwargs['files'], {'upload_file': ('part-00000.parquet', b'')})
+
+    def test_upload_session_shared_across_calls(self):
+        conn = make_connection()
+        with patch.object(query.requests.sessions, 'Session') as mock_session_cls:
+            session = MagicMock()
+            session.headers = {}
+            session.post.return_value.json.return_value = {}
+            mock_session_cls.return_value = session
+            conn._upload('tab-1', 'parquet', 'p', b'1')
+            conn._upload('tab-2', 'parquet', 'p', b'2')
+            mock_session_cls.assert_called_once()
+            self.assertEqual(session.post.call_count, 2)
+            self.assertEqual(session.headers['Connection'], 'keep-alive')
+            conn.close()
+            session.close.assert_called_once()
+            conn._upload('tab-3', 'parquet', 'p', b'3')
+            self.assertEqual(mock_session_cls.call_count, 2)
+
+    def test_upload_gzip_compresses_body(self):
+        import gzip
+        rpc = make_mock_rpc()
+        with patch.object(query, 'Dimensions'):
+            conn = Connection(rpc=rpc, upload_compression='gzip')
+        session = query.requests.Session()
+        with patch.object(session, 'send') as send:
+            send.return_value.json.return_value = {'status': 'ok'}
+            result = conn._upload('tab-1', 'parquet', 'p', ('part.parquet', b'payload' * 100), session=session)
+        self.assertEqual(result, {'status': 'ok'})
+        request = send.call_args.args[0]
+        self.assertEqual(request.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(int(request.headers['Content-Length']), len(request.body))
+        self.assertIn(b'payload' * 100, gzip.decompress(request.body))
+        self.assertIn('table_id=tab-1', request.url)
+
+    def test_unknown_compression_raises(self):
+        with patch.object(query, 'Dimensions'), self.assertRaises(ValueError):
+            Connection(rpc=make_mock_rpc(), upload_compression='brotli')
+
 # ---------------------------------------------------------------------------
 # Connection.bulk_insert_dataframe
 # ---------------------------------------------------------------------------
@@ -1145,3 +1610,93 @@ class TestBulkInsertDataframe(unittest.TestCase):
         self.assertEqual(kwargs['project_id'], self.conn._project_id)
         self.assertEqual(kwargs['table_id'], self.tbl.id)
         self.assertFalse(kwargs['append'])
+
+    def _capture_parts(self):
+        parts = {}
+
+        def upload(table_id, load_type, upload_path, pfile, session=None):
+            name, fileobj = pfile
+            parts[name] = pd.read_parquet(fileobj)
+
+        return parts, upload
+
+    def test_parquet_parts_uploaded_to_one_load(self):
+        df = pd.DataFrame({'a': [float(i) for i in range(10)], 'b': [None] * 5 + ['x'] * 5})
+        self.rpc.analyze.table.create_data_load.return_value = {
+            'load_type': 'parquet',
+            'upload_path': 'somewhere',
+        }
+        parts, upload = self._capture_parts()
+        with patch.object(self.conn, '_upload', side_effect=upload) as up:
+            self.conn.bulk_insert_dataframe(self.tbl, df, part_rows=4, max_workers=3)
+        self.assertEqual(up.call_count, 3)
+        self.assertEqual(sorted(parts), ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet'])
+        # All parts share one schema, even the one whose 'b' is all null.
+        self.assertEqual(len({str(p.dtypes.to_dict()) for p in parts.values()}), 1)
+        result = pd.concat([parts[name] for name in sorted(parts)], ignore_index=True)
+        pd.testing.assert_frame_equal(result, df)
+        # All parts go to the same data load, which is executed once.
+        self.assertEqual({c.args[2] for c in up.call_args_list}, {'somewhere'})
+        self.rpc.analyze.table.execute_data_load.assert_called_once()
+
+    def test_failed_part_skips_execute(self):
+        df = pd.DataFrame({'a': [1.0, 2.0, 3.0], 'b': ['x', 'y', 'z']})
+        self.rpc.analyze.table.create_data_load.return_value = {
+            'load_type': 'parquet',
+            'upload_path': 'somewhere',
+        }
+        with patch.object(self.conn, '_upload', side_effect=IOError('boom')):
+            with self.assertRaises(IOError):
+                self.conn.bulk_insert_dataframe(self.tbl, df, part_rows=1)
+        self.rpc.analyze.table.execute_data_load.assert_not_called()
+
+    def test_parquet_part_spills_past_threshold(self):
+        df = pd.DataFrame({'a': [float(i) for i in range(1000)], 'b': ['x' * 20] * 1000})
+        self.rpc.analyze.table.create_data_load.return_value = {
+            'load_type': 'parquet',
+            'upload_path': 'somewhere',
+        }
+        rolled = []
+
+        def upload(table_id, load_type, upload_path, pfile, session=None):
+            rolled.append(pfile[1]._rolled)
+            pd.testing.assert_frame_equal(pd.read_parquet(pfile[1]), df)
+
+        for spill_bytes, expected in ((None, False), (10 ** 9, False), (100, True), (0, True)):
+            rolled.clear()
+            with patch.object(self.conn, '_upload', side_effect=upload):
+                self.conn.bulk_insert_dataframe(self.tbl, df.copy(), spill_bytes=spill_bytes)
+            self.assertEqual(rolled, [expected], spill_bytes)
+
+    def test_mixed_columns_all_reported(self):
+        df = pd.DataFrame({
+            'a': [1.0, 2.0],
+            'b': ['x', 1],
+            'c': [1, 'y'],
+            'd': ['ok', 'fine'],
+        })
+        self.rpc.analyze.table.create_data_load.return_value = {
+            'load_type': 'parquet',
+            'upload_path': 'somewhere',
+        }
+        with patch.object(self.conn, '_upload') as up:
+            with self.assertRaisesRegex(Exception, r"Mixed data in column\(s\) \['b', 'c'\]"):
+                self.conn.bulk_insert_dataframe(self.tbl, df)
+        up.assert_not_called()
+
+    def test_nested_columns_uploaded_as_text(self):
+        df = pd.DataFrame({
+            'a': [1.0, 2.0],
+            'b': [[1, 2], None],
+            'c': [{'k': 1}, {'k': 2}],
+        })
+        self.rpc.analyze.table.create_data_load.return_value = {
+            'load_type': 'parquet',
+            'upload_path': 'somewhere',
+        }
+        parts, upload = self._capture_parts()
+        with patch.object(self.conn, '_upload', side_effect=upload):
+            self.conn.bulk_insert_dataframe(self.tbl, df)
+        (result,) = parts.values()
+        self.assertEqual(result['b'].tolist(), ['[1, 2]', 'None'])
+        self.assertEqual(result['c'].tolist(), ["{'k': 1}", "{'k': 2}"])
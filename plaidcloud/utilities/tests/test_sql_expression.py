@@ -26,7 +26,6 @@ __email__ = "adams.tower@tartansolutions.com"
 compiled = functools.partial(_compiled, dialect='postgresql')
 
 
-#TODO: test allocate
 class TestSQLExpression(unittest.TestCase):
     def assertEquivalent(self, left, right):
         """Asserts that two sqlalchemy expressions resolve to the same SQL code"""
@@ -2677,5 +2676,56 @@ class TestApplyRules(TestSQLExpression):
         self.assertNotIn('WHEN  THEN', sql)
 
 
+class TestAllocate(TestSQLExpression):
+    """Runs the allocation queries against an in-memory SQLite database"""
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        metadata = sqlalchemy.MetaData()
+        source = sqlalchemy.Table(
+            'source', metadata,
+            sqlalchemy.Column('DEPT', sqlalchemy.Text), sqlalchemy.Column('AMOUNT', sqlalchemy.Float),
+        )
+        driver = sqlalchemy.Table(
+            'driver', metadata,
+            sqlalchemy.Column('DEPT', sqlalchemy.Text), sqlalchemy.Column('CC', sqlalchemy.Text),
+            sqlalchemy.Column('HEADCOUNT', sqlalchemy.Float),
+        )
+        metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(source.insert(), [
+                {'DEPT': 'D1', 'AMOUNT': 100.0}, {'DEPT': 'D1', 'AMOUNT': -50.0}, {'DEPT': 'D2', 'AMOUNT': 30.0},
+            ])
+            conn.execute(driver.insert(), [
+                {'DEPT': 'D1', 'CC': 'C1', 'HEADCOUNT': 3.0}, {'DEPT': 'D1', 'CC': 'C2', 'HEADCOUNT': 1.0},
+                {'DEPT': 'D1', 'CC': 'C3', 'HEADCOUNT': -2.0}, {'DEPT': 'D2', 'CC': 'C1', 'HEADCOUNT': -4.0},
+            ])
+        self.source_query = sqlalchemy.select(source.c.DEPT, source.c.AMOUNT, sqlalchemy.literal('').label('CC'))
+        self.driver_query = sqlalchemy.select(driver)
+
+    def allocate(self, **kwargs):
+        query = se.allocate(self.source_query, self.driver_query, ['AMOUNT'], ['CC'], ['DEPT'], 'HEADCOUNT', **kwargs)
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).mappings().all()
+        return sorted((row['DEPT'], row['CC'], float(row['AMOUNT'])) for row in rows)
+
+    def test_allocate(self):
+        self.assertEqual(self.allocate(), [
+            ('D1', 'C1', -75.0), ('D1', 'C1', 150.0), ('D1', 'C2', -25.0), ('D1', 'C2', 50.0),
+            ('D1', 'C3', -100.0), ('D1', 'C3', 50.0), ('D2', 'C1', 30.0),
+        ])
+
+    def test_split_signs(self):
+        self.assertEqual(self.allocate(split_signs=True), [
+            ('D1', 'C1', 75.0), ('D1', 'C2', 25.0), ('D1', 'C3', -50.0), ('D2', 'C1', 30.0),
+        ])
+
+    def test_split_signs_default_sql_unchanged(self):
+        sql, _ = compiled(
+            se.allocate(self.source_query, self.driver_query, ['AMOUNT'], ['CC'], ['DEPT'], 'HEADCOUNT')
+        )
+        self.assertNotIn('alloc_sign', sql)
+
+
 if __name__ == '__main__':
     unittest.main()